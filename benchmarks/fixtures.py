@@ -0,0 +1,182 @@
+import os
+import json
+import random
+from datetime import datetime, timedelta
+from services.gazetteer import CITIES, find_cities
+
+# Recorded upstream payloads dropped here as <name>.json are replayed instead of the
+# generated ones: flight_offers.json, location.json, forecast.json, chat_completion.json
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+CARRIERS = ["AF", "BA", "LH", "KL", "DL", "UA", "AA", "IB", "AZ", "LX", "TK", "EK"]
+HUBS = ["CDG", "LHR", "FRA", "AMS", "MAD", "FCO", "ZRH", "IST", "DXB", "JFK", "ATL", "ORD"]
+CONDITIONS = ["clear sky", "few clouds", "scattered clouds", "broken clouds", "light rain", "moderate rain"]
+CITIES_BY_CODE = {city.code: city for city, _ in CITIES}
+
+# A recorded payload by name, or None when none was recorded
+def load_recorded(name):
+    path = os.path.join(FIXTURES_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as recorded:
+        return json.load(recorded)
+
+def _duration(minutes):
+    return f"PT{minutes // 60}H{minutes % 60}M"
+
+def _itinerary(rng, origin, destination, departure_date, stops):
+    airports = [origin] + rng.sample([hub for hub in HUBS if hub not in (origin, destination)], stops) + [destination]
+    departure = datetime.strptime(departure_date, "%Y-%m-%d") + timedelta(hours=rng.randint(6, 20))
+    started = departure
+    segments = []
+    for index, (start, end) in enumerate(zip(airports, airports[1:])):
+        minutes = rng.randint(60, 600)
+        arrival = departure + timedelta(minutes=minutes)
+        carrier = rng.choice(CARRIERS)
+        segments.append({
+            "departure": {"iataCode": start, "terminal": str(rng.randint(1, 3)), "at": departure.isoformat()},
+            "arrival": {"iataCode": end, "terminal": str(rng.randint(1, 3)), "at": arrival.isoformat()},
+            "carrierCode": carrier,
+            "number": str(rng.randint(1, 9999)),
+            "aircraft": {"code": rng.choice(["320", "321", "333", "359", "388", "77W", "789"])},
+            "operating": {"carrierCode": carrier},
+            "duration": _duration(minutes),
+            "id": str(index + 1),
+            "numberOfStops": 0,
+            "blacklistedInEU": False
+        })
+        departure = arrival + timedelta(minutes=rng.randint(45, 300))
+    return {"duration": _duration(int((arrival - started).total_seconds() // 60)), "segments": segments}
+
+# Flight-offers search response in the Amadeus shape, deterministic per route and dates
+def flight_offers(origin, destination, departure_date, return_date=None, count=50):
+    recorded = load_recorded("flight_offers")
+    if recorded is not None:
+        return recorded
+
+    rng = random.Random(f"{origin}{destination}{departure_date}{return_date}")
+    offers = []
+    for offer_id in range(1, count + 1):
+        itineraries = [_itinerary(rng, origin, destination, departure_date, rng.choice([0, 1, 1, 2]))]
+        if return_date:
+            itineraries.append(_itinerary(rng, destination, origin, return_date, rng.choice([0, 1, 1, 2])))
+        total = f"{rng.uniform(150, 2500):.2f}"
+        segment_ids = [segment["id"] for itinerary in itineraries for segment in itinerary["segments"]]
+        offers.append({
+            "type": "flight-offer",
+            "id": str(offer_id),
+            "source": "GDS",
+            "instantTicketingRequired": False,
+            "nonHomogeneous": False,
+            "oneWay": return_date is None,
+            "lastTicketingDate": departure_date,
+            "numberOfBookableSeats": rng.randint(1, 9),
+            "itineraries": itineraries,
+            "price": {
+                "currency": "EUR",
+                "total": total,
+                "base": f"{float(total) * 0.8:.2f}",
+                "fees": [{"amount": "0.00", "type": "SUPPLIER"}, {"amount": "0.00", "type": "TICKETING"}],
+                "grandTotal": total
+            },
+            "pricingOptions": {"fareType": ["PUBLISHED"], "includedCheckedBagsOnly": True},
+            "validatingAirlineCodes": [itineraries[0]["segments"][0]["carrierCode"]],
+            "travelerPricings": [{
+                "travelerId": "1",
+                "fareOption": "STANDARD",
+                "travelerType": "ADULT",
+                "price": {"currency": "EUR", "total": total, "base": f"{float(total) * 0.8:.2f}"},
+                "fareDetailsBySegment": [{
+                    "segmentId": segment_id,
+                    "cabin": "ECONOMY",
+                    "fareBasis": "KL0RLGT",
+                    "class": "K",
+                    "includedCheckedBags": {"quantity": 1}
+                } for segment_id in segment_ids]
+            }]
+        })
+    return {"meta": {"count": len(offers)}, "data": offers}
+
+# Location search response in the Amadeus shape for a city name or IATA code
+def location(keyword):
+    recorded = load_recorded("location")
+    if recorded is not None:
+        return recorded
+
+    city = CITIES_BY_CODE.get(keyword.upper())
+    if city is None:
+        found = find_cities(keyword)
+        city = found[0][0] if found else None
+    name, code, country = (city.name, city.code, city.country) if city else (keyword.title(), keyword.upper()[:3], "XX")
+    return {"meta": {"count": 1}, "data": [{
+        "type": "location",
+        "subType": "CITY",
+        "name": name.upper(),
+        "iataCode": code,
+        "address": {"cityName": name.upper(), "countryCode": country}
+    }]}
+
+# 5-day/3-hour forecast response in the OpenWeather shape, starting on start_date
+def forecast(city, start_date, days=5):
+    recorded = load_recorded("forecast")
+    if recorded is not None:
+        return recorded
+
+    rng = random.Random(city)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    entries = []
+    for step in range(days * 8):
+        moment = start + timedelta(hours=3 * step)
+        temp = rng.uniform(-5, 30)
+        entry = {
+            "dt": int(moment.timestamp()),
+            "main": {"temp": temp, "feels_like": temp - 1, "temp_min": temp - 2, "temp_max": temp + 2,
+                     "pressure": 1013, "humidity": rng.randint(30, 90)},
+            "weather": [{"id": 800, "main": "Clouds", "description": rng.choice(CONDITIONS), "icon": "03d"}],
+            "clouds": {"all": rng.randint(0, 100)},
+            "wind": {"speed": rng.uniform(0, 10), "deg": rng.randint(0, 359)},
+            "dt_txt": moment.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if "rain" in entry["weather"][0]["description"]:
+            entry["rain"] = {"3h": rng.uniform(0.1, 5)}
+        entries.append(entry)
+    return {"cod": "200", "message": 0, "cnt": len(entries), "list": entries, "city": {"name": city}}
+
+# Trip dates the stubbed ChatGPT extraction returns: a week, starting a month from today
+def trip_dates(today=None):
+    start = (today or datetime.now()) + timedelta(days=30)
+    return start.strftime("%Y-%m-%d"), (start + timedelta(days=7)).strftime("%Y-%m-%d")
+
+# Chat completion response in the OpenAI shape, extracting the cities named in the prompt
+def chat_completion(prompt):
+    recorded = load_recorded("chat_completion")
+    if recorded is not None:
+        return recorded
+
+    context = prompt.split("CONTEXT:", 1)[-1].split("Return response", 1)[0]
+    cities = [city for city, _, _ in find_cities(context)] or [CITIES_BY_CODE["NYC"], CITIES_BY_CODE["PAR"]]
+    origin, destination = cities[0], cities[-1]
+    start_date, end_date = trip_dates()
+
+    def place(city):
+        return {"name": city.name, "city": True, "code": city.code, "nearest": {"name": city.name, "code": city.code}}
+
+    extraction = {
+        "destination": place(destination),
+        "origin": place(origin),
+        "start_date": start_date,
+        "end_date": end_date,
+        "description": f"Here is your trip plan to {destination.name}."
+    }
+    return {
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion",
+        "created": int(datetime.now().timestamp()),
+        "model": "gpt-4o-mini",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(extraction)},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 120, "total_tokens": len(prompt) // 4 + 120}
+    }
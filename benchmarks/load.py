@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import httpx
+from services import flights, weather
+from services.extraction import extraction_cache, multi_city_cache
+from services.gazetteer import CITIES
+from services.rate_limit import governors
+from services.http import close_async_clients
+from services.openai_helper import reset_openai_client
+from benchmarks.stub_server import StubServer
+
+# Nearest-rank percentile of a list of numbers
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+# Drop every in-memory cache so each run starts cold; the on-disk airport store is kept
+def clear_caches():
+    from complex import plan_cache
+
+    for cache in (plan_cache, extraction_cache, multi_city_cache, flights.flight_cache, flights.iata_code_cache,
+                  getattr(flights.airport_cache, "memory", flights.airport_cache), weather.forecast_cache):
+        cache.clear()
+
+# Point the Amadeus, OpenWeather and OpenAI clients at the stub server for the duration, with
+# placeholder credentials, lifting the upstream rate limits unless asked to respect them
+@contextmanager
+def stubbed_services(stub, respect_rate_limits=False):
+    stub_environment = {
+        "OPENAI_BASE_URL": f"{stub.url}/v1",
+        "OPENAI_API_KEY": "benchmark",
+        "OPENWEATHER_API_KEY": "benchmark",
+    }
+    saved_environment = {key: os.environ.get(key) for key in stub_environment}
+    saved_weather_url = weather.OPENWEATHER_API_URL
+    manager = flights.amadeus_clients
+    saved_credentials = (manager.client_id, manager.client_secret)
+    saved_options = dict(manager.options)
+    saved_limits = {name: (governor.rate, governor.burst, governor.max_in_flight) for name, governor in governors.items()}
+
+    os.environ.update(stub_environment)
+    reset_openai_client()
+    weather.OPENWEATHER_API_URL = f"{stub.url}/data/2.5/forecast"
+    manager.client_id = manager.client_secret = "benchmark"
+    manager.options.update(host=stub.host, port=stub.port, ssl=False)
+    manager.reset()
+    if not respect_rate_limits:
+        for governor in governors.values():
+            governor.rate = governor.burst = governor.tokens = 1e9
+            governor.max_in_flight = 10 ** 6
+    clear_caches()
+    try:
+        yield stub
+    finally:
+        for key, value in saved_environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        reset_openai_client()
+        weather.OPENWEATHER_API_URL = saved_weather_url
+        manager.client_id, manager.client_secret = saved_credentials
+        manager.options.clear()
+        manager.options.update(saved_options)
+        manager.reset()
+        for name, (rate, burst, max_in_flight) in saved_limits.items():
+            governors[name].rate, governors[name].burst, governors[name].max_in_flight = rate, burst, max_in_flight
+            governors[name].tokens = float(burst)
+        clear_caches()
+
+# Free-form trip requests over `unique` distinct city pairs. They carry no dates, so every
+# distinct request goes through the (stubbed) ChatGPT extraction.
+def trip_inputs(count, unique):
+    cities = [city for city, _ in CITIES]
+    inputs = []
+    for index in range(count):
+        key = index % unique
+        origin = cities[key % len(cities)]
+        destination = cities[(key * 7 + 3) % len(cities)]
+        if destination == origin:
+            destination = cities[(key + 1) % len(cities)]
+        inputs.append(f"Plan a getaway from {origin.name} to {destination.name} sometime next month, request {key}")
+    return inputs
+
+# Parse a Server-Timing header into (name, seconds) pairs
+def parse_server_timing(header):
+    spans = []
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = entry.partition(";dur=")
+        if duration:
+            spans.append((name, float(duration) / 1000))
+    return spans
+
+# Send `requests` trip requests to the app, `concurrency` at a time, and report throughput,
+# latency percentiles and per-stage latencies taken from each response's Server-Timing header
+async def run_load(app, requests=100, concurrency=10, unique=20, path="/plan_trip"):
+    latencies = []
+    statuses = Counter()
+    stages = defaultdict(list)
+    in_flight = asyncio.Semaphore(concurrency)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+        async def send(user_input):
+            async with in_flight:
+                started = time.perf_counter()
+                response = await client.post(path, json={"user_input": user_input}, headers={"X-Trace": "1"})
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+                for name, duration in parse_server_timing(response.headers.get("Server-Timing", "")):
+                    stages[name].append(duration)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(user_input) for user_input in trip_inputs(requests, unique)))
+        elapsed = time.perf_counter() - started
+    await close_async_clients()
+
+    def summary(values):
+        return {
+            "count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values) * 1000,
+        }
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "statuses": dict(statuses),
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "latency": summary(latencies),
+        "stages": {name: summary(values) for name, values in sorted(stages.items())},
+    }
+
+def print_report(report, stub_requests=None):
+    latency = report["latency"]
+    print(f"{report['requests']} requests at concurrency {report['concurrency']} in {report['elapsed_s']:.2f}s "
+          f"({report['throughput_rps']:.1f} req/s), statuses {report['statuses']}")
+    if stub_requests is not None:
+        print(f"{stub_requests} upstream requests")
+    print(f"latency p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+          f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms")
+    print(f"{'span':<40}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stage in report["stages"].items():
+        print(f"{name:<40}{stage['count']:>8}{stage['p50_ms']:>10.1f}{stage['p95_ms']:>10.1f}{stage['p99_ms']:>10.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the trip planner against stubbed upstream APIs.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--unique", type=int, default=50, help="distinct trip requests in the mix")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub latency per upstream call, seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="uniform jitter around the latency, seconds")
+    parser.add_argument("--offers", type=int, default=50, help="flight offers per search response")
+    parser.add_argument("--respect-rate-limits", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # Keep benchmark runs away from the shared on-disk airport cache
+    os.environ["TRIP_PLANNER_CACHE_DIR"] = tempfile.mkdtemp(prefix="trip-planner-benchmark-")
+    from complex import app
+
+    with StubServer(latency=args.latency, jitter=args.jitter, offers=args.offers) as stub:
+        with stubbed_services(stub, args.respect_rate_limits):
+            report = asyncio.run(run_load(app, args.requests, args.concurrency, args.unique))
+        if args.json:
+            json.dump(dict(report, upstream_requests=stub.requests), sys.stdout, indent=2)
+            print()
+        else:
+            print_report(report, stub.requests)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import timeit
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from services import flights
+from services.flights import find_flight_with_smallest_segments, format_flight_offer
+from services.offers import parse_offers
+from services.ranking import best_offer
+from services.weather import aggregate_daily, build_forecast, format_daily_weather
+from benchmarks import fixtures
+
+# Time func over `repeat` rounds of `number` calls each; report per-call best and median
+def measure(func, repeat=5, number=None):
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    rounds = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {"calls": number * repeat, "best_ms": min(rounds) * 1000, "median_ms": statistics.median(rounds) * 1000}
+
+# Micro-benchmarks of the CPU-bound parts of planning on large payloads: picking and
+# formatting flight offers, and aggregating forecasts into daily weather
+def run_micro(offers=250, cities=100, forecast_days=5, repeat=5, number=None):
+    departure = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    arrival = (datetime.now() + timedelta(days=37)).strftime("%Y-%m-%d")
+    raw_offers = fixtures.flight_offers("NYC", "PAR", departure, arrival, count=offers)["data"]
+    payload = json.dumps(raw_offers)
+    compact_offers = parse_offers(raw_offers)
+
+    # Formatting resolves airport cities; serve them from memory so only formatting is timed
+    for offer in compact_offers:
+        for itinerary in offer.itineraries:
+            for segment in itinerary.segments:
+                for code in (segment.departure_iata, segment.arrival_iata):
+                    location = fixtures.location(code)["data"][0]["address"]
+                    flights.airport_cache.memory.set(code, [location["cityName"], location["countryCode"]])
+    best = best_offer(compact_offers)
+
+    forecast_entries = [
+        fixtures.forecast(f"City {index}", departure, days=forecast_days)["list"] for index in range(cities)
+    ]
+    forecasts = [build_forecast(entries) for entries in forecast_entries]
+    start = datetime.strptime(departure, "%Y-%m-%d")
+    end = start + timedelta(days=forecast_days)
+
+    results = {
+        "parse_offers": measure(lambda: parse_offers(json.loads(payload)), repeat, number),
+        "find_flight_with_smallest_segments (raw)": measure(
+            lambda: find_flight_with_smallest_segments(raw_offers), repeat, number
+        ),
+        "find_flight_with_smallest_segments (compact)": measure(
+            lambda: find_flight_with_smallest_segments(compact_offers), repeat, number
+        ),
+        "best_offer": measure(lambda: best_offer(compact_offers), repeat, number),
+        "format_flight_offer": measure(lambda: format_flight_offer(best.directions()), repeat, number),
+        "build_forecast": measure(lambda: [build_forecast(entries) for entries in forecast_entries], repeat, number),
+        "aggregate_daily": measure(lambda: aggregate_daily(forecasts, start, end), repeat, number),
+        "format_daily_weather": measure(
+            lambda: [format_daily_weather(daily) for daily in aggregate_daily(forecasts, start, end)], repeat, number
+        ),
+    }
+    flights.airport_cache.memory.clear()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of flight and weather processing.")
+    parser.add_argument("--offers", type=int, default=250, help="flight offers in the search payload")
+    parser.add_argument("--cities", type=int, default=100, help="forecasts aggregated at once")
+    parser.add_argument("--forecast-days", type=int, default=5, help="days of 3-hour entries per forecast")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run_micro(args.offers, args.cities, args.forecast_days, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'benchmark':<48}{'calls':>8}{'best ms':>12}{'median ms':>12}")
+    for name, result in results.items():
+        print(f"{name:<48}{result['calls']:>8}{result['best_ms']:>12.3f}{result['median_ms']:>12.3f}")
+
+if __name__ == "__main__":
+    main()
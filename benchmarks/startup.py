@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Heavy SDKs the services load on first use rather than at import
+DEFERRED_MODULES = ("openai", "httpx", "numpy", "amadeus")
+CREDENTIALS = ("AMADEUS_CLIENT_ID", "AMADEUS_CLIENT_SECRET", "OPENWEATHER_API_KEY", "OPENAI_API_KEY")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILE_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}}))
+"""
+
+# Parse `python -X importtime` output into (module, self seconds, cumulative seconds)
+def parse_importtime(output):
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return rows
+
+# Import a module in a fresh interpreter, without API keys unless asked to keep them, and
+# report the import time, the slowest imports and which heavy SDKs stayed unloaded
+def profile_startup(module="complex", top=15, keep_credentials=False):
+    env = dict(os.environ)
+    if not keep_credentials:
+        for key in CREDENTIALS:
+            env.pop(key, None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROFILE_SCRIPT.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr)
+    return {
+        "module": module,
+        "import_seconds": loaded["seconds"],
+        "modules_loaded": len(loaded["modules"]),
+        "deferred": [name for name in DEFERRED_MODULES if name not in loaded["modules"]],
+        "loaded_eagerly": [name for name in DEFERRED_MODULES if name in loaded["modules"]],
+        "slowest_cumulative": sorted(rows, key=lambda row: row[2], reverse=True)[:top],
+        "slowest_self": sorted(rows, key=lambda row: row[1], reverse=True)[:top],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report how long importing the app takes and where the time goes.")
+    parser.add_argument("--module", default="complex")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--keep-credentials", action="store_true", help="import with the current API keys set")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = profile_startup(args.module, args.top, args.keep_credentials)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"import {report['module']}: {report['import_seconds'] * 1000:.1f} ms, {report['modules_loaded']} modules")
+    print(f"deferred: {', '.join(report['deferred']) or '-'}; loaded eagerly: {', '.join(report['loaded_eagerly']) or '-'}")
+    for title, key, column in (("cumulative", "slowest_cumulative", 2), ("self", "slowest_self", 1)):
+        print(f"\nslowest imports ({title}):")
+        for row in report[key]:
+            print(f"{row[column] * 1000:>10.1f} ms  {row[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import json
+import time
+import fnmatch
+import random
+import threading
+import socketserver
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks import fixtures
+from services.cache import REDIS_COMPARE_AND_DELETE
+
+# Serialized payloads are memoized so the stub's own CPU time stays out of the measurements
+@lru_cache(maxsize=4096)
+def _flight_offers(origin, destination, departure_date, return_date, count):
+    return json.dumps(fixtures.flight_offers(origin, destination, departure_date, return_date, count)).encode()
+
+@lru_cache(maxsize=4096)
+def _location(keyword):
+    return json.dumps(fixtures.location(keyword)).encode()
+
+@lru_cache(maxsize=4096)
+def _forecast(city, start_date):
+    return json.dumps(fixtures.forecast(city, start_date)).encode()
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        self.server.stub.delay()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stub.count()
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path == "/v1/security/oauth2/token":
+            self._reply(json.dumps({
+                "type": "amadeusOAuth2Token", "access_token": "benchmark", "expires_in": 1799, "state": "approved"
+            }).encode())
+        elif path == "/v1/chat/completions":
+            messages = json.loads(body or b"{}").get("messages", [])
+            prompt = messages[-1]["content"] if messages else ""
+            self._reply(json.dumps(fixtures.chat_completion(prompt)).encode())
+        else:
+            self._reply(b'{"error": "not found"}', 404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/v2/shopping/flight-offers":
+            self._reply(_flight_offers(
+                query["originLocationCode"], query["destinationLocationCode"],
+                query["departureDate"], query.get("returnDate"), self.server.stub.offers
+            ))
+        elif url.path in ("/v1/reference-data/locations", "/v1/reference-data/locations/cities"):
+            self._reply(_location(query.get("keyword", "")))
+        elif url.path == "/data/2.5/forecast":
+            self._reply(_forecast(query.get("q", ""), fixtures.trip_dates()[0]))
+        else:
+            self._reply(b'{"error": "not found"}', 404)
+
+# Local HTTP server replaying Amadeus, OpenWeather and OpenAI payloads after a configurable
+# latency (seconds) with uniform jitter, counting the requests it serves
+class StubServer:
+    def __init__(self, latency=0.05, jitter=0.02, offers=50, host="127.0.0.1", port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.offers = offers
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def delay(self):
+        with self._lock:
+            seconds = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class StubRedisHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line.startswith(b"*"):
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _write(self, reply):
+        if reply is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(reply, int):
+            self.wfile.write(b":%d\r\n" % reply)
+        elif isinstance(reply, str):
+            self.wfile.write(b"+%s\r\n" % reply.encode())
+        elif isinstance(reply, bytes):
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(reply), reply))
+        else:
+            self.wfile.write(b"*%d\r\n" % len(reply))
+            for item in reply:
+                self._write(item)
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            try:
+                reply = self.server.stub.execute(args[0].decode().upper(), args[1:])
+            except Exception as exc:
+                self.wfile.write(b"-ERR %s\r\n" % str(exc).encode())
+            else:
+                self._write(reply)
+            self.wfile.flush()
+
+# Local stand-in for a Redis server speaking the subset of commands RedisCache uses
+# (PING, SELECT, GET, SET with PX/NX, DEL, SCAN, FLUSHDB, and EVAL of the compare-and-delete
+# script only), so the shared cache backend can be exercised without a real Redis
+class StubRedisServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.commands = 0
+        self._data = {}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), StubRedisHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"redis://{host}:{port}/0"
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            entry = None
+        return entry
+
+    def execute(self, command, args):
+        with self._lock:
+            self.commands += 1
+            if command == "PING":
+                return "PONG"
+            if command == "SELECT":
+                return "OK"
+            if command == "GET":
+                entry = self._live(args[0])
+                return None if entry is None else entry[0]
+            if command == "SET":
+                key, value, options = args[0], args[1], [arg.decode().upper() for arg in args[2:]]
+                if "NX" in options and self._live(key) is not None:
+                    return None
+                expires_at = None
+                if "PX" in options:
+                    expires_at = time.monotonic() + int(options[options.index("PX") + 1]) / 1000
+                self._data[key] = (value, expires_at)
+                return "OK"
+            if command == "DEL":
+                return sum(self._data.pop(key, None) is not None for key in args)
+            if command == "EVAL":
+                if args[0].decode() != REDIS_COMPARE_AND_DELETE:
+                    raise ValueError("unsupported script")
+                key, value = args[2], args[3]
+                entry = self._live(key)
+                if entry is None or entry[0] != value:
+                    return 0
+                del self._data[key]
+                return 1
+            if command == "SCAN":
+                options = [arg.decode() for arg in args[1:]]
+                pattern = options[options.index("MATCH") + 1] if "MATCH" in options else "*"
+                keys = [key for key in list(self._data) if self._live(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+                return [b"0", keys]
+            if command == "FLUSHDB":
+                self._data.clear()
+                return "OK"
+            raise ValueError(f"unknown command '{command}'")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,81 +1,169 @@
-from services.openai_helper import get_chatgpt_response
+from services.extraction import extract_multi_city_trip_async, extract_trip_async, normalize_input
 from services.flights import (
-    get_flights,
+    get_flight_offers,
     format_flight_offer,
-    get_iata_code,
-    find_flight_with_smallest_segments
+    get_iata_code
 )
-from services.weather import get_weather
-import requests
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from datetime import datetime
+from services.ranking import best_offer
+from services.flex_search import build_price_calendar, date_window
+from services.weather import get_weather_async
+from services.http import close_async_clients
+from services.cache import AsyncSingleFlight, get_or_load_async, make_cache
+from services.speculation import settle_speculation, start_speculation
+from services.retry import RetryPolicy
+from services.rate_limit import BATCH, request_priority
+from services.metrics import (
+    current_trace,
+    register_cache,
+    render,
+    request_duration,
+    response_size,
+    server_timing,
+    stage_duration,
+    timed
+)
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
 import time
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+
+# Close the pooled upstream connections on shutdown
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await close_async_clients()
 
 # Initialize FastAPI application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Trace every request when TRACE_REQUESTS is set; otherwise only requests sending "X-Trace: 1"
+TRACE_REQUESTS = os.environ.get("TRACE_REQUESTS", "").lower() in ("1", "true", "yes")
+
+# Metrics label for a request: the template of the route it matched, so label values
+# stay bounded however many distinct URLs clients send
+def route_path(request):
+    route = request.scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+# Time every request and, for traced requests, report per-stage spans in a Server-Timing header
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    spans = [] if TRACE_REQUESTS or request.headers.get("X-Trace") == "1" else None
+    token = current_trace.set(spans)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+    path = route_path(request)
+    request_duration.observe(time.perf_counter() - started, path=path, status=str(response.status_code))
+    if "content-length" in response.headers:
+        response_size.observe(int(response.headers["content-length"]), path=path)
+    if spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    return response
+
+# Prometheus metrics: stage and upstream latencies, upstream calls, cache hit ratios and payload sizes
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+# Timeouts (in seconds) for each upstream stage of the planning pipeline
+STAGE_TIMEOUTS = {
+    "chatgpt": 30,
+    "iata": 10,
+    "flights": 30,
+    "weather": 10,
+}
+
+# Retry policies for each stage, with deadline budgets inside the stage timeouts
+STAGE_RETRIES = {
+    "chatgpt": RetryPolicy(attempts=3, base_delay=1.0, max_delay=8.0, deadline=25),
+    "iata": RetryPolicy(attempts=3, base_delay=0.25, max_delay=2.0, deadline=8),
+    "flights": RetryPolicy(attempts=3, base_delay=0.5, max_delay=4.0, deadline=25),
+    "weather": RetryPolicy(attempts=3, base_delay=0.25, max_delay=2.0, deadline=8),
+}
+
+# Batch planning runs this many trips at once, with at most this many calls in flight per upstream
+BATCH_CONCURRENCY = 32
+BATCH_STAGE_LIMITS = {
+    "chatgpt": 8,
+    "iata": 8,
+    "flights": 4,
+    "weather": 8,
+}
+
+# Flexible-date planning runs at most this many one-way searches at once
+FLEX_SEARCH_CONCURRENCY = 4
+
+# Per-stage semaphores bounding upstream concurrency for the current batch, if any
+stage_limits = contextvars.ContextVar("stage_limits", default=None)
+
+# Run a service call with retries, bounded by its stage timeout. Blocking calls run in the
+# threadpool; coroutine calls are awaited on the event loop.
+async def run_stage(stage, func, *args):
+    limits = stage_limits.get()
+    if limits is None:
+        return await run_stage_call(stage, func, *args)
+    async with limits[stage]:
+        return await run_stage_call(stage, func, *args)
+
+async def run_stage_call(stage, func, *args):
+    try:
+        with timed(stage_duration, stage, stage=stage):
+            return await asyncio.wait_for(STAGE_RETRIES[stage].run(func, *args), STAGE_TIMEOUTS[stage])
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Timed out waiting for {stage}.")
+
+# Resolve an IATA code by city name unless ChatGPT already provided one
+async def resolve_iata_code(code, name):
+    if code is not None:
+        return code
+    return await run_stage("iata", get_iata_code, name)
 
 # Define request body model for trip planning
 class TripRequest(BaseModel):
     user_input: str
+    # Also search departure and return dates up to this many days either side
+    flex_days: int = Field(default=0, ge=0, le=7)
 
-# Main endpoint for trip planning
-@app.post("/plan_trip")
-async def plan_trip(trip_request: TripRequest):
-    user_input = trip_request.user_input
-
-    # Get the current year and month for handling missing date information
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-
-    # Prepare the prompt for ChatGPT to parse trip information from user input
-    prompt = f"""
-    Given the trip context, perform the following:
-    1. Extract destination, origin, start date, and end date.
-    2. Convert dates to YYYY-MM-DD. If year is missing, use '{current_year}'; if month is missing, use '{current_month}'.
-    3. Determine if origin and destination are valid cities (boolean).
-    4. Attempt to convert them to IATA codes. If not possible, return None.
-    5. Provide the nearest city with an airport as 'nearest'.
-    6. Provide a summary in this format: 'Here is your trip plan to Rome from November 1st to November 10th.'
-
-    CONTEXT:
-    {user_input}
-
-    Return response in the following JSON format:
-    {{
-        "destination": {{
-            "name": str,
-            "city": bool,
-            "code": str,
-            "nearest": {{
-                "name": str,
-                "code": str
-            }}
-        }},
-        "origin": {{
-            "name": str,
-            "city": bool,
-            "code": str,
-            "nearest": {{
-                "name": str,
-                "code": str
-            }}
-        }},
-        "start_date": str,
-        "end_date": str,
-        "description": str
-    }}
-    """
-
-    # Retry mechanism for handling ChatGPT request errors
-    retries = 3
-    for attempt in range(retries):
-        try:
-            chatgpt_response = get_chatgpt_response(prompt)
-            break
-        except Exception:
-            print("Retrying in 5 seconds...")
-            time.sleep(5)
+# Define request body model for multi-city trip planning
+class MultiCityTripRequest(BaseModel):
+    user_input: str
+
+# Define request body model for batch trip planning
+class BatchTripRequest(BaseModel):
+    trips: List[TripRequest]
+
+# Extract the trip from user input and validate cities and travel dates. With
+# SPECULATIVE_PREFETCH on, lookups for the route guessed from the raw input are warmed
+# while the LLM runs.
+async def extract_trip_details(user_input):
+    speculation = start_speculation(user_input)
+    trip = None
+    try:
+        trip = await parse_trip_details(user_input)
+        return trip
+    finally:
+        settle_speculation(speculation, trip)
+
+async def parse_trip_details(user_input):
+    # Ask ChatGPT to parse the trip, retrying transient failures without blocking the event loop
+    try:
+        chatgpt_response = await run_stage("chatgpt", extract_trip_async, user_input)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=502, detail="Failed to get a response from ChatGPT.")
 
     # Validate response: Check if origin and destination are valid cities
     if not chatgpt_response.get("destination", {}).get("city"):
@@ -85,53 +173,321 @@ async def plan_trip(trip_request: TripRequest):
 
     try:
         # Extract necessary data from ChatGPT response
-        origin_code = chatgpt_response["origin"]["nearest"]["code"]
-        destination_code = chatgpt_response["destination"]["nearest"]["code"]
-        description = chatgpt_response["description"]
-        destination = chatgpt_response["destination"]["nearest"]["name"]
-        origin = chatgpt_response["origin"]["nearest"]["name"]
-        start_date = chatgpt_response["start_date"]
-        end_date = chatgpt_response["end_date"]
+        trip = {
+            "origin_code": chatgpt_response["origin"]["nearest"]["code"],
+            "destination_code": chatgpt_response["destination"]["nearest"]["code"],
+            "description": chatgpt_response["description"],
+            "destination": chatgpt_response["destination"]["nearest"]["name"],
+            "origin": chatgpt_response["origin"]["nearest"]["name"],
+            "start_date": chatgpt_response["start_date"],
+            "end_date": chatgpt_response["end_date"]
+        }
     except (SyntaxError, KeyError):
         raise HTTPException(status_code=400, detail="Failed to parse ChatGPT response.")
 
     # Validate dates: Convert to datetime objects and ensure they are in the future
     try:
-        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
-    except ValueError:
+        trip["start_date_obj"] = datetime.strptime(trip["start_date"], "%Y-%m-%d")
+        trip["end_date_obj"] = datetime.strptime(trip["end_date"], "%Y-%m-%d")
+    except (TypeError, ValueError):
         raise HTTPException(status_code=400, detail="Invalid date format. Use 'YYYY-MM-DD'.")
 
     current_date = datetime.now()
-    if start_date_obj < current_date or end_date_obj < current_date:
+    if trip["start_date_obj"] < current_date or trip["end_date_obj"] < current_date:
         raise HTTPException(status_code=400, detail="Travel dates must be in the future.")
-    if start_date_obj > end_date_obj:
+    if trip["start_date_obj"] > trip["end_date_obj"]:
         raise HTTPException(status_code=400, detail="Start date must be before end date.")
 
-    # Retrieve IATA codes if not provided
-    if origin_code is None:
-        origin_code = get_iata_code(origin)
-    if destination_code is None:
-        destination_code = get_iata_code(destination)
+    return trip
+
+# Extract a multi-city itinerary from user input and split it into one-way legs and the
+# stays between them, validating cities and travel dates
+async def extract_multi_city_details(user_input):
+    try:
+        chatgpt_response = await run_stage("chatgpt", extract_multi_city_trip_async, user_input)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=502, detail="Failed to get a response from ChatGPT.")
+
+    try:
+        stops = chatgpt_response["stops"]
+        departure_dates = chatgpt_response["departure_dates"]
+        description = chatgpt_response["description"]
+        end_date = chatgpt_response.get("end_date") or departure_dates[-1]
+        if len(stops) < 2 or len(departure_dates) != len(stops) - 1:
+            raise HTTPException(status_code=400, detail="Itinerary needs one departure date per leg.")
+        for stop in stops:
+            if not stop.get("city"):
+                raise HTTPException(status_code=400, detail=f"{stop.get('name')} is not a city.")
+        stops = [{"code": stop["nearest"]["code"], "name": stop["nearest"]["name"]} for stop in stops]
+    except (AttributeError, TypeError, KeyError, IndexError):
+        raise HTTPException(status_code=400, detail="Failed to parse ChatGPT response.")
+
+    # Validate dates: each leg departs in the future, in order, before the trip ends
+    try:
+        dates = [datetime.strptime(date, "%Y-%m-%d") for date in departure_dates + [end_date]]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid date format. Use 'YYYY-MM-DD'.")
+    if dates[0] < datetime.now():
+        raise HTTPException(status_code=400, detail="Travel dates must be in the future.")
+    if any(earlier > later for earlier, later in zip(dates, dates[1:])):
+        raise HTTPException(status_code=400, detail="Leg dates must be in travel order.")
+
+    # Each leg is a one-way trip in the shape plan_flights expects
+    legs = [{
+        "origin_code": origin["code"],
+        "origin": origin["name"],
+        "destination_code": destination["code"],
+        "destination": destination["name"],
+        "start_date": departure_dates[index],
+        "end_date": None
+    } for index, (origin, destination) in enumerate(zip(stops, stops[1:]))]
+
+    # Each stop after the origin is a stay until the next departure, in the shape plan_weather
+    # expects; returning home does not need a forecast
+    stays = [{
+        "destination": stop["name"],
+        "start_date_obj": dates[index],
+        "end_date_obj": dates[index + 1]
+    } for index, stop in enumerate(stops[1:]) if stop != stops[0]]
+
+    return {"description": description, "legs": legs, "stays": stays}
+
+# Search flights for the trip and format the best-ranked offer
+async def plan_flights(trip):
+    # Retrieve IATA codes if not provided, resolving origin and destination together
+    origin_code, destination_code = await asyncio.gather(
+        resolve_iata_code(trip["origin_code"], trip["origin"]),
+        resolve_iata_code(trip["destination_code"], trip["destination"])
+    )
 
     # Get flight details based on origin, destination, and travel dates
-    flights = get_flights(origin_code, destination_code, start_date, end_date)
+    flights = await run_stage("flights", get_flight_offers, origin_code, destination_code, trip["start_date"], trip["end_date"])
     if not flights:
         raise HTTPException(status_code=400, detail="No flights found.")
 
-    # Get weather forecast for destination during travel period
-    weather_forecast = get_weather(destination, start_date_obj, end_date_obj)
+    # Pick the best whole offer by price, duration, stops and layovers; formatting looks up
+    # airport cities, so keep it off the event loop
+    with timed(stage_duration, "format_flights", stage="format_flights"):
+        return await run_in_threadpool(format_flight_offer, best_offer(flights).directions())
+
+# Search one-way fares for every departure and return date within ±flex_days of the trip
+# dates and combine them into a price calendar
+async def plan_price_calendar(trip, flex_days):
+    origin_code, destination_code = await asyncio.gather(
+        resolve_iata_code(trip["origin_code"], trip["origin"]),
+        resolve_iata_code(trip["destination_code"], trip["destination"])
+    )
+    today = datetime.now().date()
+    departure_dates = date_window(trip["start_date_obj"], flex_days, earliest=today)
+    return_dates = date_window(trip["end_date_obj"], flex_days, earliest=today)
+
+    searches = asyncio.Semaphore(FLEX_SEARCH_CONCURRENCY)
+
+    async def search(origin, destination, day):
+        async with searches:
+            try:
+                return await run_stage("flights", get_flight_offers, origin, destination, day, None)
+            except Exception:
+                # A failed date leaves a gap in the calendar rather than failing the plan
+                return []
+
+    results = await asyncio.gather(
+        *(search(origin_code, destination_code, day) for day in departure_dates),
+        *(search(destination_code, origin_code, day) for day in return_dates)
+    )
+    return build_price_calendar(
+        dict(zip(departure_dates, results[:len(departure_dates)])),
+        dict(zip(return_dates, results[len(departure_dates):]))
+    )
+
+# Get the weather forecast for the destination during the travel period
+async def plan_weather(trip):
+    return await run_stage("weather", get_weather_async, trip["destination"], trip["start_date_obj"], trip["end_date_obj"])
+
+# Run the planning pipeline for one trip request
+async def build_trip_plan(trip_request):
+    trip = await extract_trip_details(trip_request.user_input)
+
+    # Get flight details and the destination weather forecast concurrently
+    stages = [plan_flights(trip), plan_weather(trip)]
+    if trip_request.flex_days:
+        stages.append(plan_price_calendar(trip, trip_request.flex_days))
+    results = await asyncio.gather(*stages)
+
+    trip_plan = {
+        "description": trip["description"],
+        "flights": results[0],
+        "weather_forecast": results[1]
+    }
+    if trip_request.flex_days:
+        trip_plan["price_calendar"] = results[2]
+
+    return {"trip_plan": trip_plan}
+
+# Completed /plan_trip responses are cached for PLAN_CACHE_TTL seconds, so a client or
+# gateway retrying a timed-out request gets the finished plan instead of a second run of
+# the pipeline. Clients may revalidate for PLAN_MAX_AGE seconds without asking again.
+PLAN_CACHE_TTL = int(os.environ.get("PLAN_CACHE_TTL", 300))
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", 1024))
+PLAN_MAX_AGE = int(os.environ.get("PLAN_MAX_AGE", 0))
+plan_cache = make_cache("trip_plans", PLAN_CACHE_SIZE, PLAN_CACHE_TTL)
+plan_tasks = AsyncSingleFlight()
+register_cache("trip_plans", plan_cache)
+
+# Plans are keyed on the normalized request and today's date, which relative dates in the
+# input depend on, plus the client's idempotency key if it sent one
+def plan_cache_key(trip_request, idempotency_key=None):
+    today = datetime.now().strftime("%Y-%m-%d")
+    return (today, normalize_input(trip_request.user_input), trip_request.flex_days, idempotency_key)
+
+# Get the plan for a trip request from the response cache, or build it. Concurrent
+# identical requests share one run, which carries on if the first caller disconnects.
+async def get_trip_plan(trip_request, idempotency_key=None):
+    return await get_or_load_async(
+        plan_cache, plan_tasks, plan_cache_key(trip_request, idempotency_key), build_trip_plan, trip_request
+    )
+
+# Strong ETag of a response body
+def body_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+# True if an If-None-Match header lists etag, weakly or strongly
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+# Main endpoint for trip planning. Responses carry an ETag; a request whose
+# If-None-Match lists it gets 304 Not Modified with no body. Planning is a read, so this
+# deliberately treats POST like GET instead of answering 412 as RFC 9110 asks for other
+# methods; a wildcard is not a match, and such a request gets the plan.
+@app.post("/plan_trip")
+async def plan_trip(trip_request: TripRequest, request: Request):
+    trip_plan = await get_trip_plan(trip_request, request.headers.get("Idempotency-Key"))
+    response = JSONResponse(trip_plan, headers={"Cache-Control": f"private, max-age={PLAN_MAX_AGE}"})
+    etag = body_etag(response.body)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": response.headers["Cache-Control"]})
+    response.headers["ETag"] = etag
+    return response
+
+# Multi-city trip planning: searches every leg and fetches every city's forecast at once,
+# so an N-leg trip takes about as long as its slowest leg
+@app.post("/plan_multi_city")
+async def plan_multi_city(trip_request: MultiCityTripRequest):
+    itinerary = await extract_multi_city_details(trip_request.user_input)
+    legs, stays = itinerary["legs"], itinerary["stays"]
+
+    results = await asyncio.gather(
+        *(plan_flights(leg) for leg in legs),
+        *(plan_weather(stay) for stay in stays)
+    )
 
-    # Find the shortest flight and format the trip plan response
-    shortest_flight = find_flight_with_smallest_segments(flights)
     trip_plan = {
-        "description": description,
-        "flights": format_flight_offer(shortest_flight),
-        "weather_forecast": weather_forecast
+        "description": itinerary["description"],
+        "legs": [{
+            "origin": leg["origin"],
+            "destination": leg["destination"],
+            "departure_date": leg["start_date"],
+            "flights": flights
+        } for leg, flights in zip(legs, results[:len(legs)])],
+        "weather_forecast": [{
+            "city": stay["destination"],
+            "start_date": stay["start_date_obj"].strftime("%Y-%m-%d"),
+            "end_date": stay["end_date_obj"].strftime("%Y-%m-%d"),
+            "forecast": forecast
+        } for stay, forecast in zip(stays, results[len(legs):])]
     }
 
     return {"trip_plan": trip_plan}
 
+# Plan many trips with bounded concurrency, yielding {"index", "trip_plan"} or
+# {"index", "error"} per request as each completes. Identical sub-queries across the
+# batch (extractions, airport lookups, route searches, city forecasts) are shared by
+# the service-layer caches, so upstream load scales with unique queries.
+async def plan_trips(trip_requests, concurrency=BATCH_CONCURRENCY, limits=BATCH_STAGE_LIMITS):
+    trips_in_flight = asyncio.Semaphore(concurrency)
+    semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in limits.items()}
+
+    async def plan_item(index, trip_request):
+        # Each task runs in its own context, so the limits and the lower upstream
+        # priority only apply to this batch
+        stage_limits.set(semaphores)
+        request_priority.set(BATCH)
+        async with trips_in_flight:
+            try:
+                return {"index": index, **await build_trip_plan(trip_request)}
+            except HTTPException as exc:
+                return {"index": index, "error": {"status_code": exc.status_code, "detail": exc.detail}}
+            except Exception:
+                return {"index": index, "error": {"status_code": 500, "detail": "Internal Server Error"}}
+
+    tasks = [asyncio.ensure_future(plan_item(index, trip_request)) for index, trip_request in enumerate(trip_requests)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Batch endpoint for trip planning, streaming one JSON result per line as trips complete
+@app.post("/plan_trips")
+async def plan_trips_batch(batch_request: BatchTripRequest):
+    async def lines():
+        async for result in plan_trips(batch_request.trips):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Format a Server-Sent Event with a JSON payload
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant of /plan_trip: emits the parsed trip as soon as it is extracted,
+# then the weather and flights as each completes, then the full trip plan
+@app.post("/plan_trip/stream")
+async def plan_trip_stream(trip_request: TripRequest):
+    async def events():
+        tasks = {}
+        try:
+            trip = await extract_trip_details(trip_request.user_input)
+            yield sse_event("description", {
+                key: trip[key] for key in ("description", "origin", "destination", "start_date", "end_date")
+            })
+
+            tasks = {
+                asyncio.ensure_future(plan_weather(trip)): "weather_forecast",
+                asyncio.ensure_future(plan_flights(trip)): "flights"
+            }
+            if trip_request.flex_days:
+                tasks[asyncio.ensure_future(plan_price_calendar(trip, trip_request.flex_days))] = "price_calendar"
+            trip_plan = {"description": trip["description"]}
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    trip_plan[tasks[task]] = task.result()
+                    event = "weather" if tasks[task] == "weather_forecast" else tasks[task]
+                    yield sse_event(event, trip_plan[tasks[task]])
+
+            yield sse_event("trip_plan", {"trip_plan": trip_plan})
+        except HTTPException as exc:
+            yield sse_event("error", {"status_code": exc.status_code, "detail": exc.detail})
+        except Exception:
+            yield sse_event("error", {"status_code": 500, "detail": "Internal Server Error"})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Run the FastAPI application if this script is executed directly
 if __name__ == "__main__":
     import uvicorn
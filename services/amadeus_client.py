@@ -0,0 +1,88 @@
+import threading
+import requests
+from urllib.error import URLError
+from requests.adapters import HTTPAdapter
+from services.metrics import upstream_response_size
+
+# Connection pool size and (connect, read) timeouts for Amadeus HTTP calls
+AMADEUS_POOL_SIZE = 20
+AMADEUS_TIMEOUT = (5, 30)
+
+# urlopen-style response wrapper so the Amadeus SDK can parse pooled responses
+class PooledResponse:
+    def __init__(self, response):
+        self._response = response
+        self.status = response.status_code
+        self.code = response.status_code
+
+    def read(self):
+        return self._response.content
+
+    def info(self):
+        return self._response.headers
+
+# urlopen replacement that sends Amadeus SDK requests through a shared keep-alive session
+class PooledHTTP:
+    def __init__(self, pool_size=AMADEUS_POOL_SIZE, timeout=AMADEUS_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __call__(self, http_request):
+        try:
+            response = self.session.request(
+                http_request.get_method(),
+                http_request.full_url,
+                headers=dict(http_request.header_items()),
+                data=http_request.data,
+                timeout=self.timeout
+            )
+        except requests.RequestException as exc:
+            # The SDK turns URLError into amadeus.NetworkError
+            raise URLError(exc)
+        upstream_response_size.observe(len(response.content), provider="amadeus")
+        return PooledResponse(response)
+
+    def close(self):
+        self.session.close()
+
+# Process-wide Amadeus client shared by threads and async tasks.
+# The OAuth token is fetched once and reused until it is about to expire. Credentials
+# may be callables, resolved (and the SDK imported) only when the client is created.
+class AmadeusClientManager:
+    def __init__(self, client_id, client_secret, **options):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.options = options
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _create_client(self):
+        from amadeus import Client
+        from amadeus.client.access_token import AccessToken
+
+        client = Client(
+            client_id=self.client_id() if callable(self.client_id) else self.client_id,
+            client_secret=self.client_secret() if callable(self.client_secret) else self.client_secret,
+            http=PooledHTTP(),
+            **self.options
+        )
+        client.access_token = AccessToken(client)
+        return client
+
+    # Return the shared client, refreshing the access token under the lock
+    # so concurrent callers never trigger more than one token request
+    def get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._create_client()
+            self._client.access_token._bearer_token()
+            return self._client
+
+    def reset(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.http.close()
+            self._client = None
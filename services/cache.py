@@ -0,0 +1,567 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # optional; the json module writes the same encoding, only slower
+    orjson = None
+
+# Backend shared by the service caches: "memory" keeps every cache in-process, "sqlite"
+# shares them between the workers on a host and "redis" between every node
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_NAMESPACE = os.environ.get("CACHE_NAMESPACE", "trip-planner")
+CACHE_REDIS_TIMEOUT = float(os.environ.get("CACHE_REDIS_TIMEOUT", 0.5))
+# SQLite caches are read through a memory map of up to this many bytes
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 64 * 1024 * 1024))
+# Each SQLite cache deletes its expired rows at most once per this many seconds, on a write
+SQLITE_PURGE_INTERVAL = float(os.environ.get("SQLITE_PURGE_INTERVAL", 300))
+
+# A worker that misses a shared key waits up to this many seconds for another worker
+# already loading it, checking the shared store every STAMPEDE_POLL_INTERVAL seconds
+STAMPEDE_LOCK_TTL = float(os.environ.get("STAMPEDE_LOCK_TTL", 30))
+STAMPEDE_POLL_INTERVAL = float(os.environ.get("STAMPEDE_POLL_INTERVAL", 0.05))
+
+# Raised when a remote cache backend cannot be reached or answers with an error
+class CacheBackendError(Exception):
+    pass
+
+# Errors that make a shared backend fall back to a miss instead of failing the request
+BACKEND_ERRORS = (sqlite3.Error, OSError, CacheBackendError)
+
+# Compact JSON encoding of cached values, with orjson when it is installed
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# String form of a cache key for backends that only store string keys
+def key_string(key):
+    return key if isinstance(key, str) else dumps(key).decode()
+
+# Directory for on-disk caches shared by every worker on the host
+def cache_path(filename):
+    cache_dir = os.environ.get("TRIP_PLANNER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "trip-planner"))
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, filename)
+
+# Thread-safe in-process LRU cache whose entries expire after a TTL
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    # Membership test for a live entry that leaves the hit/miss counters alone
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    # Hit/miss counters and current size, for monitoring
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._data),
+        }
+
+# On-disk cache of JSON values in SQLite, shared across processes on the same host
+class SQLiteCache:
+    def __init__(self, filename, ttl=300):
+        self.filename = filename
+        self.ttl = ttl
+        self._purged_at = time.monotonic()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    # Open the database lazily so importing a service never touches the disk
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(cache_path(self.filename), timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key_string(key),)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return default
+        return loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key_string(key), dumps(value), expires_at)
+            )
+            self._purge_expired(conn)
+            conn.commit()
+
+    # Expired rows are only replaced by writes to the same key, so delete them now and then
+    # to keep the file from growing without bound. Called with the lock held.
+    def _purge_expired(self, conn):
+        now = time.monotonic()
+        if now - self._purged_at < SQLITE_PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    # Store value only if key is absent or expired; True if it was stored
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE cache.expires_at <= ?",
+                (key_string(key), dumps(value), expires_at, now)
+            )
+            self._purge_expired(conn)
+            conn.commit()
+            return cursor.rowcount == 1
+
+    # Delete key only while it still holds value
+    def remove(self, key, value):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache WHERE key = ? AND value = ?", (key_string(key), dumps(value)))
+            conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache WHERE key = ?", (key_string(key),))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+
+# Minimal client for the Redis protocol (RESP2): enough of GET, SET, DEL, SCAN and EVAL
+# to share cache entries between nodes without another dependency
+class RedisConnection:
+    def __init__(self, host, port, db=0, timeout=CACHE_REDIS_TIMEOUT):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile("rb")
+        if db:
+            self.command("SELECT", db)
+
+    def command(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._socket.sendall(b"".join(parts))
+        return self._reply()
+
+    def _reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheBackendError("Connection to Redis closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise CacheBackendError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._reply() for _ in range(length)]
+        raise CacheBackendError(f"Unexpected Redis reply {line!r}")
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+# Lua script deleting KEYS[1] only while it still holds ARGV[1]. Redis runs it atomically,
+# so a stampede lock that expired and was taken by another worker is never released here.
+REDIS_COMPARE_AND_DELETE = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+# Cache stored in Redis (or anything speaking its protocol) under a key prefix, shared by
+# every worker on every node. Each thread keeps its own connection.
+class RedisCache:
+    def __init__(self, url, prefix, ttl=300, timeout=CACHE_REDIS_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.strip("/") or 0)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _command(self, *args):
+        connection = getattr(self._local, "connection", None)
+        try:
+            if connection is None:
+                connection = self._local.connection = RedisConnection(self.host, self.port, self.db, self.timeout)
+            return connection.command(*args)
+        except (OSError, CacheBackendError):
+            # Drop the connection so the next call reconnects
+            if connection is not None:
+                connection.close()
+            self._local.connection = None
+            raise
+
+    def _key(self, key):
+        return self.prefix + key_string(key)
+
+    def get(self, key, default=None):
+        data = self._command("GET", self._key(key))
+        return default if data is None else loads(data)
+
+    def set(self, key, value, ttl=None):
+        milliseconds = int((self.ttl if ttl is None else ttl) * 1000)
+        self._command("SET", self._key(key), dumps(value), "PX", milliseconds)
+
+    def add(self, key, value, ttl=None):
+        milliseconds = int((self.ttl if ttl is None else ttl) * 1000)
+        return self._command("SET", self._key(key), dumps(value), "PX", milliseconds, "NX") is not None
+
+    def remove(self, key, value):
+        self._command("EVAL", REDIS_COMPARE_AND_DELETE, 1, self._key(key), dumps(value))
+
+    def delete(self, key):
+        self._command("DEL", self._key(key))
+
+    def clear(self):
+        cursor = "0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 1000)
+            if keys:
+                self._command("DEL", *keys)
+            cursor = cursor.decode()
+            if cursor == "0":
+                return
+
+# Two-level cache: a fast in-process LRU in front of a store shared with other workers
+# (SQLite or Redis). Values that are not plain JSON are converted with encode before they
+# are shared and rebuilt with decode on the way back. An unreachable shared store counts
+# as a miss rather than an error.
+class TieredCache:
+    def __init__(self, memory, shared, encode=None, decode=None):
+        self.memory = memory
+        self.shared = shared
+        self.encode = encode
+        self.decode = decode
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def _load_shared(self, key):
+        try:
+            value = self.shared.get(key)
+        except BACKEND_ERRORS:
+            return None
+        if value is None:
+            return None
+        if self.decode is not None:
+            value = self.decode(value)
+        self.memory.set(key, value)
+        return value
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self._load_shared(key)
+        if value is None:
+            self.shared_misses += 1
+            return default
+        self.shared_hits += 1
+        return value
+
+    # Look for a value another worker stored, without counting a lookup
+    def reload(self, key):
+        return self._load_shared(key)
+
+    def set(self, key, value, ttl=None):
+        self.memory.set(key, value, ttl)
+        try:
+            self.shared.set(key, value if self.encode is None else self.encode(value), ttl)
+        except BACKEND_ERRORS:
+            pass
+
+    # Shared-store lock primitives for stampede protection; without a reachable store
+    # every caller may proceed
+    def add(self, key, value, ttl=None):
+        try:
+            return self.shared.add(key, value, ttl)
+        except BACKEND_ERRORS:
+            return True
+
+    def remove(self, key, value):
+        try:
+            self.shared.remove(key, value)
+        except BACKEND_ERRORS:
+            pass
+
+    def delete(self, key):
+        self.memory.delete(key)
+        try:
+            self.shared.delete(key)
+        except BACKEND_ERRORS:
+            pass
+
+    def clear(self):
+        self.memory.clear()
+        try:
+            self.shared.clear()
+        except BACKEND_ERRORS:
+            pass
+
+    def __len__(self):
+        return len(self.memory)
+
+    def __contains__(self, key):
+        return key in self.memory
+
+    # Lookups answered by either level, for monitoring; size is the in-process level
+    def stats(self):
+        hits = self.memory.hits + self.shared_hits
+        lookups = hits + self.shared_misses
+        return {
+            "hits": hits,
+            "misses": self.shared_misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+# Shared store for the named cache on the given backend, or None for in-process only
+def shared_backend(name, ttl, backend=None):
+    backend = (backend or CACHE_BACKEND).lower()
+    if backend == "memory":
+        return None
+    if backend == "sqlite":
+        return SQLiteCache(f"{name}.sqlite3", ttl=ttl)
+    if backend == "redis":
+        return RedisCache(CACHE_REDIS_URL, f"{CACHE_NAMESPACE}:{name}:", ttl=ttl)
+    raise ValueError(f"Unknown cache backend {backend!r}; use memory, sqlite or redis.")
+
+# Create a service cache: an in-process LRU, in front of the configured shared backend
+# unless that is "memory"
+def make_cache(name, maxsize, ttl, encode=None, decode=None, backend=None):
+    memory = TTLCache(maxsize=maxsize, ttl=ttl)
+    shared = shared_backend(name, ttl, backend)
+    return memory if shared is None else TieredCache(memory, shared, encode, decode)
+
+# In-flight state of a single-flight call
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Collapse concurrent calls with the same key into one execution whose result
+# (or exception) is shared by every waiting thread
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+# Shared-store key of the lock held while one worker loads key
+def lock_key(key):
+    return ["lock", key]
+
+# Load a missing key and store it. With a shared store the loader runs in one worker at a
+# time: the others wait for its result to appear, and take over if it fails or stalls.
+def fill(cache, key, loader, *args, **kwargs):
+    token = None
+    waited = False
+    if isinstance(cache, TieredCache):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + STAMPEDE_LOCK_TTL
+        while not cache.add(lock_key(key), token, STAMPEDE_LOCK_TTL):
+            if time.monotonic() >= deadline:
+                token = None
+                break
+            waited = True
+            time.sleep(STAMPEDE_POLL_INTERVAL)
+            value = cache.reload(key)
+            if value is not None:
+                return value
+    try:
+        # The previous holder may have stored the value just before releasing the lock
+        value = cache.reload(key) if waited else None
+        if value is not None:
+            return value
+        value = loader(*args, **kwargs)
+        cache.set(key, value)
+        return value
+    finally:
+        if token is not None:
+            cache.remove(lock_key(key), token)
+
+# Return the cached value for key, loading it at most once across concurrent misses
+def get_or_load(cache, single_flight, key, loader, *args, **kwargs):
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    def load():
+        return fill(cache, key, loader, *args, **kwargs)
+
+    return single_flight.do(key, load)
+
+# Coroutine counterpart of SingleFlight: concurrent awaits with the same key share one task.
+# Followers are shielded, so a cancelled caller does not cancel the load for the others.
+class AsyncSingleFlight:
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._tasks.get(key)
+        # Tasks belong to the loop that created them; never share one across loops
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._tasks[key] = task
+
+            def forget(done):
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+            task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+# Awaitable fill for coroutine loaders; shared-store calls run on a worker thread
+async def fill_async(cache, key, loader, *args, **kwargs):
+    token = None
+    waited = False
+    if isinstance(cache, TieredCache):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + STAMPEDE_LOCK_TTL
+        while not await run_in_threadpool(cache.add, lock_key(key), token, STAMPEDE_LOCK_TTL):
+            if time.monotonic() >= deadline:
+                token = None
+                break
+            waited = True
+            await asyncio.sleep(STAMPEDE_POLL_INTERVAL)
+            value = await run_in_threadpool(cache.reload, key)
+            if value is not None:
+                return value
+    try:
+        value = await run_in_threadpool(cache.reload, key) if waited else None
+        if value is not None:
+            return value
+        value = await loader(*args, **kwargs)
+        if isinstance(cache, TieredCache):
+            await run_in_threadpool(cache.set, key, value)
+        else:
+            cache.set(key, value)
+        return value
+    finally:
+        if token is not None:
+            await run_in_threadpool(cache.remove, lock_key(key), token)
+
+# Awaitable get_or_load for coroutine loaders. Only in-process hits are answered on the
+# event loop; lookups in a shared store run on a worker thread.
+async def get_or_load_async(cache, single_flight, key, loader, *args, **kwargs):
+    if isinstance(cache, TieredCache) and key not in cache:
+        value = await run_in_threadpool(cache.get, key)
+    else:
+        value = cache.get(key)
+    if value is not None:
+        return value
+
+    async def load():
+        return await fill_async(cache, key, loader, *args, **kwargs)
+
+    return await single_flight.do(key, load)
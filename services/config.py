@@ -0,0 +1,17 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file once for every service, so settings read at
+# import time (cache sizes, rate limits) see it too
+load_dotenv()
+
+# Raised when a required setting such as an API key is missing
+class MissingSettingError(RuntimeError):
+    pass
+
+# Read a required setting when it is first needed, so modules import without credentials
+def require_setting(name):
+    value = os.environ.get(name)
+    if not value:
+        raise MissingSettingError(f"{name} is not set; add it to the environment or the .env file.")
+    return value
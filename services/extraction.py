@@ -0,0 +1,339 @@
+import re
+import copy
+import difflib
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from services.cache import TieredCache, make_cache, SingleFlight, AsyncSingleFlight
+from services.openai_helper import (
+    get_chatgpt_response,
+    get_chatgpt_response_async,
+    get_structured_response,
+    get_structured_response_async
+)
+from services.metrics import register_cache
+from services.trip_parser import (
+    DESTINATION_MARKERS, FAST_PATH_ENABLED, FILLER_WORDS, ORIGIN_MARKERS, fast_path_stats, parse_trip
+)
+
+# Extraction results are cached for a day; near-duplicate matching is opt-in through
+# EXTRACTION_FUZZY_MATCH with a similarity threshold of EXTRACTION_FUZZY_THRESHOLD
+EXTRACTION_CACHE_TTL = int(os.environ.get("EXTRACTION_CACHE_TTL", 24 * 60 * 60))
+EXTRACTION_CACHE_SIZE = int(os.environ.get("EXTRACTION_CACHE_SIZE", 4096))
+EXTRACTION_FUZZY_MATCH = os.environ.get("EXTRACTION_FUZZY_MATCH", "").lower() in ("1", "true", "yes")
+EXTRACTION_FUZZY_THRESHOLD = float(os.environ.get("EXTRACTION_FUZZY_THRESHOLD", 0.9))
+
+# Trip extraction uses the API's JSON-schema mode unless EXTRACTION_STRUCTURED_OUTPUT is off.
+# A complete reply takes about 120 tokens; EXTRACTION_MAX_TOKENS caps runaway answers.
+STRUCTURED_EXTRACTION = os.environ.get("EXTRACTION_STRUCTURED_OUTPUT", "1").lower() not in ("0", "false", "no")
+EXTRACTION_MAX_TOKENS = int(os.environ.get("EXTRACTION_MAX_TOKENS", 256))
+
+# Schema of a structured trip extraction, in the same shape as the free-form JSON reply
+class NearestAirportCity(BaseModel):
+    name: str
+    code: Optional[str]
+
+class Place(BaseModel):
+    name: str
+    city: bool
+    code: Optional[str]
+    nearest: NearestAirportCity
+
+class TripExtraction(BaseModel):
+    origin: Place
+    destination: Place
+    start_date: str
+    end_date: str
+    description: str
+
+# Fixed instructions for structured trip extraction. They are sent first and never change,
+# so the provider can serve them from its prompt-prefix cache; only the short user message varies.
+TRIP_EXTRACTION_INSTRUCTIONS = """Extract the trip in the user's message.
+origin, destination: name as written; city: whether it is a city; code: its IATA code or null; \
+nearest: the nearest city with an airport and its IATA code.
+start_date, end_date: YYYY-MM-DD, taking a missing year or month from the current date given.
+description: like 'Here is your trip plan to Rome from November 1st to November 10th.'"""
+
+# Messages for a structured trip extraction
+def build_trip_messages(user_input, current_year, current_month):
+    return [
+        {"role": "system", "content": TRIP_EXTRACTION_INSTRUCTIONS},
+        {"role": "user", "content": f"Current date: {current_year}-{current_month:02d}\n{user_input}"},
+    ]
+
+# Prepare the prompt for ChatGPT to parse trip information from user input
+def build_trip_prompt(user_input, current_year, current_month):
+    return f"""
+    Given the trip context, perform the following:
+    1. Extract destination, origin, start date, and end date.
+    2. Convert dates to YYYY-MM-DD. If year is missing, use '{current_year}'; if month is missing, use '{current_month}'.
+    3. Determine if origin and destination are valid cities (boolean).
+    4. Attempt to convert them to IATA codes. If not possible, return None.
+    5. Provide the nearest city with an airport as 'nearest'.
+    6. Provide a summary in this format: 'Here is your trip plan to Rome from November 1st to November 10th.'
+
+    CONTEXT:
+    {user_input}
+
+    Return response in the following JSON format:
+    {{
+        "destination": {{
+            "name": str,
+            "city": bool,
+            "code": str,
+            "nearest": {{
+                "name": str,
+                "code": str
+            }}
+        }},
+        "origin": {{
+            "name": str,
+            "city": bool,
+            "code": str,
+            "nearest": {{
+                "name": str,
+                "code": str
+            }}
+        }},
+        "start_date": str,
+        "end_date": str,
+        "description": str
+    }}
+    """
+
+# Prepare the prompt for ChatGPT to parse a multi-city itinerary from user input
+def build_multi_city_prompt(user_input, current_year, current_month):
+    return f"""
+    Given the trip context, perform the following:
+    1. Extract every stop of the itinerary in travel order, starting with the origin. If the traveler returns home, repeat the origin as the last stop.
+    2. Extract the departure date of each leg between consecutive stops, and the last day of the trip.
+    3. Convert dates to YYYY-MM-DD. If year is missing, use '{current_year}'; if month is missing, use '{current_month}'.
+    4. Determine if each stop is a valid city (boolean).
+    5. Attempt to convert them to IATA codes. If not possible, return None.
+    6. Provide the nearest city with an airport as 'nearest'.
+    7. Provide a summary in this format: 'Here is your trip plan to Paris and Rome from November 1st to November 10th.'
+
+    CONTEXT:
+    {user_input}
+
+    Return response in the following JSON format:
+    {{
+        "stops": [
+            {{
+                "name": str,
+                "city": bool,
+                "code": str,
+                "nearest": {{
+                    "name": str,
+                    "code": str
+                }}
+            }}
+        ],
+        "departure_dates": [str],
+        "end_date": str,
+        "description": str
+    }}
+    """
+
+# Filler words that still decide which city is the origin and which the destination
+DIRECTION_WORDS = ORIGIN_MARKERS | DESTINATION_MARKERS | {"back", "return", "returning"}
+
+# Normalize user input so trivially different phrasings share a cache key
+def normalize_input(user_input):
+    text = re.sub(r"[^\w\s-]", " ", user_input.casefold())
+    return " ".join(text.split())
+
+# Cache of parsed ChatGPT extractions keyed on normalized input and the date context
+# the prompt injects, with an optional fuzzy lookup over inputs that differ only in filler words.
+# Entries are kept in the configured cache backend under name; fuzzy candidates stay local.
+class ExtractionCache:
+    def __init__(self, maxsize=EXTRACTION_CACHE_SIZE, ttl=EXTRACTION_CACHE_TTL,
+                 fuzzy=EXTRACTION_FUZZY_MATCH, threshold=EXTRACTION_FUZZY_THRESHOLD,
+                 name="extraction", backend=None):
+        self.entries = make_cache(name, maxsize, ttl, backend=backend)
+        self.fuzzy = fuzzy
+        self.threshold = threshold
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self._candidates = {}
+        self._lock = threading.Lock()
+
+    # Inputs can only be fuzzy matches if they carry the same date context and the same
+    # words apart from filler, in order: cities, months, numbers, the words that say which
+    # way the trip goes and anything else that changes it. "Jan 10-20" never matches
+    # "Jan 11-20", "Paris" never matches "Parma", and "to Paris from Rome" never matches
+    # "from Paris to Rome".
+    @staticmethod
+    def _bucket(normalized, current_year, current_month):
+        words = tuple(word for word in normalized.split() if word not in FILLER_WORDS or word in DIRECTION_WORDS)
+        return (current_year, current_month, words)
+
+    def _fuzzy_get(self, normalized, bucket):
+        with self._lock:
+            candidates = list(self._candidates.get(bucket, ()))
+        for candidate in candidates:
+            if difflib.SequenceMatcher(None, normalized, candidate).ratio() < self.threshold:
+                continue
+            value = self.entries.get((bucket[0], bucket[1], candidate))
+            if value is not None:
+                return value
+            with self._lock:
+                if candidate in self._candidates.get(bucket, ()):
+                    self._candidates[bucket].remove(candidate)
+        return None
+
+    def get(self, user_input, current_year, current_month):
+        normalized = normalize_input(user_input)
+        value = self.entries.get((current_year, current_month, normalized))
+        if value is not None:
+            self.exact_hits += 1
+            return copy.deepcopy(value)
+        if self.fuzzy:
+            value = self._fuzzy_get(normalized, self._bucket(normalized, current_year, current_month))
+            if value is not None:
+                self.fuzzy_hits += 1
+                return copy.deepcopy(value)
+        self.misses += 1
+        return None
+
+    def set(self, user_input, current_year, current_month, value):
+        normalized = normalize_input(user_input)
+        self.entries.set((current_year, current_month, normalized), copy.deepcopy(value))
+        if self.fuzzy:
+            bucket = self._bucket(normalized, current_year, current_month)
+            with self._lock:
+                candidates = self._candidates.setdefault(bucket, [])
+                if normalized not in candidates:
+                    candidates.append(normalized)
+                    del candidates[:-32]
+
+    # True when lookups may go over the network or to disk
+    @property
+    def shared(self):
+        return isinstance(self.entries, TieredCache)
+
+    def clear(self):
+        self.entries.clear()
+        with self._lock:
+            self._candidates.clear()
+
+    # Hit/miss counters, for monitoring
+    def stats(self):
+        lookups = self.exact_hits + self.fuzzy_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            "size": len(self.entries),
+        }
+
+extraction_cache = ExtractionCache()
+extraction_requests = SingleFlight()
+multi_city_cache = ExtractionCache(name="multi_city_extraction")
+multi_city_requests = SingleFlight()
+extraction_tasks = AsyncSingleFlight()
+multi_city_tasks = AsyncSingleFlight()
+register_cache("extraction", extraction_cache)
+register_cache("multi_city_extraction", multi_city_cache)
+
+# Ask ChatGPT to parse a trip, validated against TripExtraction in structured mode
+def request_trip(user_input, current_year, current_month):
+    if STRUCTURED_EXTRACTION:
+        messages = build_trip_messages(user_input, current_year, current_month)
+        return get_structured_response(messages, TripExtraction, EXTRACTION_MAX_TOKENS)
+    return get_chatgpt_response(build_trip_prompt(user_input, current_year, current_month))
+
+async def request_trip_async(user_input, current_year, current_month):
+    if STRUCTURED_EXTRACTION:
+        messages = build_trip_messages(user_input, current_year, current_month)
+        return await get_structured_response_async(messages, TripExtraction, EXTRACTION_MAX_TOKENS)
+    return await get_chatgpt_response_async(build_trip_prompt(user_input, current_year, current_month))
+
+def request_multi_city(user_input, current_year, current_month):
+    return get_chatgpt_response(build_multi_city_prompt(user_input, current_year, current_month))
+
+async def request_multi_city_async(user_input, current_year, current_month):
+    return await get_chatgpt_response_async(build_multi_city_prompt(user_input, current_year, current_month))
+
+# Ask ChatGPT to parse user input with the given request function, answering repeated or
+# equivalent requests from the cache and sharing one call between identical concurrent misses
+def ask_chatgpt(cache, single_flight, request, user_input, now):
+    current_year, current_month = now.year, now.month
+
+    cached = cache.get(user_input, current_year, current_month)
+    if cached is not None:
+        return cached
+
+    def load():
+        chatgpt_response = request(user_input, current_year, current_month)
+        if isinstance(chatgpt_response, dict):
+            cache.set(user_input, current_year, current_month, chatgpt_response)
+        return chatgpt_response
+
+    key = (current_year, current_month, normalize_input(user_input))
+    return copy.deepcopy(single_flight.do(key, load))
+
+# Awaitable ask_chatgpt; a shared cache is read and written on a worker thread
+async def ask_chatgpt_async(cache, single_flight, request, user_input, now):
+    current_year, current_month = now.year, now.month
+
+    if cache.shared:
+        cached = await run_in_threadpool(cache.get, user_input, current_year, current_month)
+    else:
+        cached = cache.get(user_input, current_year, current_month)
+    if cached is not None:
+        return cached
+
+    async def load():
+        chatgpt_response = await request(user_input, current_year, current_month)
+        if isinstance(chatgpt_response, dict):
+            if cache.shared:
+                await run_in_threadpool(cache.set, user_input, current_year, current_month, chatgpt_response)
+            else:
+                cache.set(user_input, current_year, current_month, chatgpt_response)
+        return chatgpt_response
+
+    key = (current_year, current_month, normalize_input(user_input))
+    return copy.deepcopy(await single_flight.do(key, load))
+
+# Extract origin, destination, dates and description from user input. Well-formed input
+# is parsed locally; otherwise ChatGPT is asked, answering repeated or equivalent
+# requests from the extraction cache
+def extract_trip(user_input, now=None):
+    now = now or datetime.now()
+
+    if FAST_PATH_ENABLED:
+        parsed = parse_trip(user_input, now)
+        fast_path_stats.record(parsed is not None)
+        if parsed is not None:
+            return parsed
+
+    return ask_chatgpt(extraction_cache, extraction_requests, request_trip, user_input, now)
+
+# Extract the ordered stops, leg departure dates, end date and description of a
+# multi-city itinerary from user input
+def extract_multi_city_trip(user_input, now=None):
+    now = now or datetime.now()
+    return ask_chatgpt(multi_city_cache, multi_city_requests, request_multi_city, user_input, now)
+
+# Awaitable extract_trip
+async def extract_trip_async(user_input, now=None):
+    now = now or datetime.now()
+
+    if FAST_PATH_ENABLED:
+        parsed = parse_trip(user_input, now)
+        fast_path_stats.record(parsed is not None)
+        if parsed is not None:
+            return parsed
+
+    return await ask_chatgpt_async(extraction_cache, extraction_tasks, request_trip_async, user_input, now)
+
+# Awaitable extract_multi_city_trip
+async def extract_multi_city_trip_async(user_input, now=None):
+    now = now or datetime.now()
+    return await ask_chatgpt_async(multi_city_cache, multi_city_tasks, request_multi_city_async, user_input, now)
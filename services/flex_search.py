@@ -0,0 +1,70 @@
+from datetime import timedelta
+from services.ranking import offer_criteria
+
+# Dates within ±flex_days of a date, as "YYYY-MM-DD", skipping any before earliest
+def date_window(center_date, flex_days, earliest=None):
+    dates = []
+    for offset in range(-flex_days, flex_days + 1):
+        day = (center_date + timedelta(days=offset)).date()
+        if earliest is None or day >= earliest:
+            dates.append(day.strftime("%Y-%m-%d"))
+    return dates
+
+# Cheapest and shortest one-way offer of a search, each as its own price, currency and duration
+def _best_one_way(offers):
+    priced = [(offer_criteria(offer), offer.currency) for offer in offers]
+    priced = [(criteria, currency) for criteria, currency in priced if criteria[0] != float("inf")]
+    if not priced:
+        return None
+    cheapest = min(priced, key=lambda item: (item[0][0], item[0][1]))
+    shortest = min(priced, key=lambda item: (item[0][1], item[0][0]))
+    return {
+        kind: {"price": criteria[0], "currency": currency, "duration": criteria[1]}
+        for kind, (criteria, currency) in (("cheapest", cheapest), ("shortest", shortest))
+    }
+
+# Price and duration of flying one offer out and another back, or None when they are priced
+# in different currencies and cannot be added up
+def _round_trip(departure, arrival):
+    if departure["currency"] != arrival["currency"]:
+        return None
+    return {
+        "price": round(departure["price"] + arrival["price"], 2),
+        "currency": departure["currency"],
+        "duration_minutes": departure["duration"] + arrival["duration"],
+    }
+
+# The dates and option of the cell whose option of the given kind ranks first
+def _best_cell(cells, kind, rank):
+    candidates = [cell for cell in cells if cell[kind] is not None]
+    if not candidates:
+        return None
+    cell = min(candidates, key=lambda cell: rank(cell[kind]))
+    return {"departure_date": cell["departure_date"], "return_date": cell["return_date"], **cell[kind]}
+
+# Combine one-way searches per departure date and per return date into a price calendar
+# over every (departure, return) pair. Searching each direction once per date needs
+# 2 * (2N + 1) upstream calls instead of (2N + 1) ** 2 round-trip searches; prices are the
+# sum of the cheapest one-way fares, so they are indicative rather than bookable together.
+# Each cell holds a "cheapest" and a "shortest" option, each made of real offers, so a
+# price always comes with the duration of the same flights. Options whose directions are
+# priced in different currencies are left out.
+def build_price_calendar(outbound_offers, return_offers):
+    outbound = {day: _best_one_way(offers) for day, offers in outbound_offers.items()}
+    inbound = {day: _best_one_way(offers) for day, offers in return_offers.items()}
+
+    cells = []
+    for departure_date, departure_best in sorted(outbound.items()):
+        for return_date, return_best in sorted(inbound.items()):
+            if departure_best is None or return_best is None or return_date < departure_date:
+                continue
+            options = {kind: _round_trip(departure_best[kind], return_best[kind]) for kind in ("cheapest", "shortest")}
+            if options["cheapest"] is None and options["shortest"] is None:
+                continue
+            cells.append({"departure_date": departure_date, "return_date": return_date, **options})
+
+    return {
+        "cells": cells,
+        "cheapest": _best_cell(cells, "cheapest", lambda option: (option["price"], option["duration_minutes"])),
+        "shortest": _best_cell(cells, "shortest", lambda option: (option["duration_minutes"], option["price"])),
+    }
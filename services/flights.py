@@ -1,111 +1,202 @@
 import os
-import requests
-from dotenv import load_dotenv
-from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from amadeus import Location, Client
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Initialize Amadeus API credentials
-AMADEUS_CLIENT_ID = os.environ["AMADEUS_CLIENT_ID"]
-AMADEUS_CLIENT_SECRET = os.environ["AMADEUS_CLIENT_SECRET"]
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from services.config import require_setting
+from services.amadeus_client import AmadeusClientManager
+from services.cache import CACHE_BACKEND, make_cache, SingleFlight, get_or_load
+from services.offers import as_offer, as_segment, pack_offers, parse_offer, unpack_offers
+from services.rate_limit import governed
+from services.metrics import register_cache
+
+# Location search subtype matching airports and cities (amadeus.Location.ANY)
+LOCATION_ANY = "AIRPORT,CITY"
+
+# Shared Amadeus client with pooled connections and a reused access token; the credentials
+# are read from AMADEUS_CLIENT_ID and AMADEUS_CLIENT_SECRET when it is first used
+amadeus_clients = AmadeusClientManager(
+    lambda: require_setting("AMADEUS_CLIENT_ID"),
+    lambda: require_setting("AMADEUS_CLIENT_SECRET")
+)
 
 # Initialize Amadeus API client
 def get_amadeus_client():
-    return Client(client_id=AMADEUS_CLIENT_ID, client_secret=AMADEUS_CLIENT_SECRET)
+    return amadeus_clients.get_client()
 
 # Helper function to fetch location data from Amadeus API
-def get_location(keyword, subType=Location.ANY):
+@governed("amadeus")
+def get_location(keyword, subType=LOCATION_ANY):
     amadeus = get_amadeus_client()
     return amadeus.reference_data.locations.get(keyword=keyword, subType=subType)
 
 # Helper function to fetch cities data from Amadeus API
+@governed("amadeus")
 def get_cities(keyword):
     amadeus = get_amadeus_client()
     return amadeus.reference_data.locations.cities.get(keyword=keyword)
 
-# Get IATA code for a city name
-def get_iata_code(city_name):
-    location_response = get_location(city_name, subType=Location.ANY)
+# Look up the IATA code for a city name on Amadeus
+def lookup_iata_code(city_name):
+    location_response = get_location(city_name, subType=LOCATION_ANY)
     if location_response.status_code == 200:
         locations = location_response.result.get("data", [])
         if locations:
             return locations[0]["iataCode"]
     raise HTTPException(status_code=404, detail=f"IATA code for {city_name} not found")
 
-# Get city and country from IATA code
-def get_city_country_from_iata(iata_code):
-    try:
-        location_response = get_location(iata_code, subType=Location.ANY)
-        if location_response.status_code == 200:
+# Airport metadata almost never changes, so resolved codes are kept for 30 days
+# (unknown codes for a day) in memory and in a store shared by all workers: the configured
+# cache backend, or an on-disk one when that is "memory" (override with AIRPORT_CACHE_BACKEND)
+AIRPORT_CACHE_TTL = 30 * 24 * 60 * 60
+AIRPORT_NOT_FOUND_TTL = 24 * 60 * 60
+AIRPORT_CACHE_BACKEND = os.environ.get("AIRPORT_CACHE_BACKEND", "sqlite" if CACHE_BACKEND == "memory" else CACHE_BACKEND)
+airport_cache = make_cache("airports", 4096, AIRPORT_CACHE_TTL, backend=AIRPORT_CACHE_BACKEND)
+iata_code_cache = make_cache("iata_codes", 4096, AIRPORT_CACHE_TTL)
+iata_code_lookups = SingleFlight()
+register_cache("airports", airport_cache)
+register_cache("iata_codes", iata_code_cache)
+
+def iata_code_key(city_name):
+    return " ".join(city_name.casefold().split())
+
+# Get IATA code for a city name, sharing lookups for the same city
+def get_iata_code(city_name):
+    return get_or_load(iata_code_cache, iata_code_lookups, iata_code_key(city_name), lookup_iata_code, city_name)
+
+# Seed the IATA code cache with a code known without asking Amadeus, e.g. from the gazetteer
+def remember_iata_code(city_name, code):
+    iata_code_cache.set(iata_code_key(city_name), code)
+
+# Look up city and country for an IATA code from Amadeus
+def lookup_city_country(iata_code):
+    location_response = get_location(iata_code, subType=LOCATION_ANY)
+    if location_response.status_code == 200:
+        data = location_response.result.get('data', [])
+        if not data:
+            location_response = get_cities(iata_code)
             data = location_response.result.get('data', [])
-            if data:
-                city = data[0]['address']['cityName']
-                country = data[0]['address']['countryCode']
-                return city, country
-            else:
-                location_response = get_cities(iata_code)
-                data = location_response.result.get('data', [])
-                if data:
-                    city = data[0]['address']['cityName']
-                    country = data[0]['address']['countryCode']
-                    return city, country
-        return None, None
+        if data:
+            city = data[0]['address']['cityName']
+            country = data[0]['address']['countryCode']
+            return city, country
+    return None, None
 
+# Get city and country from IATA code, served from the airport cache when possible
+def get_city_country_from_iata(iata_code):
+    cached = airport_cache.get(iata_code)
+    if cached is not None:
+        return tuple(cached)
+
+    try:
+        city, country = lookup_city_country(iata_code)
     except Exception:
         return None, None
 
-# Get flight offers between origin and destination
-def get_flights(origin_iata, destination_iata, departure_date, return_date):
+    ttl = AIRPORT_CACHE_TTL if city else AIRPORT_NOT_FOUND_TTL
+    airport_cache.set(iata_code, [city, country], ttl)
+    return city, country
+
+# Airports missing from the in-memory cache are looked up this many at a time
+AIRPORT_LOOKUP_CONCURRENCY = int(os.environ.get("AIRPORT_LOOKUP_CONCURRENCY", 8))
+
+# Resolve city and country for many IATA codes at once. Each unique code is resolved once;
+# codes missing from memory are looked up concurrently, the rest answered from the cache.
+def resolve_airports(iata_codes):
+    codes = list(dict.fromkeys(iata_codes))
+    fetched = {}
+    misses = [code for code in codes if code not in airport_cache]
+    if len(misses) > 1:
+        # Each lookup runs in a copy of the caller's context, keeping its priority and trace
+        with ThreadPoolExecutor(max_workers=min(len(misses), AIRPORT_LOOKUP_CONCURRENCY)) as pool:
+            lookups = [pool.submit(contextvars.copy_context().run, get_city_country_from_iata, code) for code in misses]
+            fetched = {code: lookup.result() for code, lookup in zip(misses, lookups)}
+    return {code: fetched[code] if code in fetched else get_city_country_from_iata(code) for code in codes}
+
+# Flight-offer searches are cached per route and dates; override the window and size with
+# FLIGHT_CACHE_TTL (seconds) and FLIGHT_CACHE_SIZE (entries)
+FLIGHT_CACHE_TTL = int(os.environ.get("FLIGHT_CACHE_TTL", 600))
+FLIGHT_CACHE_SIZE = int(os.environ.get("FLIGHT_CACHE_SIZE", 512))
+flight_cache = make_cache(
+    "flights", FLIGHT_CACHE_SIZE, FLIGHT_CACHE_TTL, encode=pack_offers, decode=unpack_offers
+)
+flight_searches = SingleFlight()
+register_cache("flights", flight_cache)
+
+# Get flight offers between origin and destination (one-way when return_date is None)
+@governed("amadeus")
+def get_flights(origin_iata, destination_iata, departure_date, return_date, adults=1):
     amadeus = get_amadeus_client()
-    flight_response = amadeus.shopping.flight_offers_search.get(
-        originLocationCode=origin_iata,
-        destinationLocationCode=destination_iata,
-        departureDate=departure_date,
-        returnDate=return_date,
-        adults=1
-    )
+    params = {
+        "originLocationCode": origin_iata,
+        "destinationLocationCode": destination_iata,
+        "departureDate": departure_date,
+        "adults": adults
+    }
+    # One-way searches leave out the return date
+    if return_date is not None:
+        params["returnDate"] = return_date
+    flight_response = amadeus.shopping.flight_offers_search.get(**params)
     return flight_response.result.get("data", [])
 
+# Search and parse flight offers into compact FlightOffers. The raw response is ours alone,
+# so each raw dict is dropped from it once parsed and can be freed early.
+def search_flight_offers(origin_iata, destination_iata, departure_date, return_date, adults=1):
+    raw_offers = get_flights(origin_iata, destination_iata, departure_date, return_date, adults)
+    offers = []
+    raw_offers.reverse()
+    while raw_offers:
+        offers.append(parse_offer(raw_offers.pop()))
+    return offers
+
+# Get compact flight offers between origin and destination, sharing one upstream search
+# per route and dates across the cache window and concurrent identical requests
+def get_flight_offers(origin_iata, destination_iata, departure_date, return_date, adults=1):
+    key = (origin_iata.upper(), destination_iata.upper(), departure_date, return_date, adults)
+    return get_or_load(
+        flight_cache, flight_searches, key,
+        search_flight_offers, origin_iata, destination_iata, departure_date, return_date, adults
+    )
+
 # Find the flight with the fewest segments for each direction
 def find_flight_with_smallest_segments(flight_offers):
     departure_flight = None
     return_flight = None
 
     for flight_offer in flight_offers:
-        itineraries = flight_offer.get("itineraries", [])
-        for i, itinerary in enumerate(itineraries):
-            direction = "Departure" if i == 0 else "Return"
-            segments = itinerary["segments"]
-
-            if direction == 'Departure':
+        for i, itinerary in enumerate(as_offer(flight_offer).itineraries):
+            segments = itinerary.segments
+            if i == 0:
                 if departure_flight is None or len(segments) < len(departure_flight):
                     departure_flight = segments
-            elif direction == 'Return':
-                if return_flight is None or len(segments) < len(return_flight):
-                    return_flight = segments
+            elif return_flight is None or len(segments) < len(return_flight):
+                return_flight = segments
     return {"Departure": departure_flight, "Return": return_flight}
 
-# Format flight offer details into a user-friendly structure
+# Format a departure time as "December 25"
+def format_date(date_obj):
+    return date_obj.strftime("%B %d").replace(" 0", " ")
+
+# Format flight offer details into a user-friendly structure. The airports of every
+# segment in every direction are resolved in one batch before rendering.
 def format_flight_offer(shortest_flight):
-    # Helper function to format date into a readable string
-    def format_date(date_str):
-        date_obj = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
-        return date_obj.strftime("%B %d").replace(" 0", " ").replace(
-            "1 ", "1st ").replace("2 ", "2nd ").replace("3 ", "3rd ").replace("21 ", "21st ").replace("22 ", "22nd ").replace("23 ", "23rd ")
+    directions = {direction: list(map(as_segment, segments)) for direction, segments in shortest_flight.items()}
+    airports = resolve_airports(
+        code
+        for segments in directions.values()
+        for segment in segments
+        for code in (segment.departure_iata, segment.arrival_iata)
+    )
 
     flight_dict = {}
-    for direction, segments in shortest_flight.items():
+    for direction, segments in directions.items():
         flights = []
         for segment in segments:
-            flight_num = f"{segment['carrierCode']}{segment['number']}"
-            departure_airport_code = segment["departure"]["iataCode"]
-            arrival_airport_code = segment["arrival"]["iataCode"]
-            departure_city, departure_country = get_city_country_from_iata(departure_airport_code)
-            arrival_city, arrival_country = get_city_country_from_iata(arrival_airport_code)
-            departure_date = format_date(segment["departure"]["at"])
+            flight_num = f"{segment.carrier_code}{segment.number}"
+            departure_airport_code = segment.departure_iata
+            arrival_airport_code = segment.arrival_iata
+            departure_city, departure_country = airports[departure_airport_code]
+            arrival_city, arrival_country = airports[arrival_airport_code]
+            departure_date = format_date(segment.departure_at)
 
             # Format flight path description
             if departure_city and arrival_city:
@@ -116,7 +207,7 @@ def format_flight_offer(shortest_flight):
             flights.append(
                 f"Flight {flight_num} departing on {departure_date} {flight_path}"
             )
-        
+
         flight_dict[direction] = flights
 
     return flight_dict
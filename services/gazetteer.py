@@ -0,0 +1,93 @@
+import re
+from collections import namedtuple
+
+# A city with an airport, identified by its IATA city (metropolitan area) code
+City = namedtuple("City", ["name", "code", "country"])
+
+# Bundled index of frequently requested cities and the aliases users write them as
+CITIES = [
+    (City("New York", "NYC", "US"), ["new york", "new york city", "nyc", "ny"]),
+    (City("Los Angeles", "LAX", "US"), ["los angeles"]),
+    (City("San Francisco", "SFO", "US"), ["san francisco", "sf"]),
+    (City("Chicago", "CHI", "US"), ["chicago"]),
+    (City("Boston", "BOS", "US"), ["boston"]),
+    (City("Washington", "WAS", "US"), ["washington", "washington dc", "dc"]),
+    (City("Miami", "MIA", "US"), ["miami"]),
+    (City("Las Vegas", "LAS", "US"), ["las vegas", "vegas"]),
+    (City("Seattle", "SEA", "US"), ["seattle"]),
+    (City("Orlando", "ORL", "US"), ["orlando"]),
+    (City("Atlanta", "ATL", "US"), ["atlanta"]),
+    (City("Dallas", "DFW", "US"), ["dallas"]),
+    (City("Houston", "HOU", "US"), ["houston"]),
+    (City("Denver", "DEN", "US"), ["denver"]),
+    (City("Toronto", "YTO", "CA"), ["toronto"]),
+    (City("Montreal", "YMQ", "CA"), ["montreal"]),
+    (City("Vancouver", "YVR", "CA"), ["vancouver"]),
+    (City("Mexico City", "MEX", "MX"), ["mexico city"]),
+    (City("Cancun", "CUN", "MX"), ["cancun"]),
+    (City("Sao Paulo", "SAO", "BR"), ["sao paulo"]),
+    (City("Rio de Janeiro", "RIO", "BR"), ["rio de janeiro", "rio"]),
+    (City("Buenos Aires", "BUE", "AR"), ["buenos aires"]),
+    (City("London", "LON", "GB"), ["london"]),
+    (City("Paris", "PAR", "FR"), ["paris"]),
+    (City("Rome", "ROM", "IT"), ["rome", "roma"]),
+    (City("Milan", "MIL", "IT"), ["milan", "milano"]),
+    (City("Venice", "VCE", "IT"), ["venice"]),
+    (City("Madrid", "MAD", "ES"), ["madrid"]),
+    (City("Barcelona", "BCN", "ES"), ["barcelona"]),
+    (City("Lisbon", "LIS", "PT"), ["lisbon"]),
+    (City("Amsterdam", "AMS", "NL"), ["amsterdam"]),
+    (City("Brussels", "BRU", "BE"), ["brussels"]),
+    (City("Berlin", "BER", "DE"), ["berlin"]),
+    (City("Munich", "MUC", "DE"), ["munich"]),
+    (City("Frankfurt", "FRA", "DE"), ["frankfurt"]),
+    (City("Zurich", "ZRH", "CH"), ["zurich"]),
+    (City("Geneva", "GVA", "CH"), ["geneva"]),
+    (City("Vienna", "VIE", "AT"), ["vienna"]),
+    (City("Prague", "PRG", "CZ"), ["prague"]),
+    (City("Budapest", "BUD", "HU"), ["budapest"]),
+    (City("Warsaw", "WAW", "PL"), ["warsaw"]),
+    (City("Copenhagen", "CPH", "DK"), ["copenhagen"]),
+    (City("Stockholm", "STO", "SE"), ["stockholm"]),
+    (City("Oslo", "OSL", "NO"), ["oslo"]),
+    (City("Helsinki", "HEL", "FI"), ["helsinki"]),
+    (City("Dublin", "DUB", "IE"), ["dublin"]),
+    (City("Edinburgh", "EDI", "GB"), ["edinburgh"]),
+    (City("Athens", "ATH", "GR"), ["athens"]),
+    (City("Istanbul", "IST", "TR"), ["istanbul"]),
+    (City("Tel Aviv", "TLV", "IL"), ["tel aviv", "tel-aviv", "tlv"]),
+    (City("Dubai", "DXB", "AE"), ["dubai"]),
+    (City("Cairo", "CAI", "EG"), ["cairo"]),
+    (City("Cape Town", "CPT", "ZA"), ["cape town"]),
+    (City("Johannesburg", "JNB", "ZA"), ["johannesburg"]),
+    (City("Delhi", "DEL", "IN"), ["delhi", "new delhi"]),
+    (City("Mumbai", "BOM", "IN"), ["mumbai", "bombay"]),
+    (City("Bangkok", "BKK", "TH"), ["bangkok"]),
+    (City("Singapore", "SIN", "SG"), ["singapore"]),
+    (City("Hong Kong", "HKG", "HK"), ["hong kong"]),
+    (City("Beijing", "BJS", "CN"), ["beijing"]),
+    (City("Shanghai", "SHA", "CN"), ["shanghai"]),
+    (City("Tokyo", "TYO", "JP"), ["tokyo"]),
+    (City("Osaka", "OSA", "JP"), ["osaka"]),
+    (City("Seoul", "SEL", "KR"), ["seoul"]),
+    (City("Sydney", "SYD", "AU"), ["sydney"]),
+    (City("Melbourne", "MEL", "AU"), ["melbourne"]),
+    (City("Auckland", "AKL", "NZ"), ["auckland"]),
+]
+
+# Alias lookup and a single compiled pattern matching any alias, longest first
+CITY_ALIASES = {alias: city for city, aliases in CITIES for alias in aliases}
+CITY_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(alias) for alias in sorted(CITY_ALIASES, key=len, reverse=True)) + r")\b"
+)
+
+# Look up a city by name or alias
+def lookup_city(name):
+    return CITY_ALIASES.get(" ".join(name.casefold().split()))
+
+# Find every city mentioned in text as (city, start, end) spans
+def find_cities(text):
+    return [
+        (CITY_ALIASES[match.group(1)], match.start(), match.end())
+        for match in CITY_PATTERN.finditer(text.casefold())
+    ]
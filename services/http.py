@@ -0,0 +1,56 @@
+import os
+import asyncio
+import weakref
+import threading
+import importlib.util
+
+# Connection pool limits and timeouts (seconds) for the shared async HTTP client
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+
+# HTTP/2 is used when the h2 package is installed (httpx[http2]) unless HTTP2 turns it off
+HTTP2 = os.environ.get("HTTP2", "auto").lower()
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None if HTTP2 == "auto" else HTTP2 in ("1", "true", "yes")
+
+# Async clients hold connections bound to the event loop that opened them, so each running
+# loop gets its own set: {loop: {name: client}}
+_loop_clients = weakref.WeakKeyDictionary()
+_lock = threading.RLock()
+
+# Return the client registered under name for the running loop, creating it on first use
+def loop_client(name, factory):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _loop_clients.setdefault(loop, {})
+        if name not in clients:
+            clients[name] = factory()
+        return clients[name]
+
+def create_async_client():
+    import httpx
+
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    )
+
+# Shared keep-alive httpx.AsyncClient for the running loop
+def get_async_client():
+    return loop_client("http", create_async_client)
+
+# Close every client opened on the running loop, on application shutdown
+async def close_async_clients():
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _loop_clients.pop(loop, {})
+    for client in clients.values():
+        close = getattr(client, "aclose", None) or client.close
+        await close()
@@ -0,0 +1,187 @@
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Histogram buckets for latencies (seconds) and payload sizes (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+SIZE_BUCKETS = tuple(256 * 4 ** power for power in range(8)) + (math.inf,)
+TOKEN_BUCKETS = tuple(16 * 2 ** power for power in range(10)) + (math.inf,)
+
+# Spans recorded for the current request, or None when the request is not traced
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Metrics and collectors in registration order, rendered by render()
+registry = []
+collectors = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Monotonic counter with labels
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labels, key)), value
+
+# Histogram with cumulative buckets, a sum and a count per label set
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(tuple(labels[name] for name in self.labels), ([0], 0.0))
+        return counts[-1]
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = tuple(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + "_bucket", labels + (("le", _number(bound)),), count
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, counts[-1]
+
+# Register a function returning [(name, type, help, [(labels dict, value), ...]), ...],
+# called on every scrape for values that live elsewhere (cache and governor stats)
+def register_collector(collect):
+    collectors.append(collect)
+    return collect
+
+# Render every metric in the Prometheus text exposition format
+def render():
+    families = {}
+    for metric in registry:
+        families[metric.name] = (metric.type, metric.help, list(metric.samples()))
+    # Collectors of the same metric (one per cache, say) are merged into one family
+    for collect in collectors:
+        for name, kind, help, values in collect():
+            samples = families.setdefault(name, (kind, help, []))[2]
+            samples.extend((name, tuple(labels.items()), value) for labels, value in values)
+
+    lines = []
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+stage_duration = Histogram(
+    "trip_planner_stage_duration_seconds", "Time spent in each planning stage, including retries.", ["stage"]
+)
+upstream_calls = Counter(
+    "trip_planner_upstream_calls_total", "Calls to upstream APIs by outcome.", ["provider", "call", "outcome"]
+)
+upstream_duration = Histogram(
+    "trip_planner_upstream_duration_seconds", "Latency of single upstream API calls.", ["provider", "call"]
+)
+upstream_response_size = Histogram(
+    "trip_planner_upstream_response_bytes", "Size of upstream API response bodies.", ["provider"], SIZE_BUCKETS
+)
+llm_tokens = Histogram(
+    "trip_planner_llm_tokens", "Tokens used per LLM call, by kind (prompt, cached_prompt, completion).",
+    ["call", "kind"], TOKEN_BUCKETS
+)
+speculations = Counter(
+    "trip_planner_speculative_prefetches_total",
+    "Speculative prefetches started while the LLM runs, by whether the extraction confirmed them.",
+    ["outcome"]
+)
+llm_parse_failures = Counter(
+    "trip_planner_llm_parse_failures_total", "LLM responses that did not validate against the expected schema.",
+    ["call"]
+)
+request_duration = Histogram(
+    "trip_planner_request_duration_seconds", "Time to produce a response, per endpoint.", ["path", "status"]
+)
+response_size = Histogram(
+    "trip_planner_response_bytes", "Size of non-streaming response bodies, per endpoint.", ["path"], SIZE_BUCKETS
+)
+
+# Record a span on the current request's trace, if it is being traced
+def record_span(name, started, duration):
+    spans = current_trace.get()
+    if spans is not None:
+        spans.append((name, started, duration))
+
+# Time a block into a histogram and, for traced requests, a span of the same name
+@contextmanager
+def timed(histogram, span, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        histogram.observe(duration, **labels)
+        record_span(span, started, duration)
+
+# Format recorded spans as a Server-Timing header value, durations in milliseconds
+def server_timing(spans):
+    return ", ".join(
+        f"{name.replace(' ', '_')};dur={duration * 1000:.1f}"
+        for name, _, duration in sorted(spans, key=lambda span: span[1])
+    )
+
+# Export hit/miss counters and size of a cache exposing stats()
+def register_cache(name, cache):
+    def collect():
+        stats = cache.stats()
+        hits = stats.get("hits", stats.get("exact_hits", 0) + stats.get("fuzzy_hits", 0))
+        labels = {"cache": name}
+        return [
+            ("trip_planner_cache_hits_total", "counter", "Cache lookups answered from the cache.", [(labels, hits)]),
+            ("trip_planner_cache_misses_total", "counter", "Cache lookups that missed.", [(labels, stats["misses"])]),
+            ("trip_planner_cache_hit_ratio", "gauge", "Share of cache lookups that hit.", [(labels, stats["hit_ratio"])]),
+            ("trip_planner_cache_size", "gauge", "Entries currently cached.", [(labels, stats["size"])]),
+        ]
+    return register_collector(collect)
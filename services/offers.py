@@ -0,0 +1,148 @@
+import re
+import sys
+from datetime import datetime
+
+DURATION_PATTERN = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?")
+
+# Parse an ISO 8601 duration such as "PT7H25M" into minutes
+def parse_duration(duration):
+    match = DURATION_PATTERN.fullmatch(duration or "")
+    if match is None:
+        return None
+    hours, minutes = match.groups()
+    return int(hours or 0) * 60 + int(minutes or 0)
+
+# Parse an Amadeus local timestamp such as "2024-12-25T10:00:00"
+def parse_timestamp(timestamp):
+    return datetime.fromisoformat(timestamp) if timestamp else None
+
+# Intern a code so every offer in a search shares one string object per airport or carrier
+def intern_code(code):
+    return sys.intern(code) if code else code
+
+# One flight segment, keeping only the fields used for ranking and formatting
+class Segment:
+    __slots__ = ("carrier_code", "number", "departure_iata", "arrival_iata", "departure_at", "arrival_at", "duration")
+
+    def __init__(self, carrier_code, number, departure_iata, arrival_iata, departure_at, arrival_at, duration=None):
+        self.carrier_code = carrier_code
+        self.number = number
+        self.departure_iata = departure_iata
+        self.arrival_iata = arrival_iata
+        self.departure_at = departure_at
+        self.arrival_at = arrival_at
+        self.duration = duration
+
+    def __repr__(self):
+        return f"Segment({self.carrier_code}{self.number} {self.departure_iata}->{self.arrival_iata} {self.departure_at})"
+
+# One direction of an offer: its segments in order and total duration in minutes
+class Itinerary:
+    __slots__ = ("segments", "duration")
+
+    def __init__(self, segments, duration=None):
+        self.segments = segments
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    def __repr__(self):
+        return f"Itinerary({list(self.segments)!r})"
+
+# A bookable flight offer: total price and one itinerary per direction
+class FlightOffer:
+    __slots__ = ("id", "price", "currency", "itineraries")
+
+    def __init__(self, id, price, currency, itineraries):
+        self.id = id
+        self.price = price
+        self.currency = currency
+        self.itineraries = itineraries
+
+    # Segments per direction, in the shape format_flight_offer expects
+    def directions(self):
+        names = ("Departure", "Return")
+        return {
+            names[i] if i < len(names) else f"Leg {i + 1}": itinerary.segments
+            for i, itinerary in enumerate(self.itineraries)
+        }
+
+    def __repr__(self):
+        return f"FlightOffer({self.id!r}, {self.price} {self.currency}, {list(self.itineraries)!r})"
+
+# Convert a raw Amadeus segment into a compact Segment
+def parse_segment(raw_segment):
+    departure = raw_segment.get("departure", {})
+    arrival = raw_segment.get("arrival", {})
+    return Segment(
+        intern_code(raw_segment.get("carrierCode")),
+        raw_segment.get("number"),
+        intern_code(departure.get("iataCode")),
+        intern_code(arrival.get("iataCode")),
+        parse_timestamp(departure.get("at")),
+        parse_timestamp(arrival.get("at")),
+        parse_duration(raw_segment.get("duration"))
+    )
+
+# Convert a raw Amadeus itinerary into a compact Itinerary
+def parse_itinerary(raw_itinerary):
+    return Itinerary(
+        tuple(parse_segment(raw_segment) for raw_segment in raw_itinerary.get("segments", [])),
+        parse_duration(raw_itinerary.get("duration"))
+    )
+
+# Convert a raw Amadeus flight offer into a compact FlightOffer
+def parse_offer(raw_offer):
+    price = raw_offer.get("price", {})
+    total = price.get("grandTotal") or price.get("total")
+    return FlightOffer(
+        raw_offer.get("id"),
+        float(total) if total is not None else None,
+        intern_code(price.get("currency")),
+        tuple(parse_itinerary(raw_itinerary) for raw_itinerary in raw_offer.get("itineraries", []))
+    )
+
+# Convert an Amadeus flight-offers response into compact offers
+def parse_offers(raw_offers):
+    return [parse_offer(raw_offer) for raw_offer in raw_offers]
+
+# Accept either a compact FlightOffer or a raw Amadeus offer dict
+def as_offer(offer):
+    return offer if isinstance(offer, FlightOffer) else parse_offer(offer)
+
+# Accept either a compact Segment or a raw Amadeus segment dict
+def as_segment(segment):
+    return segment if isinstance(segment, Segment) else parse_segment(segment)
+
+# Encode compact offers as plain JSON lists for a shared cache, timestamps as ISO strings
+def pack_offers(offers):
+    return [
+        [offer.id, offer.price, offer.currency, [
+            [itinerary.duration, [
+                [segment.carrier_code, segment.number, segment.departure_iata, segment.arrival_iata,
+                 segment.departure_at and segment.departure_at.isoformat(),
+                 segment.arrival_at and segment.arrival_at.isoformat(), segment.duration]
+                for segment in itinerary.segments
+            ]]
+            for itinerary in offer.itineraries
+        ]]
+        for offer in offers
+    ]
+
+# Rebuild compact offers from pack_offers output
+def unpack_offers(packed):
+    return [
+        FlightOffer(offer_id, price, intern_code(currency), tuple(
+            Itinerary(tuple(
+                Segment(intern_code(carrier), number, intern_code(departure), intern_code(arrival),
+                        parse_timestamp(departure_at), parse_timestamp(arrival_at), minutes)
+                for carrier, number, departure, arrival, departure_at, arrival_at, minutes in segments
+            ), duration)
+            for duration, segments in itineraries
+        ))
+        for offer_id, price, currency, itineraries in packed
+    ]
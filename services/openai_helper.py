@@ -1,24 +1,135 @@
-from openai import OpenAI
 import json
-from dotenv import load_dotenv
-load_dotenv()
+import threading
+from pydantic import ValidationError
+# Loads .env, where the OpenAI SDK finds OPENAI_API_KEY
+import services.config
+from services.http import get_async_client, loop_client
+from services.rate_limit import governed
+from services.metrics import llm_parse_failures, llm_tokens, upstream_response_size
 
+CHAT_MODEL = "gpt-4o-mini"
 
-# Helper function to interact with ChatGPT 
-def get_chatgpt_response(prompt):
-    client = OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            # {"role": "system", "content": "You are a helpful assistant."},
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    )
+# Failed calls are retried by the stage retry policies, so the SDK does not retry on its own
+OPENAI_MAX_RETRIES = 0
+
+_client = None
+_client_lock = threading.Lock()
+
+# Process-wide OpenAI client, created on first use. The SDK takes most of a second to
+# import, so it is loaded here rather than at module import.
+def get_openai_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(max_retries=OPENAI_MAX_RETRIES)
+        return _client
+
+# AsyncOpenAI client for the running event loop, sharing its keep-alive connection pool
+def get_async_openai_client():
+    def create():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(max_retries=OPENAI_MAX_RETRIES, http_client=get_async_client())
+    return loop_client("openai", create)
 
+# Drop the shared sync client, e.g. after changing OPENAI_API_KEY or OPENAI_BASE_URL
+def reset_openai_client():
+    global _client
+    with _client_lock:
+        _client = None
+
+def chat_messages(prompt):
+    return [
+        # {"role": "system", "content": "You are a helpful assistant."},
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+# Record the token usage of a completion under the given call name
+def record_usage(call, usage):
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    llm_tokens.observe(usage.prompt_tokens, call=call, kind="prompt")
+    llm_tokens.observe(getattr(details, "cached_tokens", None) or 0, call=call, kind="cached_prompt")
+    llm_tokens.observe(usage.completion_tokens, call=call, kind="completion")
+
+# Parse the JSON content of a chat completion, unwrapping a ```json code fence
+def parse_chatgpt_response(response):
+    record_usage("chat", getattr(response, "usage", None))
     content = response.choices[0].message.content.strip()
+    upstream_response_size.observe(len(content.encode()), provider="openai")
     if content.startswith('```json'):
-        content = '\n'.join(response.choices[0].message.content.strip().split('\n')[1:-1])
+        content = '\n'.join(content.split('\n')[1:-1])
     return json.loads(content)
+
+# Helper function to interact with ChatGPT
+@governed("openai")
+def get_chatgpt_response(prompt):
+    response = get_openai_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=chat_messages(prompt)
+    )
+    return parse_chatgpt_response(response)
+
+# Awaitable variant of get_chatgpt_response that does not block the event loop
+@governed("openai")
+async def get_chatgpt_response_async(prompt):
+    response = await get_async_openai_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=chat_messages(prompt)
+    )
+    return parse_chatgpt_response(response)
+
+# Arguments of a structured-output completion: the reply must match the JSON schema of
+# response_format and may use at most max_tokens tokens
+def structured_request(messages, response_format, max_tokens):
+    return {
+        "model": CHAT_MODEL,
+        "messages": messages,
+        "response_format": response_format,
+        "max_tokens": max_tokens,
+        "temperature": 0,
+    }
+
+# Return the validated reply of a structured-output completion as a dict
+def parse_structured_response(response_format, response):
+    record_usage(response_format.__name__, response.usage)
+    message = response.choices[0].message
+    upstream_response_size.observe(len((message.content or "").encode()), provider="openai")
+    if message.parsed is None:
+        raise ValueError(f"ChatGPT refused to answer: {message.refusal}")
+    return message.parsed.model_dump()
+
+def count_parse_failure(response_format, exc):
+    from openai import LengthFinishReasonError
+
+    if isinstance(exc, (ValidationError, LengthFinishReasonError)):
+        llm_parse_failures.inc(call=response_format.__name__)
+
+# Ask ChatGPT for a reply matching the pydantic model response_format, using the API's
+# JSON-schema mode instead of parsing free-form text
+@governed("openai")
+def get_structured_response(messages, response_format, max_tokens):
+    try:
+        response = get_openai_client().beta.chat.completions.parse(
+            **structured_request(messages, response_format, max_tokens)
+        )
+    except Exception as exc:
+        count_parse_failure(response_format, exc)
+        raise
+    return parse_structured_response(response_format, response)
+
+# Awaitable variant of get_structured_response
+@governed("openai")
+async def get_structured_response_async(messages, response_format, max_tokens):
+    try:
+        response = await get_async_openai_client().beta.chat.completions.parse(
+            **structured_request(messages, response_format, max_tokens)
+        )
+    except Exception as exc:
+        count_parse_failure(response_format, exc)
+        raise
+    return parse_structured_response(response_format, response)
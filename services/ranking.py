@@ -0,0 +1,87 @@
+import heapq
+import math
+
+# Relative importance of each criterion when scoring whole offers
+DEFAULT_WEIGHTS = {
+    "price": 1.0,
+    "duration": 1.0,
+    "stops": 0.5,
+    "layover": 0.25,
+}
+CRITERIA = ("price", "duration", "stops", "layover")
+
+# Minutes between two datetimes
+def _minutes(start, end):
+    return (end - start).total_seconds() / 60
+
+# Criteria of a whole offer across all its itineraries:
+# (price, total duration in minutes, number of stops, total layover in minutes)
+def offer_criteria(offer):
+    duration = stops = layover = 0
+    for itinerary in offer.itineraries:
+        segments = itinerary.segments
+        stops += len(segments) - 1
+        for previous, following in zip(segments, segments[1:]):
+            if previous.arrival_at and following.departure_at:
+                layover += _minutes(previous.arrival_at, following.departure_at)
+        if itinerary.duration is not None:
+            duration += itinerary.duration
+        elif segments and segments[0].departure_at and segments[-1].arrival_at:
+            duration += _minutes(segments[0].departure_at, segments[-1].arrival_at)
+    price = offer.price if offer.price is not None else math.inf
+    return (price, duration, stops, layover)
+
+# Smallest and largest finite value of each criterion across the offers
+def _bounds(criteria):
+    bounds = []
+    for values in zip(*criteria):
+        finite = [value for value in values if math.isfinite(value)]
+        bounds.append((min(finite), max(finite)) if finite else (0.0, 0.0))
+    return bounds
+
+# Weighted score of criteria, each min-max scaled to [0, 1] across the offers so criteria
+# in different units (currency, minutes, stops) are comparable; lower is better
+def _score(criteria, bounds, weights):
+    score = 0.0
+    for name, value, (low, high) in zip(CRITERIA, criteria, bounds):
+        weight = weights.get(name, 0.0)
+        if not weight:
+            continue
+        if not math.isfinite(value):
+            score += weight
+        elif high > low:
+            score += weight * (value - low) / (high - low)
+    return score
+
+# Offers not dominated by any other offer on every criterion, in index order. Offers are
+# visited in lexicographic order of their criteria, so an offer can only be dominated by
+# one visited before it and the front never has to be pruned: O(n log n + n * |front|).
+def _pareto_indexes(criteria):
+    front = []
+    for index in sorted(range(len(criteria)), key=criteria.__getitem__):
+        candidate = criteria[index]
+        if not any(all(a <= b for a, b in zip(criteria[other], candidate)) and criteria[other] != candidate
+                   for other in front):
+            front.append(index)
+    return sorted(front)
+
+# Rank whole offers by weighted price, duration, stops and layover time and return the
+# top k, best first. Criteria are computed once per offer and the top k are selected with
+# a heap, so cost stays linear in the number of offers. With pareto=True only offers on
+# the Pareto front are considered.
+def rank_offers(offers, k=5, weights=None, pareto=False):
+    offers = list(offers)
+    if not offers:
+        return []
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    criteria = [offer_criteria(offer) for offer in offers]
+    bounds = _bounds(criteria)
+
+    indexes = _pareto_indexes(criteria) if pareto else range(len(offers))
+    top = heapq.nsmallest(k, indexes, key=lambda index: (_score(criteria[index], bounds, weights), index))
+    return [offers[index] for index in top]
+
+# Best single offer under the given weights, or None if there are no offers
+def best_offer(offers, weights=None):
+    ranked = rank_offers(offers, k=1, weights=weights)
+    return ranked[0] if ranked else None
@@ -0,0 +1,267 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from fastapi import HTTPException
+from services.metrics import register_collector, timed, upstream_calls, upstream_duration
+
+# Request priorities; lower values are admitted first
+INTERACTIVE = 0
+BATCH = 1
+
+# Priority of upstream calls made on behalf of the current request
+request_priority = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+# Calls that cannot be admitted within this many seconds are shed with a 503
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", 5))
+
+# Sustained requests per second, burst size and maximum calls in flight for each provider
+PROVIDER_LIMITS = {
+    "amadeus": {
+        "rate": float(os.environ.get("AMADEUS_RATE_LIMIT", 10)),
+        "burst": int(os.environ.get("AMADEUS_BURST", 10)),
+        "max_in_flight": int(os.environ.get("AMADEUS_MAX_IN_FLIGHT", 8)),
+    },
+    "openai": {
+        "rate": float(os.environ.get("OPENAI_RATE_LIMIT", 8)),
+        "burst": int(os.environ.get("OPENAI_BURST", 16)),
+        "max_in_flight": int(os.environ.get("OPENAI_MAX_IN_FLIGHT", 16)),
+    },
+    "openweather": {
+        "rate": float(os.environ.get("OPENWEATHER_RATE_LIMIT", 1)),
+        "burst": int(os.environ.get("OPENWEATHER_BURST", 60)),
+        "max_in_flight": int(os.environ.get("OPENWEATHER_MAX_IN_FLIGHT", 8)),
+    },
+}
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+# Token-bucket rate limiter with a bound on calls in flight. Waiting callers are admitted
+# in priority order, and callers that cannot be admitted before their queue deadline are
+# rejected with a 503 instead of piling up behind the provider's rate limit.
+class Governor:
+    def __init__(self, name, rate, burst, max_in_flight, queue_timeout=UPSTREAM_QUEUE_TIMEOUT):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self._updated = time.monotonic()
+        self._waiting = []
+        self._wakeups = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _overloaded(self, wait):
+        self.shed += 1
+        raise HTTPException(
+            status_code=503,
+            detail=f"Too many requests to {self.name}, try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+        )
+
+    # Queue a waiter, or shed it at once when the callers ahead already use up the deadline.
+    # Called with the condition held.
+    def _enqueue(self, priority):
+        now = time.monotonic()
+        self._refill(now)
+        ahead = sum(1 for waiting_priority, _ in self._waiting if waiting_priority <= priority)
+        expected_wait = (ahead + 1 - self.tokens) / self.rate
+        if expected_wait > self.queue_timeout:
+            self._overloaded(expected_wait)
+
+        waiter = (priority, next(self._sequence))
+        heapq.heappush(self._waiting, waiter)
+        return waiter, now + self.queue_timeout, expected_wait
+
+    # Admit a queued waiter if it is first and a token and a slot are free; otherwise return
+    # how long it should wait before trying again. Called with the condition held.
+    def _admit(self, waiter, deadline, expected_wait):
+        now = time.monotonic()
+        self._refill(now)
+        first = self._waiting[0] == waiter
+        if first and self.in_flight < self.max_in_flight and self.tokens >= 1:
+            heapq.heappop(self._waiting)
+            self.tokens -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+        if now >= deadline:
+            self._overloaded(expected_wait)
+        timeout = deadline - now
+        if first and self.in_flight < self.max_in_flight:
+            timeout = min(timeout, (1 - self.tokens) / self.rate)
+        return timeout
+
+    # Drop a waiter that was admitted, shed or cancelled, and let the others re-check
+    def _dequeue(self, waiter):
+        self._wakeups.pop(waiter, None)
+        if waiter in self._waiting:
+            self._waiting.remove(waiter)
+            heapq.heapify(self._waiting)
+        self._notify()
+
+    # Wake every waiting thread and coroutine. Called with the condition held.
+    def _notify(self):
+        self._condition.notify_all()
+        for loop, wakeup in self._wakeups.values():
+            loop.call_soon_threadsafe(_wake, wakeup)
+
+    # Wait for a token and a free slot, or raise a 503 once the queue deadline can't be met
+    def acquire(self, priority=None):
+        priority = request_priority.get() if priority is None else priority
+        with self._condition:
+            waiter, deadline, expected_wait = self._enqueue(priority)
+            try:
+                while True:
+                    timeout = self._admit(waiter, deadline, expected_wait)
+                    if timeout is None:
+                        return
+                    self._condition.wait(timeout)
+            finally:
+                self._dequeue(waiter)
+
+    # True if a token and a slot are free and nobody is queued. Called with the condition held.
+    def _idle(self):
+        self._refill(time.monotonic())
+        return not self._waiting and self.in_flight < self.max_in_flight and self.tokens >= 1
+
+    # True if a call could start right now without waiting behind anyone
+    def idle(self):
+        with self._condition:
+            return self._idle()
+
+    # Take a token and a slot only if both are free right now and nobody is queued
+    def try_acquire(self):
+        with self._condition:
+            if not self._idle():
+                return False
+            self.tokens -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    # acquire for coroutines. Queued coroutines wait on a future of their own loop, in the
+    # same priority queue as threads; a cancelled waiter leaves the queue without a slot.
+    async def acquire_async(self, priority=None):
+        if self.try_acquire():
+            return
+        priority = request_priority.get() if priority is None else priority
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            waiter, deadline, expected_wait = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    timeout = self._admit(waiter, deadline, expected_wait)
+                    if timeout is None:
+                        return
+                    wakeup = loop.create_future()
+                    self._wakeups[waiter] = (loop, wakeup)
+                try:
+                    await asyncio.wait_for(wakeup, timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                self._dequeue(waiter)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._notify()
+
+    @contextmanager
+    def slot(self, priority=None):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # Admitted and shed counters and current load, for monitoring
+    def stats(self):
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiting),
+                "tokens": self.tokens,
+            }
+
+governors = {name: Governor(name, **limits) for name, limits in PROVIDER_LIMITS.items()}
+
+@register_collector
+def collect_governor_stats():
+    stats = {name: governor.stats() for name, governor in governors.items()}
+    return [
+        ("trip_planner_upstream_in_flight", "gauge", "Upstream calls currently in flight.",
+         [({"provider": name}, values["in_flight"]) for name, values in stats.items()]),
+        ("trip_planner_upstream_queued", "gauge", "Upstream calls waiting for the rate limiter.",
+         [({"provider": name}, values["queued"]) for name, values in stats.items()]),
+    ]
+
+# Decorator running every call of func under the named provider's governor, counting
+# and timing each call by outcome. Coroutine functions get an awaitable wrapper.
+def governed(provider):
+    def decorator(func):
+        call = func.__name__
+        governor = governors[provider]
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    await governor.acquire_async()
+                except HTTPException:
+                    upstream_calls.inc(provider=provider, call=call, outcome="shed")
+                    raise
+                try:
+                    with timed(upstream_duration, f"{provider}.{call}", provider=provider, call=call):
+                        result = await func(*args, **kwargs)
+                except Exception:
+                    upstream_calls.inc(provider=provider, call=call, outcome="error")
+                    raise
+                finally:
+                    governor.release()
+                upstream_calls.inc(provider=provider, call=call, outcome="ok")
+                return result
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                governor.acquire()
+            except HTTPException:
+                upstream_calls.inc(provider=provider, call=call, outcome="shed")
+                raise
+            try:
+                with timed(upstream_duration, f"{provider}.{call}", provider=provider, call=call):
+                    result = func(*args, **kwargs)
+            except Exception:
+                upstream_calls.inc(provider=provider, call=call, outcome="error")
+                raise
+            finally:
+                governor.release()
+            upstream_calls.inc(provider=provider, call=call, outcome="ok")
+            return result
+        return wrapper
+    return decorator
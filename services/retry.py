@@ -0,0 +1,90 @@
+import sys
+import asyncio
+import json
+import random
+import time
+import requests
+from fastapi import HTTPException
+from pydantic import ValidationError
+from fastapi.concurrency import run_in_threadpool
+
+# HTTP status codes that indicate a transient upstream failure
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# Exception types that are always worth another attempt
+RETRYABLE_EXCEPTIONS = (
+    json.JSONDecodeError,  # the model returned malformed JSON; a new sample usually parses
+    ValidationError,  # likewise for a reply that does not match the expected schema
+    ConnectionError,
+    TimeoutError,
+    requests.ConnectionError,
+    requests.Timeout,
+)
+
+# Transient SDK exceptions by module. They are only looked up once the SDK has been
+# imported, since an SDK that was never loaded cannot have raised anything.
+RETRYABLE_SDK_EXCEPTIONS = {
+    "openai": ("APIConnectionError", "RateLimitError", "InternalServerError"),
+    "amadeus": ("NetworkError", "ServerError"),
+    "httpx": ("TransportError",),
+}
+
+def _retryable_sdk_exceptions():
+    return tuple(
+        getattr(sys.modules[module], name)
+        for module, names in RETRYABLE_SDK_EXCEPTIONS.items() if module in sys.modules
+        for name in names
+    )
+
+# Decide whether a failed upstream call should be retried
+def is_retryable(exc):
+    if isinstance(exc, HTTPException):
+        return False
+    if isinstance(exc, RETRYABLE_EXCEPTIONS) or isinstance(exc, _retryable_sdk_exceptions()):
+        return True
+
+    # Fall back to the HTTP status carried by the exception or its response
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+# Seconds the upstream asked us to wait before retrying, from a Retry-After header
+def retry_after(exc):
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+# Async retry policy with exponential backoff, full jitter and a deadline budget
+class RetryPolicy:
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=5.0, deadline=None, retryable=is_retryable):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retryable = retryable
+
+    # Delay before the given retry (1-based), drawn uniformly up to the capped exponential backoff
+    def backoff(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+    # Call func until it succeeds, the error is not retryable, or attempts/deadline run out.
+    # Sync functions run in the threadpool so the event loop is never blocked.
+    async def run(self, func, *args, **kwargs):
+        started = time.monotonic()
+        for attempt in range(1, self.attempts + 1):
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    return await func(*args, **kwargs)
+                return await run_in_threadpool(func, *args, **kwargs)
+            except Exception as exc:
+                if attempt == self.attempts or not self.retryable(exc):
+                    raise
+                # Never retry sooner than a rate-limited upstream asked us to
+                delay = max(self.backoff(attempt), retry_after(exc))
+                if self.deadline is not None and time.monotonic() - started + delay > self.deadline:
+                    raise
+                print(f"Retrying {getattr(func, '__name__', func)} in {delay:.2f} seconds...")
+                await asyncio.sleep(delay)
@@ -0,0 +1,74 @@
+import os
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from services.flights import remember_iata_code
+from services.metrics import speculations
+from services.rate_limit import governors
+from services.trip_parser import guess_route
+from services.weather import get_forecast_async, normalize_city
+
+# Speculative prefetching is opt-in: a wrong guess spends an OpenWeather call on a city
+# the trip does not visit
+SPECULATIVE_PREFETCH = os.environ.get("SPECULATIVE_PREFETCH", "").lower() in ("1", "true", "yes")
+
+# Prefetch work started for a guessed route while the LLM extraction runs
+class Speculation:
+    def __init__(self, origin, destination, task, codes=None):
+        self.origin = origin
+        self.destination = destination
+        self.task = task
+        self.codes = codes
+
+# Cache the gazetteer's IATA codes for cities the extraction confirmed. The code cache
+# may be shared, so this runs on a worker thread rather than the event loop.
+def remember_route(*cities):
+    for city in cities:
+        if city is not None:
+            remember_iata_code(city.name, city.code)
+
+# Download the forecast for a guessed destination, but only with OpenWeather capacity
+# to spare, so the guess never queues ahead of calls a request is known to need. The
+# download runs at the request's own priority: on a hit the weather stage joins it, and
+# a batch-priority load would hold the interactive request back behind other traffic.
+# Errors are left for the weather stage to handle.
+async def prefetch_forecast(destination):
+    if not governors["openweather"].idle():
+        return
+    try:
+        await get_forecast_async(destination)
+    except Exception:
+        pass
+
+# Guess the route from the raw input and start downloading the destination forecast.
+# Returns None when speculation is off or no city is recognized.
+def start_speculation(user_input):
+    if not SPECULATIVE_PREFETCH:
+        return None
+    origin, destination = guess_route(user_input)
+    if destination is None:
+        speculations.inc(outcome="skipped")
+        return None
+    return Speculation(origin, destination, asyncio.ensure_future(prefetch_forecast(destination.name)))
+
+# Compare the guess with the extracted trip (None if extraction failed). A confirmed
+# prefetch keeps running for the weather stage to join, and the gazetteer codes of the
+# confirmed cities fill in codes the extraction left out and are saved in the code cache.
+# A wrong guess writes nothing and stops being waited for; a download already under way
+# still finishes into the forecast cache.
+def settle_speculation(speculation, trip):
+    if speculation is None:
+        return
+    if trip is not None and normalize_city(trip["destination"]) == normalize_city(speculation.destination.name):
+        speculations.inc(outcome="hit")
+        confirmed = {"destination": speculation.destination}
+        origin = speculation.origin
+        if origin is not None and normalize_city(trip["origin"]) == normalize_city(origin.name):
+            confirmed["origin"] = origin
+        for role, city in confirmed.items():
+            if trip.get(f"{role}_code") is None:
+                trip[f"{role}_code"] = city.code
+        speculation.codes = asyncio.ensure_future(run_in_threadpool(remember_route, *confirmed.values()))
+        return
+    speculation.task.cancel()
+    if trip is not None:
+        speculations.inc(outcome="miss")
@@ -0,0 +1,231 @@
+import os
+import re
+from datetime import datetime
+from services.gazetteer import find_cities
+from services.metrics import register_collector
+
+# The fast path is on by default; it only answers when at least FAST_PATH_MIN_CONFIDENCE
+# of the words in the input are explained by the trip grammar
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "1").lower() not in ("0", "false", "no")
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get("FAST_PATH_MIN_CONFIDENCE", 0.85))
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3,
+    "april": 4, "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7,
+    "august": 8, "aug": 8, "september": 9, "sep": 9, "sept": 9,
+    "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12,
+}
+
+# Date grammar: "January 10th[, 2025]", "10th [of] January [2025]" and "2025-01-10"
+_MONTH = r"(?:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+_DAY = r"\d{1,2}(?:st|nd|rd|th)?"
+DATE_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<m1>" + _MONTH + r")\s+(?P<d1>" + _DAY + r")(?:,?\s+(?P<y1>\d{4}))?"
+    r"|(?P<d2>" + _DAY + r")\s+(?:of\s+)?(?P<m2>" + _MONTH + r")(?:,?\s+(?P<y2>\d{4}))?"
+    r"|(?P<y3>\d{4})-(?P<m3>\d{2})-(?P<d3>\d{2})"
+    r")\b"
+)
+# A bare end day after a full start date, as in "January 10-20" or "Jan 10 to 20th"
+RANGE_END_DAY_PATTERN = re.compile(
+    r"\s*(?:-|–|to|until|till|through|thru)\s*(?P<day>" + _DAY + r")(?:,?\s+(?P<year>\d{4}))?\b(?!\s*(?:of\s+)?" + _MONTH + r")"
+)
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+# Placeholders for the city and date spans when looking at the words around them
+CITY_TOKEN, DATE_TOKEN = "\x00", "\x01"
+REMAINDER_PATTERN = re.compile(r"[a-z0-9']+|[\x00\x01]")
+
+# Words that carry no trip information beyond what the grammar already extracts
+FILLER_WORDS = {
+    "i", "i'd", "i'm", "im", "we", "we'd", "want", "would", "like", "love", "to", "travel", "traveling",
+    "travelling", "fly", "flying", "flight", "flights", "go", "going", "get", "trip", "a", "an", "the",
+    "from", "between", "and", "on", "in", "of", "until", "till", "through", "thru", "leaving", "leave",
+    "depart", "departing", "returning", "return", "back", "please", "plan", "planning", "my", "me",
+    "for", "book", "need", "visit", "visiting", "round",
+}
+
+# Words before a city that mark it as the origin or the destination
+ORIGIN_MARKERS = {"from", "leaving", "departing"}
+DESTINATION_MARKERS = {"to", "visit", "visiting", "into"}
+
+# Share of inputs answered by the fast path versus the LLM, for monitoring
+class FastPathStats:
+    def __init__(self):
+        self.handled = 0
+        self.fallback = 0
+
+    def record(self, handled):
+        if handled:
+            self.handled += 1
+        else:
+            self.fallback += 1
+
+    def reset(self):
+        self.handled = 0
+        self.fallback = 0
+
+    def stats(self):
+        total = self.handled + self.fallback
+        return {
+            "handled": self.handled,
+            "fallback": self.fallback,
+            "handled_ratio": self.handled / total if total else 0.0,
+        }
+
+fast_path_stats = FastPathStats()
+
+@register_collector
+def collect_fast_path_stats():
+    stats = fast_path_stats.stats()
+    return [("trip_planner_extractions_total", "counter", "Trip extractions by the path that answered them.", [
+        ({"path": "fast"}, stats["handled"]),
+        ({"path": "llm"}, stats["fallback"]),
+    ])]
+
+# Format a date as "January 10th"
+def format_day(date_object):
+    day = date_object.day
+    suffix = 'th' if 4 <= day <= 20 or 24 <= day <= 30 else ['st', 'nd', 'rd'][day % 10 - 1]
+    return f"{date_object.strftime('%B')} {day}{suffix}"
+
+def _month_number(text):
+    return MONTHS[text.rstrip(".")]
+
+def _day_number(text):
+    return int(re.match(r"\d+", text).group())
+
+# Turn a date match into (year or None, month, day)
+def _date_parts(match):
+    if match.group("m1"):
+        return match.group("y1"), _month_number(match.group("m1")), _day_number(match.group("d1"))
+    if match.group("m2"):
+        return match.group("y2"), _month_number(match.group("m2")), _day_number(match.group("d2"))
+    return match.group("y3"), int(match.group("m3")), int(match.group("d3"))
+
+# Find the travel date range as ((year, month, day), (year, month, day), spans)
+def _find_date_range(text):
+    matches = list(DATE_PATTERN.finditer(text))
+    if len(matches) == 2:
+        return _date_parts(matches[0]), _date_parts(matches[1]), [matches[0].span(), matches[1].span()]
+    if len(matches) == 1:
+        end_day = RANGE_END_DAY_PATTERN.match(text, matches[0].end())
+        if end_day:
+            year, month, _ = _date_parts(matches[0])
+            end = (end_day.group("year") or year, month, _day_number(end_day.group("day")))
+            return _date_parts(matches[0]), end, [(matches[0].start(), end_day.end())]
+    return None
+
+# Resolve missing years the way the extraction prompt asks, rolling the end date
+# into the next year when the trip crosses New Year (it ends in an earlier month). Any
+# other end date before the start raises ValueError, so the input goes to the LLM.
+def _resolve_dates(start, end, current_year):
+    start_year, start_month, start_day = start
+    end_year, end_month, end_day = end
+    if start_year is None and end_year is not None:
+        start_year = int(end_year) - 1 if (start_month, start_day) > (end_month, end_day) else end_year
+    start_date = datetime(int(start_year or current_year), start_month, start_day)
+    end_date = datetime(int(end_year or start_date.year), end_month, end_day)
+    if end_year is None and end_date < start_date:
+        if end_month >= start_month:
+            raise ValueError("End date is before the start date")
+        end_date = end_date.replace(year=end_date.year + 1)
+    return start_date, end_date
+
+# Assign origin and destination roles from the words preceding each city
+def _assign_roles(text, cities):
+    origin = destination = None
+    for city, start, _ in cities:
+        previous = WORD_PATTERN.findall(text[:start])[-1:]
+        if previous and previous[0] in ORIGIN_MARKERS and origin is None:
+            origin = city
+        elif previous and previous[0] in DESTINATION_MARKERS and destination is None:
+            destination = city
+    first, second = cities[0][0], cities[1][0]
+    if origin is None and destination is None:
+        return None, None
+    if origin is None:
+        origin = first if destination == second else second
+    if destination is None:
+        destination = second if origin == first else first
+    if origin == destination:
+        return None, None
+    return origin, destination
+
+# Guess the origin and destination cities of free-form input from the gazetteer alone,
+# e.g. to warm lookups while the LLM parses it. Either may be None; a lone city is taken
+# as the destination unless a marker says otherwise.
+def guess_route(user_input):
+    text = user_input.casefold()
+    cities, seen = [], set()
+    for city, start, end in find_cities(text):
+        if city not in seen:
+            seen.add(city)
+            cities.append((city, start, end))
+    if len(cities) == 2:
+        return _assign_roles(text, cities)
+    if len(cities) == 1:
+        city, start, _ = cities[0]
+        previous = WORD_PATTERN.findall(text[:start])[-1:]
+        if previous and previous[0] in ORIGIN_MARKERS:
+            return city, None
+        return None, city
+    return None, None
+
+# Describe a city in the JSON shape the extraction prompt requests
+def _location(city):
+    return {
+        "name": city.name,
+        "city": True,
+        "code": city.code,
+        "nearest": {"name": city.name, "code": city.code}
+    }
+
+# Deterministically extract a trip from templated input such as
+# "from New York to Paris from January 10th to January 20th".
+# Returns the same JSON shape as the ChatGPT extraction, or None when not confident.
+def parse_trip(user_input, now=None):
+    now = now or datetime.now()
+    text = user_input.casefold()
+
+    cities = find_cities(text)
+    if len({city for city, _, _ in cities}) != 2 or len(cities) != 2:
+        return None
+    date_range = _find_date_range(text)
+    if date_range is None:
+        return None
+    start, end, date_spans = date_range
+
+    origin, destination = _assign_roles(text, cities)
+    if origin is None:
+        return None
+    try:
+        start_date, end_date = _resolve_dates(start, end, now.year)
+    except ValueError:
+        return None
+
+    # Confidence is the share of words explained by cities, dates and filler words. Any
+    # unexplained word next to a city may qualify it ("Paris, Texas", "north London"),
+    # so that input always goes to the LLM.
+    remainder = text
+    spans = [(s, e, CITY_TOKEN) for _, s, e in cities] + [(s, e, DATE_TOKEN) for s, e in date_spans]
+    for span_start, span_end, token in sorted(spans, reverse=True):
+        remainder = remainder[:span_start] + f" {token} " + remainder[span_end:]
+    tokens = REMAINDER_PATTERN.findall(remainder)
+    for index, token in enumerate(tokens):
+        if token == CITY_TOKEN and any(
+            neighbour not in FILLER_WORDS and neighbour not in (CITY_TOKEN, DATE_TOKEN)
+            for neighbour in tokens[max(index - 1, 0):index] + tokens[index + 1:index + 2]
+        ):
+            return None
+    words = WORD_PATTERN.findall(text)
+    unexplained = [token for token in tokens if token not in FILLER_WORDS and token not in (CITY_TOKEN, DATE_TOKEN)]
+    if not words or 1 - len(unexplained) / len(words) < FAST_PATH_MIN_CONFIDENCE:
+        return None
+
+    return {
+        "destination": _location(destination),
+        "origin": _location(origin),
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "description": f"Here is your trip plan to {destination.name} from {format_day(start_date)} to {format_day(end_date)}."
+    }
@@ -1,59 +1,242 @@
 import os
 import requests
-from dotenv import load_dotenv
-from datetime import datetime
-from collections import defaultdict, Counter
+from collections import namedtuple
+from services.config import require_setting
+from services.cache import make_cache, SingleFlight, AsyncSingleFlight, get_or_load, get_or_load_async
+from services.http import get_async_client
+from services.rate_limit import governed
+from services.metrics import register_cache, upstream_response_size
 
-# Load environment variables from .env file
-load_dotenv()
+# OpenWeather forecast endpoint; the API key is read from OPENWEATHER_API_KEY on first use
+OPENWEATHER_API_URL = os.environ.get("OPENWEATHER_API_URL", "https://api.openweathermap.org/data/2.5/forecast")
 
-# Initialize OpenWeather API key
-OPENWEATHER_API_KEY = os.environ['OPENWEATHER_API_KEY']
+# Raised when the OpenWeather API returns an error response
+class WeatherAPIError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
 
-# Fetch weather forecast for a given destination between start and end dates
-def get_weather(destination, start_date, end_date):
+# OpenWeather refreshes its 5-day/3-hour forecast every few hours, so parsed forecasts are
+# cached per city for that long; override with WEATHER_CACHE_TTL (seconds)
+WEATHER_CACHE_TTL = int(os.environ.get("WEATHER_CACHE_TTL", 3 * 60 * 60))
+
+# Normalize a city name so equivalent spellings share a cache entry
+def normalize_city(destination):
+    return " ".join(destination.split()).casefold()
+
+# Download the raw 5-day/3-hour forecast entries for a destination
+@governed("openweather")
+def fetch_forecast(destination):
     # Prepare the OpenWeather API URL
+    openweather_api_key = require_setting("OPENWEATHER_API_KEY")
     openweather_api_url = (
-        f"https://api.openweathermap.org/data/2.5/forecast?q={destination}&appid={OPENWEATHER_API_KEY}&units=metric"
+        f"{OPENWEATHER_API_URL}?q={destination}&appid={openweather_api_key}&units=metric"
     )
 
     # Request weather data from OpenWeather API
     response = requests.get(openweather_api_url)
+    upstream_response_size.observe(len(response.content), provider="openweather")
     if response.status_code != 200:
-        raise Exception(f"Failed to fetch weather data for {destination}")
-
-    days = response.json().get("list", [])
-    weather_forecast = []
-
-    # Filter weather data within the specified date range
-    for day in days:
-        date_object = datetime.strptime(day["dt_txt"], "%Y-%m-%d %H:%M:%S")
-        if start_date <= date_object <= end_date:
-            # Format date as "Month Day" with appropriate suffix
-            formatted_date = date_object.strftime("%B %d").replace(" 0", " ")
-            suffix = 'th' if 4 <= date_object.day <= 20 or 24 <= date_object.day <= 30 else ['st', 'nd', 'rd'][date_object.day % 10 - 1]
-            formatted_date += suffix
-
-            # Append weather details to forecast list
-            weather_forecast.append((formatted_date, day["weather"][0]["description"], day["main"]["temp"]))
-
-    # Aggregate daily weather data
-    daily_forecasts = defaultdict(list)
-    for date, condition, temperature in weather_forecast:
-        daily_forecasts[date].append((condition, temperature))
-
-    # Summarize weather for each day
-    daily_summary = []
-    for date, entries in daily_forecasts.items():
-        # Determine the most frequent weather condition
-        conditions = [condition for condition, temp in entries]
-        most_common_condition = Counter(conditions).most_common(1)[0][0]
-
-        # Calculate the average temperature for the day
-        avg_temp = sum(temp for _, temp in entries) / len(entries)
-
-        # Format daily summary
-        summary = f"{date}: {most_common_condition}, {avg_temp:.2f} °C"
-        daily_summary.append(summary)
-
-    return daily_summary
+        raise WeatherAPIError(f"Failed to fetch weather data for {destination}", response.status_code)
+
+    return response.json().get("list", [])
+
+# Awaitable fetch_forecast over the shared keep-alive connection pool
+@governed("openweather")
+async def fetch_forecast_async(destination):
+    params = {"q": destination, "appid": require_setting("OPENWEATHER_API_KEY"), "units": "metric"}
+    response = await get_async_client().get(OPENWEATHER_API_URL, params=params)
+    upstream_response_size.observe(len(response.content), provider="openweather")
+    if response.status_code != 200:
+        raise WeatherAPIError(f"Failed to fetch weather data for {destination}", response.status_code)
+
+    return response.json().get("list", [])
+
+# Columnar view of a forecast: one NumPy array per field, one element per 3-hour entry.
+# Conditions are stored as indexes into the forecast's list of distinct descriptions.
+class Forecast:
+    __slots__ = ("timestamps", "temp", "temp_min", "temp_max", "precipitation", "condition_codes", "conditions")
+
+    def __init__(self, timestamps, temp, temp_min, temp_max, precipitation, condition_codes, conditions):
+        self.timestamps = timestamps
+        self.temp = temp
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.precipitation = precipitation
+        self.condition_codes = condition_codes
+        self.conditions = conditions
+
+    def __len__(self):
+        return len(self.timestamps)
+
+# Encode a Forecast as plain JSON lists for a shared cache, timestamps as epoch seconds
+def pack_forecast(forecast):
+    return {
+        "timestamps": forecast.timestamps.astype("int64").tolist(),
+        "temp": forecast.temp.tolist(),
+        "temp_min": forecast.temp_min.tolist(),
+        "temp_max": forecast.temp_max.tolist(),
+        "precipitation": forecast.precipitation.tolist(),
+        "condition_codes": forecast.condition_codes.tolist(),
+        "conditions": forecast.conditions,
+    }
+
+# Rebuild a Forecast from pack_forecast output
+def unpack_forecast(packed):
+    import numpy as np
+
+    return Forecast(
+        np.array(packed["timestamps"], dtype="int64").astype("datetime64[s]"),
+        np.array(packed["temp"], dtype=float),
+        np.array(packed["temp_min"], dtype=float),
+        np.array(packed["temp_max"], dtype=float),
+        np.array(packed["precipitation"], dtype=float),
+        np.array(packed["condition_codes"], dtype=np.intp),
+        list(packed["conditions"])
+    )
+
+forecast_cache = make_cache(
+    "forecasts", 1024, WEATHER_CACHE_TTL, encode=pack_forecast, decode=unpack_forecast
+)
+forecast_requests = SingleFlight()
+forecast_tasks = AsyncSingleFlight()
+register_cache("forecasts", forecast_cache)
+
+# Daily weather statistics for one forecast day
+DailyWeather = namedtuple("DailyWeather", ["date", "condition", "temp_mean", "temp_min", "temp_max", "precipitation"])
+
+# Parse raw OpenWeather forecast entries into a columnar Forecast, taking timestamps
+# from the "dt" epoch field (UTC, like "dt_txt") when present
+def build_forecast(entries):
+    import numpy as np
+
+    if all("dt" in entry for entry in entries):
+        timestamps = np.array([entry["dt"] for entry in entries], dtype="datetime64[s]")
+    else:
+        timestamps = np.array([entry["dt_txt"].replace(" ", "T") for entry in entries], dtype="datetime64[s]")
+
+    conditions = {}
+    condition_codes = np.array(
+        [conditions.setdefault(entry["weather"][0]["description"], len(conditions)) for entry in entries],
+        dtype=np.intp
+    )
+    temp = np.array([entry["main"]["temp"] for entry in entries], dtype=float)
+    temp_min = np.array([entry["main"].get("temp_min", entry["main"]["temp"]) for entry in entries], dtype=float)
+    temp_max = np.array([entry["main"].get("temp_max", entry["main"]["temp"]) for entry in entries], dtype=float)
+    precipitation = np.array(
+        [entry.get("rain", {}).get("3h", 0.0) + entry.get("snow", {}).get("3h", 0.0) for entry in entries],
+        dtype=float
+    )
+    return Forecast(timestamps, temp, temp_min, temp_max, precipitation, condition_codes, list(conditions))
+
+# Load and parse the forecast for a destination
+def load_forecast(destination):
+    return build_forecast(fetch_forecast(destination))
+
+# Get the parsed forecast for a destination, coalescing concurrent misses
+def get_forecast(destination):
+    return get_or_load(forecast_cache, forecast_requests, normalize_city(destination), load_forecast, destination)
+
+async def load_forecast_async(destination):
+    return build_forecast(await fetch_forecast_async(destination))
+
+# Awaitable get_forecast; shares the forecast cache with the sync path
+async def get_forecast_async(destination):
+    return await get_or_load_async(
+        forecast_cache, forecast_tasks, normalize_city(destination), load_forecast_async, destination
+    )
+
+# Format a date as "Month Day" with appropriate suffix
+def format_date(date_object):
+    formatted_date = date_object.strftime("%B %d").replace(" 0", " ")
+    suffix = 'th' if 4 <= date_object.day <= 20 or 24 <= date_object.day <= 30 else ['st', 'nd', 'rd'][date_object.day % 10 - 1]
+    return formatted_date + suffix
+
+# Aggregate several forecasts into daily statistics between start and end dates in one
+# vectorized pass: entries from every forecast are grouped by (forecast, day) and reduced
+# with NumPy. The modal condition breaks ties by the earliest entry of the day.
+def aggregate_daily(forecasts, start_date, end_date):
+    import numpy as np
+
+    start, end = np.datetime64(start_date), np.datetime64(end_date)
+    columns = {name: [] for name in ("forecast", "day", "temp", "temp_min", "temp_max", "precipitation", "condition")}
+    condition_names = []
+    for index, forecast in enumerate(forecasts):
+        mask = (forecast.timestamps >= start) & (forecast.timestamps <= end)
+        columns["forecast"].append(np.full(int(mask.sum()), index, dtype=np.intp))
+        columns["day"].append(forecast.timestamps[mask].astype("datetime64[D]"))
+        columns["temp"].append(forecast.temp[mask])
+        columns["temp_min"].append(forecast.temp_min[mask])
+        columns["temp_max"].append(forecast.temp_max[mask])
+        columns["precipitation"].append(forecast.precipitation[mask])
+        columns["condition"].append(forecast.condition_codes[mask] + len(condition_names))
+        condition_names.extend(forecast.conditions)
+
+    results = [[] for _ in forecasts]
+    if not forecasts:
+        return results
+    columns = {name: np.concatenate(values) for name, values in columns.items()}
+    if not len(columns["day"]):
+        return results
+
+    # Sort entries by (forecast, day), keeping chronological order inside each group
+    order = np.lexsort((columns["day"], columns["forecast"]))
+    columns = {name: values[order] for name, values in columns.items()}
+    group_key = columns["forecast"].astype("int64") * 10 ** 6 + columns["day"].astype("int64")
+    starts = np.flatnonzero(np.r_[True, group_key[1:] != group_key[:-1]])
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(group_key)]))
+    counts = np.diff(np.r_[starts, len(group_key)])
+
+    temp_mean = np.add.reduceat(columns["temp"], starts) / counts
+    temp_min = np.minimum.reduceat(columns["temp_min"], starts)
+    temp_max = np.maximum.reduceat(columns["temp_max"], starts)
+    precipitation = np.add.reduceat(columns["precipitation"], starts)
+
+    # Modal condition per group: highest count, then earliest first appearance in the day.
+    # Descriptions get global codes first, so the work stays linear in the number of entries
+    # however many forecasts share them.
+    condition_names, codes = np.unique(np.array(condition_names), return_inverse=True)
+    codes = codes.reshape(-1)[columns["condition"]]
+    position = np.arange(len(group_key)) - starts[group]
+    # Runs of one condition within one group, each with its count and first position
+    order = np.lexsort((position, codes, group))
+    sorted_group, sorted_code = group[order], codes[order]
+    run_starts = np.flatnonzero(np.r_[True, (sorted_group[1:] != sorted_group[:-1]) | (sorted_code[1:] != sorted_code[:-1])])
+    run_group = sorted_group[run_starts]
+    run_code = sorted_code[run_starts]
+    run_count = np.diff(np.r_[run_starts, len(order)])
+    run_first = position[order][run_starts]
+    # Best run first within each group, then keep the first run of every group
+    ranked = np.lexsort((run_first, -run_count, run_group))
+    modal = run_code[ranked][np.r_[True, run_group[ranked][1:] != run_group[ranked][:-1]]]
+
+    # Plain Python values, so building the results does not index NumPy scalars one by one
+    rows = zip(
+        columns["forecast"][starts].tolist(),
+        columns["day"][starts].astype(object).tolist(),
+        condition_names[modal].tolist(),
+        temp_mean.tolist(),
+        temp_min.tolist(),
+        temp_max.tolist(),
+        precipitation.tolist()
+    )
+    for forecast_index, day, condition, mean, low, high, rain in rows:
+        results[forecast_index].append(DailyWeather(day, condition, mean, low, high, rain))
+    return results
+
+# Daily weather statistics for a destination between start and end dates
+def get_daily_weather(destination, start_date, end_date):
+    return aggregate_daily([get_forecast(destination)], start_date, end_date)[0]
+
+# Format daily statistics as "December 25th: clear sky, 6.00 °C"
+def format_daily_weather(daily_weather):
+    return [f"{format_date(day.date)}: {day.condition}, {day.temp_mean:.2f} °C" for day in daily_weather]
+
+# Fetch weather forecast for a given destination between start and end dates
+def get_weather(destination, start_date, end_date):
+    return format_daily_weather(get_daily_weather(destination, start_date, end_date))
+
+# Awaitable get_weather
+async def get_weather_async(destination, start_date, end_date):
+    forecast = await get_forecast_async(destination)
+    return format_daily_weather(aggregate_daily([forecast], start_date, end_date)[0])
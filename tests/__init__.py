@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep on-disk caches written during tests out of the shared cache directory
+os.environ.setdefault("TRIP_PLANNER_CACHE_DIR", tempfile.mkdtemp(prefix="trip-planner-tests-"))
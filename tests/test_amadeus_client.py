@@ -0,0 +1,71 @@
+import json
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from urllib.error import URLError
+import requests
+from services.amadeus_client import AmadeusClientManager, PooledHTTP
+
+# Build a fake requests response carrying a JSON body
+def make_json_response(status_code, payload):
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = json.dumps(payload).encode("utf8")
+    response.headers = requests.structures.CaseInsensitiveDict({"content-type": "application/json"})
+    return response
+
+class TestAmadeusClientFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.requests_made = []
+
+        def fake_request(method, url, **kwargs):
+            self.requests_made.append((method, url))
+            if url.endswith("/v1/security/oauth2/token"):
+                return make_json_response(200, {"access_token": "token", "expires_in": 1799})
+            return make_json_response(200, {"data": [{"iataCode": "PAR"}]})
+
+        patcher = patch('services.amadeus_client.requests.Session.request', side_effect=fake_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_client_returns_shared_client(self):
+        manager = AmadeusClientManager("id", "secret")
+        self.assertIs(manager.get_client(), manager.get_client())
+
+    def test_access_token_fetched_once_across_threads(self):
+        manager = AmadeusClientManager("id", "secret")
+        threads = [threading.Thread(target=manager.get_client) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        client = manager.get_client()
+        response = client.reference_data.locations.get(keyword="Paris", subType="CITY")
+        response = client.reference_data.locations.get(keyword="Paris", subType="CITY")
+
+        token_requests = [url for _, url in self.requests_made if url.endswith("/oauth2/token")]
+        self.assertEqual(len(token_requests), 1)
+        self.assertEqual(response.result["data"][0]["iataCode"], "PAR")
+
+    def test_reset_creates_new_client(self):
+        manager = AmadeusClientManager("id", "secret")
+        first = manager.get_client()
+        manager.reset()
+        self.assertIsNot(manager.get_client(), first)
+
+class TestPooledHTTP(unittest.TestCase):
+
+    @patch('services.amadeus_client.requests.Session.request')
+    def test_network_errors_raise_url_error(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("down")
+        http_request = MagicMock()
+        http_request.get_method.return_value = "GET"
+        http_request.header_items.return_value = []
+
+        with self.assertRaises(URLError):
+            PooledHTTP()(http_request)
+
+if __name__ == '__main__':
+    unittest.main()
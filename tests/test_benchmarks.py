@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from benchmarks.load import parse_server_timing, percentile, run_load, stubbed_services, trip_inputs
+from benchmarks.micro import run_micro
+from benchmarks.startup import parse_importtime, profile_startup
+from benchmarks.stub_server import StubServer
+from complex import app
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 50))
+
+    def test_parse_server_timing(self):
+        self.assertEqual(parse_server_timing("chatgpt;dur=12.5, flights;dur=100.0"),
+                         [("chatgpt", 0.0125), ("flights", 0.1)])
+
+    def test_trip_inputs_cycle_over_unique_requests(self):
+        inputs = trip_inputs(10, 4)
+        self.assertEqual(len(set(inputs)), 4)
+        self.assertEqual(inputs[0], inputs[4])
+
+    def test_run_load_replays_stubbed_upstreams(self):
+        with StubServer(latency=0, jitter=0, offers=5) as stub, stubbed_services(stub):
+            report = asyncio.run(run_load(app, requests=6, concurrency=3, unique=2))
+
+        self.assertEqual(report["statuses"], {200: 6})
+        self.assertEqual(report["latency"]["count"], 6)
+        self.assertIn("flights", report["stages"])
+        self.assertIn("amadeus.get_flights", report["stages"])
+        # Repeated requests are answered from the caches
+        self.assertEqual(report["stages"]["openai.get_structured_response_async"]["count"], 2)
+
+    def test_run_micro(self):
+        results = run_micro(offers=5, cities=2, forecast_days=2, repeat=1, number=1)
+        self.assertIn("format_flight_offer", results)
+        self.assertTrue(all(result["calls"] == 1 for result in results.values()))
+
+    def test_parse_importtime(self):
+        output = "import time: self [us] | cumulative | imported package\nimport time:       500 |       1500 | complex\n"
+        self.assertEqual(parse_importtime(output), [("complex", 0.0005, 0.0015)])
+
+    def test_app_imports_without_credentials_or_heavy_sdks(self):
+        report = profile_startup("complex", top=3)
+        self.assertEqual(report["loaded_eagerly"], [])
+        self.assertEqual(len(report["slowest_cumulative"]), 3)
+
+if __name__ == '__main__':
+    unittest.main()
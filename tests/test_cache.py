@@ -0,0 +1,252 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from benchmarks.stub_server import StubRedisServer
+from services.cache import (
+    TTLCache, SQLiteCache, RedisCache, TieredCache, SingleFlight, AsyncSingleFlight,
+    dumps, get_or_load, get_or_load_async, loads, make_cache
+)
+
+class TestCacheFunctions(unittest.TestCase):
+
+    def test_ttl_cache_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl_cache_expires_entries(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        with patch('services.cache.time.monotonic', return_value=1000.0):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=5)
+        with patch('services.cache.time.monotonic', return_value=1010.0):
+            self.assertEqual(cache.get("a"), 1)
+            self.assertEqual(cache.get("b", "missing"), "missing")
+
+    def test_sqlite_cache_round_trip(self):
+        cache = SQLiteCache("test_round_trip.sqlite3", ttl=60)
+        cache.clear()
+        cache.set("JFK", ["New York", "US"])
+
+        # A second handle on the same file sees the value, as another worker would
+        self.assertEqual(SQLiteCache("test_round_trip.sqlite3").get("JFK"), ["New York", "US"])
+        cache.delete("JFK")
+        self.assertIsNone(cache.get("JFK"))
+
+    def test_sqlite_cache_expires_entries(self):
+        cache = SQLiteCache("test_expiry.sqlite3", ttl=60)
+        cache.clear()
+        cache.set("JFK", ["New York", "US"], ttl=-1)
+        self.assertIsNone(cache.get("JFK"))
+
+    def test_tiered_cache_promotes_disk_hits(self):
+        memory = TTLCache(maxsize=10, ttl=60)
+        disk = SQLiteCache("test_tiered.sqlite3", ttl=60)
+        disk.clear()
+        disk.set("CDG", ["Paris", "FR"])
+        cache = TieredCache(memory, disk)
+
+        self.assertEqual(cache.get("CDG"), ["Paris", "FR"])
+        self.assertEqual(memory.get("CDG"), ["Paris", "FR"])
+
+    def test_ttl_cache_stats(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5, "size": 1})
+
+    def test_single_flight_shares_errors(self):
+        single_flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            single_flight.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+        # The failed call is forgotten, so the next caller runs again
+        self.assertEqual(single_flight.do("key", lambda: 42), 42)
+
+    def test_get_or_load_caches_loaded_value(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        calls = []
+
+        def loader(value):
+            calls.append(value)
+            return value * 2
+
+        self.assertEqual(get_or_load(cache, SingleFlight(), "key", loader, 21), 42)
+        self.assertEqual(get_or_load(cache, SingleFlight(), "key", loader, 21), 42)
+        self.assertEqual(calls, [21])
+
+    def test_async_single_flight_shares_one_call(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def load(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        async def concurrent_loads():
+            return await asyncio.gather(*(single_flight.do("key", load, 21) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(concurrent_loads()), [42] * 5)
+        self.assertEqual(calls, [21])
+        # Finished calls are forgotten, also when the next caller runs on a different loop
+        self.assertEqual(asyncio.run(single_flight.do("key", load, 1)), 2)
+
+    def test_get_or_load_async_caches_loaded_value(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        calls = []
+
+        async def loader(value):
+            calls.append(value)
+            return value * 2
+
+        self.assertEqual(asyncio.run(get_or_load_async(cache, AsyncSingleFlight(), "key", loader, 21)), 42)
+        self.assertEqual(asyncio.run(get_or_load_async(cache, AsyncSingleFlight(), "key", loader, 21)), 42)
+        self.assertEqual(calls, [21])
+    def test_codec_round_trip(self):
+        value = {"origin": "New York", "codes": ["JFK", "LGA"], "price": 120.5, "nearest": None}
+        self.assertIsInstance(dumps(value), bytes)
+        self.assertEqual(loads(dumps(value)), value)
+
+    def test_sqlite_cache_add_and_remove(self):
+        cache = SQLiteCache("test_lock.sqlite3", ttl=60)
+        cache.clear()
+
+        self.assertTrue(cache.add("lock", "a"))
+        self.assertFalse(cache.add("lock", "b"))
+        # Only the holder's value releases the lock
+        cache.remove("lock", "b")
+        self.assertEqual(cache.get("lock"), "a")
+        cache.remove("lock", "a")
+        self.assertTrue(cache.add("lock", "b", ttl=-1))
+        # An expired lock can be taken over
+        self.assertTrue(cache.add("lock", "c"))
+
+    @patch('services.cache.SQLITE_PURGE_INTERVAL', 0)
+    def test_sqlite_cache_purges_expired_rows(self):
+        cache = SQLiteCache("test_purge.sqlite3", ttl=60)
+        cache.clear()
+        cache.set("old", 1, ttl=-1)
+        cache.add(["lock", "old"], "token", ttl=-1)
+        cache.set("new", 2)
+
+        keys = [row[0] for row in cache._connection().execute("SELECT key FROM cache")]
+        self.assertEqual(keys, ["new"])
+
+    def test_redis_cache_against_stub_server(self):
+        with StubRedisServer() as server:
+            cache = RedisCache(server.url, "test:", ttl=60)
+            other = RedisCache(server.url, "other:", ttl=60)
+            cache.set(("JFK", "CDG"), ["offer"])
+            other.set(("JFK", "CDG"), ["other offer"])
+
+            self.assertEqual(RedisCache(server.url, "test:").get(("JFK", "CDG")), ["offer"])
+            self.assertTrue(cache.add("lock", "a"))
+            self.assertFalse(cache.add("lock", "b"))
+            # Only the holder's token releases the lock, checked and deleted in one command
+            commands = server.commands
+            cache.remove("lock", "b")
+            self.assertEqual(server.commands, commands + 1)
+            self.assertEqual(cache.get("lock"), "a")
+            cache.remove("lock", "a")
+            self.assertIsNone(cache.get("lock"))
+            cache.set("expired", 1, ttl=-1)
+            self.assertIsNone(cache.get("expired"))
+
+            # clear only drops keys under the cache's own prefix
+            cache.clear()
+            self.assertIsNone(cache.get(("JFK", "CDG")))
+            self.assertEqual(other.get(("JFK", "CDG")), ["other offer"])
+
+    def test_tiered_cache_encodes_shared_values(self):
+        with StubRedisServer() as server:
+            shared = RedisCache(server.url, "test:", ttl=60)
+            cache = TieredCache(TTLCache(maxsize=10, ttl=60), shared, encode=sorted, decode=set)
+            cache.set("codes", {"JFK", "LGA"})
+
+            self.assertEqual(shared.get("codes"), ["JFK", "LGA"])
+            # Another worker rebuilds the value from the shared store
+            worker = TieredCache(TTLCache(maxsize=10, ttl=60), shared, encode=sorted, decode=set)
+            self.assertEqual(worker.get("codes"), {"JFK", "LGA"})
+            self.assertEqual(worker.stats(), {"hits": 1, "misses": 0, "hit_ratio": 1.0, "size": 1})
+
+    def test_tiered_cache_survives_unreachable_backend(self):
+        with StubRedisServer() as server:
+            url = server.url
+        cache = TieredCache(TTLCache(maxsize=10, ttl=60), RedisCache(url, "test:", ttl=60))
+
+        cache.set("key", 1)
+        self.assertEqual(cache.get("key"), 1)
+        self.assertIsNone(cache.get("missing"))
+        self.assertTrue(cache.add("lock", "a"))
+
+    def test_make_cache_backends(self):
+        self.assertIsInstance(make_cache("test", 10, 60, backend="memory"), TTLCache)
+        self.assertIsInstance(make_cache("test", 10, 60, backend="sqlite").shared, SQLiteCache)
+        self.assertIsInstance(make_cache("test", 10, 60, backend="redis").shared, RedisCache)
+        with self.assertRaises(ValueError):
+            make_cache("test", 10, 60, backend="memcached")
+
+    @patch('services.cache.STAMPEDE_POLL_INTERVAL', 0.01)
+    def test_get_or_load_loads_once_across_workers(self):
+        with StubRedisServer() as server:
+            calls = []
+            started = threading.Event()
+
+            def loader(value):
+                calls.append(value)
+                started.set()
+                threading.Event().wait(0.1)
+                return value * 2
+
+            # Two workers with their own memory tier and single-flight, sharing one store
+            workers = [
+                TieredCache(TTLCache(maxsize=10, ttl=60), RedisCache(server.url, "test:", ttl=60))
+                for _ in range(2)
+            ]
+            results = []
+            first = threading.Thread(target=lambda: results.append(
+                get_or_load(workers[0], SingleFlight(), "key", loader, 21)
+            ))
+            first.start()
+            started.wait(1)
+            results.append(get_or_load(workers[1], SingleFlight(), "key", loader, 21))
+            first.join()
+
+            self.assertEqual(results, [42, 42])
+            self.assertEqual(calls, [21])
+
+    @patch('services.cache.STAMPEDE_POLL_INTERVAL', 0.01)
+    def test_get_or_load_async_loads_once_across_workers(self):
+        with StubRedisServer() as server:
+            calls = []
+
+            async def loader(value):
+                calls.append(value)
+                await asyncio.sleep(0.1)
+                return value * 2
+
+            workers = [
+                TieredCache(TTLCache(maxsize=10, ttl=60), RedisCache(server.url, "test:", ttl=60))
+                for _ in range(2)
+            ]
+
+            async def both():
+                return await asyncio.gather(*(
+                    get_or_load_async(worker, AsyncSingleFlight(), "key", loader, 21) for worker in workers
+                ))
+
+            self.assertEqual(asyncio.run(both()), [42, 42])
+            self.assertEqual(calls, [21])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,424 @@
+import asyncio
+import json
+import httpx
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from services.retry import RetryPolicy
+from services.extraction import extraction_cache, multi_city_cache
+from services.offers import parse_offers
+from complex import app, etag_matches, plan_cache, plan_trips, TripRequest
+
+# Build a ChatGPT extraction result for a trip starting next month
+def make_chatgpt_response(origin_code="JFK", destination_code="CDG"):
+    start_date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    end_date = (datetime.now() + timedelta(days=35)).strftime("%Y-%m-%d")
+    return {
+        "destination": {"name": "Paris", "city": True, "code": destination_code,
+                        "nearest": {"name": "Paris", "code": destination_code}},
+        "origin": {"name": "New York", "city": True, "code": origin_code,
+                   "nearest": {"name": "New York", "code": origin_code}},
+        "start_date": start_date,
+        "end_date": end_date,
+        "description": "Here is your trip plan to Paris."
+    }
+
+SAMPLE_FLIGHTS = [{
+    "itineraries": [
+        {"segments": [{"carrierCode": "AF", "number": "1",
+                       "departure": {"iataCode": "JFK", "at": "2024-12-25T10:00:00"},
+                       "arrival": {"iataCode": "CDG", "at": "2024-12-25T22:00:00"}}]},
+        {"segments": [{"carrierCode": "AF", "number": "2",
+                       "departure": {"iataCode": "CDG", "at": "2024-12-30T10:00:00"},
+                       "arrival": {"iataCode": "JFK", "at": "2024-12-30T13:00:00"}}]}
+    ]
+}]
+
+# Parse a Server-Sent Events body into (event, data) pairs
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+SAMPLE_OFFERS = parse_offers(SAMPLE_FLIGHTS)
+
+# Build a ChatGPT multi-city extraction for NYC -> Paris -> Rome -> NYC starting next month
+def make_multi_city_response():
+    def stop(name, code):
+        return {"name": name, "city": True, "code": code, "nearest": {"name": name, "code": code}}
+    dates = [(datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d") for days in (30, 34, 38)]
+    return {
+        "stops": [stop("New York", "NYC"), stop("Paris", "PAR"), stop("Rome", "ROM"), stop("New York", "NYC")],
+        "departure_dates": dates,
+        "end_date": dates[-1],
+        "description": "Here is your trip plan to Paris and Rome."
+    }
+
+class TestPlanTrip(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+        plan_cache.clear()
+        extraction_cache.clear()
+        multi_city_cache.clear()
+
+    @patch('services.flights.get_city_country_from_iata', return_value=(None, None))
+    @patch('complex.get_weather_async')
+    @patch('complex.get_flight_offers')
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_runs_flights_and_weather_concurrently(
+            self, mock_chatgpt, mock_flights, mock_weather, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        def slow_flights(*args):
+            time.sleep(0.3)
+            return SAMPLE_OFFERS
+
+        async def slow_weather(*args):
+            await asyncio.sleep(0.3)
+            return ["December 25th: clear sky, 5.00 °C"]
+
+        mock_flights.side_effect = slow_flights
+        mock_weather.side_effect = slow_weather
+
+        started = time.perf_counter()
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200)
+        trip_plan = response.json()["trip_plan"]
+        self.assertEqual(trip_plan["weather_forecast"], ["December 25th: clear sky, 5.00 °C"])
+        self.assertIn("Flight AF1", trip_plan["flights"]["Departure"][0])
+        self.assertLess(elapsed, 0.55)
+
+    @patch('complex.get_weather_async')
+    @patch('complex.get_flight_offers')
+    @patch('complex.get_iata_code')
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_resolves_missing_iata_codes(
+            self, mock_chatgpt, mock_iata, mock_flights, mock_weather):
+        mock_chatgpt.return_value = make_chatgpt_response(origin_code=None, destination_code=None)
+        mock_iata.side_effect = lambda name: {"New York": "NYC", "Paris": "PAR"}[name]
+        mock_flights.return_value = []
+        mock_weather.return_value = []
+
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(mock_iata.call_count, 2)
+        self.assertEqual(mock_flights.call_args[0][:2], ("NYC", "PAR"))
+
+    @patch.dict('complex.STAGE_TIMEOUTS', {"flights": 0.05})
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.get_flight_offers')
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_stage_timeout(self, mock_chatgpt, mock_flights, mock_weather):
+        mock_chatgpt.return_value = make_chatgpt_response()
+        mock_flights.side_effect = lambda *args: time.sleep(0.2)
+
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+
+        self.assertEqual(response.status_code, 504)
+        self.assertIn("flights", response.json()["detail"])
+
+    @patch.dict('complex.STAGE_RETRIES', {"chatgpt": RetryPolicy(attempts=3, base_delay=0)})
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_chatgpt_failures_return_502(self, mock_chatgpt):
+        mock_chatgpt.side_effect = ConnectionError("OpenAI unavailable")
+
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(mock_chatgpt.call_count, 3)
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_reports_stage_timings(self, mock_chatgpt, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        untraced = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+        # A different request, so the traced one is not answered from the response cache
+        traced = self.client.post("/plan_trip", json={"user_input": "New York to Paris"}, headers={"X-Trace": "1"})
+
+        self.assertNotIn("Server-Timing", untraced.headers)
+        stages = [entry.split(";")[0] for entry in traced.headers["Server-Timing"].split(", ")]
+        self.assertEqual(stages[0], "chatgpt")
+        self.assertEqual(set(stages), {"chatgpt", "flights", "weather", "format_flights"})
+
+        metrics = self.client.get("/metrics")
+        self.assertEqual(metrics.status_code, 200)
+        self.assertIn('trip_planner_stage_duration_seconds_count{stage="flights"}', metrics.text)
+        self.assertIn('trip_planner_request_duration_seconds_count{path="/plan_trip",status="200"}', metrics.text)
+        self.assertIn('trip_planner_cache_hit_ratio{cache="extraction"}', metrics.text)
+
+    def test_request_metrics_label_unmatched_paths(self):
+        for path in ("/no/such/page", "/another-missing-page"):
+            self.assertEqual(self.client.get(path).status_code, 404)
+
+        metrics = self.client.get("/metrics").text
+        self.assertIn('trip_planner_request_duration_seconds_count{path="unmatched",status="404"}', metrics)
+        self.assertNotIn("/no/such/page", metrics)
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers')
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_flexible_dates_builds_price_calendar(self, mock_chatgpt, mock_flights, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+        mock_flights.side_effect = lambda *args: parse_offers(
+            [dict(SAMPLE_FLIGHTS[0], price={"grandTotal": "250.00", "currency": "EUR"})]
+        )
+
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris", "flex_days": 1})
+
+        self.assertEqual(response.status_code, 200)
+        calendar = response.json()["trip_plan"]["price_calendar"]
+        self.assertEqual(len(calendar["cells"]), 9)
+        self.assertEqual(calendar["cheapest"]["price"], 500.0)
+        # One round-trip search plus one one-way search per date in each direction
+        one_way = [call.args for call in mock_flights.call_args_list if call.args[3] is None]
+        self.assertEqual(mock_flights.call_count, 1 + 3 + 3)
+        self.assertEqual(len(one_way), 6)
+        self.assertEqual({args[:2] for args in one_way}, {("JFK", "CDG"), ("CDG", "JFK")})
+
+    @patch('complex.get_weather_async', return_value=["December 25th: clear sky, 5.00 °C"])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_serves_retries_from_response_cache(self, mock_chatgpt, mock_flights, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        first = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+        # Equivalent input on the same day is answered without re-running the pipeline
+        retry = self.client.post("/plan_trip", json={"user_input": "nyc to  paris!"})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(first.headers["Cache-Control"], "private, max-age=0")
+        self.assertEqual(mock_flights.call_count, 1)
+
+        # A different idempotency key is planned on its own
+        other = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"}, headers={"Idempotency-Key": "a"})
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(mock_flights.call_count, 2)
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_revalidates_with_etag(self, mock_chatgpt, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        first = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"})
+        etag = first.headers["ETag"]
+        not_modified = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"},
+                                        headers={"If-None-Match": f'"stale", {etag}'})
+        stale = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"},
+                                 headers={"If-None-Match": '"stale"'})
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(not_modified.headers["ETag"], etag)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.json(), first.json())
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_ignores_if_none_match_any(self, mock_chatgpt, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris"},
+                                    headers={"If-None-Match": "*"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("trip_plan", response.json())
+        self.assertIn("ETag", response.headers)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"a", "b"', '"b"'))
+        self.assertTrue(etag_matches('W/"b"', '"b"'))
+        self.assertFalse(etag_matches("*", '"b"'))
+        self.assertFalse(etag_matches(None, '"b"'))
+        self.assertFalse(etag_matches('"a"', '"b"'))
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_attaches_concurrent_retries(self, mock_chatgpt, mock_flights, *_):
+        async def slow_chatgpt(*args):
+            await asyncio.sleep(0.1)
+            return make_chatgpt_response()
+
+        mock_chatgpt.side_effect = slow_chatgpt
+
+        async def retries():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.post("/plan_trip", json={"user_input": "NYC to Paris"}) for _ in range(3)
+                ))
+
+        responses = asyncio.run(retries())
+
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertEqual(mock_chatgpt.call_count, 1)
+        self.assertEqual(mock_flights.call_count, 1)
+
+    def test_plan_trip_rejects_large_flex_window(self):
+        response = self.client.post("/plan_trip", json={"user_input": "NYC to Paris", "flex_days": 30})
+        self.assertEqual(response.status_code, 422)
+
+    @patch('complex.get_weather_async')
+    @patch('complex.format_flight_offer', return_value={"Departure": []})
+    @patch('complex.get_flight_offers')
+    @patch('services.extraction.get_chatgpt_response_async')
+    def test_plan_multi_city_runs_legs_concurrently(self, mock_chatgpt, mock_flights, _, mock_weather):
+        mock_chatgpt.return_value = make_multi_city_response()
+
+        def slow_flights(*args):
+            time.sleep(0.2)
+            return SAMPLE_OFFERS
+
+        async def slow_weather(city, *args):
+            await asyncio.sleep(0.2)
+            return [f"{city}: clear sky"]
+
+        mock_flights.side_effect = slow_flights
+        mock_weather.side_effect = slow_weather
+
+        started = time.perf_counter()
+        response = self.client.post("/plan_multi_city", json={"user_input": "NYC to Paris to Rome and back"})
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200)
+        trip_plan = response.json()["trip_plan"]
+        self.assertEqual([(leg["origin"], leg["destination"]) for leg in trip_plan["legs"]],
+                         [("New York", "Paris"), ("Paris", "Rome"), ("Rome", "New York")])
+        self.assertEqual(trip_plan["legs"][0]["flights"], {"Departure": []})
+        self.assertEqual([stay["city"] for stay in trip_plan["weather_forecast"]], ["Paris", "Rome"])
+        self.assertEqual(trip_plan["weather_forecast"][1]["forecast"], ["Rome: clear sky"])
+        # Legs are one-way searches
+        self.assertEqual(sorted(call.args[:2] + call.args[3:4] for call in mock_flights.call_args_list),
+                         [("NYC", "PAR", None), ("PAR", "ROM", None), ("ROM", "NYC", None)])
+        self.assertLess(elapsed, 0.45)
+
+    @patch('services.extraction.get_chatgpt_response_async')
+    def test_plan_multi_city_validates_leg_order(self, mock_chatgpt):
+        chatgpt_response = make_multi_city_response()
+        chatgpt_response["departure_dates"].reverse()
+        mock_chatgpt.return_value = chatgpt_response
+
+        response = self.client.post("/plan_multi_city", json={"user_input": "NYC to Paris to Rome and back"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Leg dates must be in travel order.")
+
+    @patch('services.flights.get_city_country_from_iata', return_value=(None, None))
+    @patch('complex.get_weather_async')
+    @patch('complex.get_flight_offers')
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_stream_emits_stages_as_they_complete(
+            self, mock_chatgpt, mock_flights, mock_weather, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        def slow_flights(*args):
+            time.sleep(0.2)
+            return SAMPLE_OFFERS
+
+        mock_flights.side_effect = slow_flights
+        mock_weather.return_value = ["December 25th: clear sky, 5.00 °C"]
+
+        response = self.client.post("/plan_trip/stream", json={"user_input": "NYC to Paris"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = parse_sse(response.text)
+        self.assertEqual([event for event, _ in events], ["description", "weather", "flights", "trip_plan"])
+        self.assertEqual(events[0][1]["destination"], "Paris")
+        self.assertEqual(events[1][1], ["December 25th: clear sky, 5.00 °C"])
+        trip_plan = events[-1][1]["trip_plan"]
+        self.assertEqual(trip_plan["description"], "Here is your trip plan to Paris.")
+        self.assertIn("Flight AF1", trip_plan["flights"]["Departure"][0])
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.get_flight_offers', return_value=[])
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trip_stream_reports_errors_as_events(self, mock_chatgpt, mock_flights, mock_weather):
+        mock_chatgpt.return_value = make_chatgpt_response()
+
+        response = self.client.post("/plan_trip/stream", json={"user_input": "NYC to Paris"})
+
+        events = parse_sse(response.text)
+        self.assertEqual(events[-1], ("error", {"status_code": 400, "detail": "No flights found."}))
+
+    @patch('complex.get_weather_async', return_value=["December 25th: clear sky, 5.00 °C"])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trips_streams_results_and_errors(self, mock_chatgpt, *_):
+        responses = {"NYC to Paris": make_chatgpt_response(), "Paris to NYC": {"destination": {"city": False}}}
+        mock_chatgpt.side_effect = lambda messages, *_: next(
+            response for user_input, response in responses.items() if user_input in messages[-1]["content"]
+        )
+
+        response = self.client.post("/plan_trips", json={"trips": [
+            {"user_input": "NYC to Paris"},
+            {"user_input": "Paris to NYC"},
+            {"user_input": "NYC to Paris"},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+        self.assertEqual([result["index"] for result in results], [0, 1, 2])
+        self.assertEqual(results[0]["trip_plan"]["description"], "Here is your trip plan to Paris.")
+        self.assertEqual(results[1]["error"], {"status_code": 400, "detail": "Destination is not a city."})
+        self.assertIn("trip_plan", results[2])
+        # The repeated request is answered from the extraction cache
+        self.assertEqual(mock_chatgpt.call_count, 2)
+
+    @patch('complex.get_weather_async', return_value=[])
+    @patch('complex.format_flight_offer', return_value={"Departure": [], "Return": []})
+    @patch('complex.get_flight_offers')
+    @patch('services.extraction.get_structured_response_async')
+    def test_plan_trips_bounds_upstream_concurrency(self, mock_chatgpt, mock_flights, *_):
+        mock_chatgpt.return_value = make_chatgpt_response()
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def tracked_flights(*args):
+            with lock:
+                in_flight.append(1)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.pop()
+            return SAMPLE_OFFERS
+
+        mock_flights.side_effect = tracked_flights
+
+        async def run_batch():
+            trip_requests = [TripRequest(user_input="NYC to Paris")] * 6
+            limits = {"chatgpt": 6, "iata": 6, "flights": 2, "weather": 6}
+            return [result async for result in plan_trips(trip_requests, concurrency=6, limits=limits)]
+
+        results = asyncio.run(run_batch())
+
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all("trip_plan" in result for result in results))
+        self.assertEqual(max(max_in_flight), 2)
+
+if __name__ == '__main__':
+    unittest.main()
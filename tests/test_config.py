@@ -0,0 +1,28 @@
+import os
+import unittest
+from unittest.mock import patch
+from services.config import MissingSettingError, require_setting
+from services.weather import fetch_forecast
+
+class TestConfigFunctions(unittest.TestCase):
+
+    @patch.dict(os.environ, {"TRIP_PLANNER_TEST_SETTING": "value"})
+    def test_require_setting(self):
+        self.assertEqual(require_setting("TRIP_PLANNER_TEST_SETTING"), "value")
+
+    @patch.dict(os.environ, {"TRIP_PLANNER_TEST_SETTING": ""})
+    def test_require_setting_missing(self):
+        with self.assertRaises(MissingSettingError) as context:
+            require_setting("TRIP_PLANNER_TEST_SETTING")
+        self.assertIn("TRIP_PLANNER_TEST_SETTING", str(context.exception))
+
+    @patch('services.weather.requests.get')
+    def test_api_keys_are_read_on_first_use(self, mock_get):
+        with patch.dict(os.environ):
+            os.environ.pop("OPENWEATHER_API_KEY", None)
+            with self.assertRaises(MissingSettingError):
+                fetch_forecast("Paris")
+        mock_get.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime
+from services.extraction import (
+    ExtractionCache,
+    TripExtraction,
+    build_trip_messages,
+    build_multi_city_prompt,
+    build_trip_prompt,
+    extract_multi_city_trip,
+    extract_trip,
+    extraction_cache,
+    multi_city_cache,
+    normalize_input
+)
+
+SAMPLE_EXTRACTION = {
+    "destination": {"name": "Paris", "city": True, "code": "PAR", "nearest": {"name": "Paris", "code": "PAR"}},
+    "origin": {"name": "New York", "city": True, "code": "NYC", "nearest": {"name": "New York", "code": "NYC"}},
+    "start_date": "2025-01-10",
+    "end_date": "2025-01-20",
+    "description": "Here is your trip plan to Paris from January 10th to January 20th."
+}
+
+class TestExtractionFunctions(unittest.TestCase):
+
+    def setUp(self):
+        extraction_cache.clear()
+
+    def test_build_trip_prompt_injects_date_context(self):
+        prompt = build_trip_prompt("NYC to Paris", 2025, 1)
+        self.assertIn("use '2025'", prompt)
+        self.assertIn("use '1'", prompt)
+        self.assertIn("NYC to Paris", prompt)
+
+    def test_build_trip_messages_keeps_instructions_fixed(self):
+        first = build_trip_messages("NYC to Paris", 2025, 1)
+        second = build_trip_messages("Rome to Oslo in March", 2026, 11)
+
+        # Only the user message varies, so the instructions form a cacheable prompt prefix
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(first[1]["content"], "Current date: 2025-01\nNYC to Paris")
+        self.assertEqual(TripExtraction.model_validate(SAMPLE_EXTRACTION).model_dump(), SAMPLE_EXTRACTION)
+
+    @patch('services.extraction.STRUCTURED_EXTRACTION', False)
+    @patch('services.extraction.get_structured_response')
+    @patch('services.extraction.get_chatgpt_response')
+    def test_extract_trip_free_form_fallback(self, mock_chatgpt, mock_structured):
+        mock_chatgpt.return_value = SAMPLE_EXTRACTION
+
+        self.assertEqual(extract_trip("NYC to Paris for ten days next month", datetime(2025, 1, 1)), SAMPLE_EXTRACTION)
+        self.assertIn("use '2025'", mock_chatgpt.call_args[0][0])
+        mock_structured.assert_not_called()
+
+    def test_normalize_input(self):
+        self.assertEqual(normalize_input("  NYC to Paris,  Jan 10-20! "), "nyc to paris jan 10-20")
+
+    @patch('services.extraction.get_structured_response')
+    def test_extract_trip_caches_normalized_input(self, mock_chatgpt):
+        mock_chatgpt.return_value = SAMPLE_EXTRACTION
+        now = datetime(2025, 1, 1)
+
+        first = extract_trip("NYC to Paris for ten days next month", now)
+        second = extract_trip("nyc to paris,  for ten days next month.", now)
+
+        self.assertEqual(first, SAMPLE_EXTRACTION)
+        self.assertEqual(second, SAMPLE_EXTRACTION)
+        self.assertEqual(mock_chatgpt.call_count, 1)
+
+        # Cached results are copies, so callers cannot corrupt the cache
+        second["description"] = "changed"
+        self.assertEqual(extract_trip("NYC to Paris for ten days next month", now), SAMPLE_EXTRACTION)
+
+    @patch('services.extraction.get_structured_response')
+    def test_extract_trip_keys_on_date_context(self, mock_chatgpt):
+        mock_chatgpt.return_value = SAMPLE_EXTRACTION
+
+        extract_trip("NYC to Paris for ten days next month", datetime(2025, 1, 1))
+        extract_trip("NYC to Paris for ten days next month", datetime(2025, 2, 1))
+
+        self.assertEqual(mock_chatgpt.call_count, 2)
+
+    @patch('services.extraction.get_chatgpt_response')
+    def test_extract_multi_city_trip_uses_its_own_prompt_and_cache(self, mock_chatgpt):
+        multi_city_cache.clear()
+        mock_chatgpt.return_value = {"stops": [], "departure_dates": [], "description": ""}
+        now = datetime(2025, 1, 1)
+
+        extract_multi_city_trip("NYC to Paris to Rome", now)
+        extract_multi_city_trip("nyc to paris to rome", now)
+
+        self.assertEqual(mock_chatgpt.call_count, 1)
+        self.assertIn('"stops"', mock_chatgpt.call_args[0][0])
+        self.assertIn("use '2025'", build_multi_city_prompt("NYC to Paris to Rome", 2025, 1))
+        self.assertIsNone(extraction_cache.get("NYC to Paris to Rome", 2025, 1))
+
+    def test_fuzzy_lookup_requires_same_numbers(self):
+        cache = ExtractionCache(fuzzy=True, threshold=0.85)
+        cache.set("New York to Paris, January 10 to 20", 2025, 1, SAMPLE_EXTRACTION)
+
+        self.assertEqual(cache.get("new york to paris january 10 to 20 please", 2025, 1), SAMPLE_EXTRACTION)
+        self.assertIsNone(cache.get("New York to Paris, January 11 to 20", 2025, 1))
+        self.assertEqual(cache.stats()["fuzzy_hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_fuzzy_lookup_never_matches_other_cities_or_months(self):
+        cache = ExtractionCache(fuzzy=True, threshold=0.5)
+        cache.set("I want to fly from New York to Rome from January 10 to 20", 2025, 1, SAMPLE_EXTRACTION)
+        cache.set("New York to Paris, March 10 to March 20", 2025, 1, SAMPLE_EXTRACTION)
+
+        self.assertIsNone(cache.get("I want to fly from New York to Nice from January 10 to 20", 2025, 1))
+        self.assertIsNone(cache.get("New York to Parma, March 10 to March 20", 2025, 1))
+        self.assertIsNone(cache.get("New York to Paris, May 10 to May 20", 2025, 1))
+        self.assertEqual(cache.get("please book New York to Paris on March 10 to March 20", 2025, 1),
+                         SAMPLE_EXTRACTION)
+        self.assertEqual(cache.stats()["fuzzy_hits"], 1)
+
+    def test_fuzzy_lookup_never_swaps_origin_and_destination(self):
+        cache = ExtractionCache(fuzzy=True, threshold=0.5)
+        cache.set("fly to Paris from New York Jan 10 to Jan 20", 2025, 1, SAMPLE_EXTRACTION)
+        cache.set("Rome to Nice on May 1, back on May 9", 2025, 1, SAMPLE_EXTRACTION)
+
+        self.assertIsNone(cache.get("fly from Paris to New York Jan 10 to Jan 20", 2025, 1))
+        self.assertIsNone(cache.get("Rome to Nice on May 1, on May 9", 2025, 1))
+        self.assertEqual(cache.get("please fly to Paris from New York Jan 10 to Jan 20", 2025, 1), SAMPLE_EXTRACTION)
+        self.assertEqual(cache.stats()["fuzzy_hits"], 1)
+
+    def test_fuzzy_lookup_disabled_by_default(self):
+        cache = ExtractionCache(fuzzy=False)
+        cache.set("New York to Paris, January 10 to 20", 2025, 1, SAMPLE_EXTRACTION)
+        self.assertIsNone(cache.get("new york to paris january 10 to 20 please", 2025, 1))
+
+    @patch('services.extraction.get_structured_response')
+    def test_extract_trip_fast_path_skips_llm(self, mock_chatgpt):
+        result = extract_trip("from New York to Paris from January 10th to January 20th", datetime(2025, 1, 1))
+
+        self.assertEqual(result["destination"]["code"], "PAR")
+        self.assertEqual(result["start_date"], "2025-01-10")
+        mock_chatgpt.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from datetime import datetime, timedelta, date
+from services.offers import FlightOffer, Itinerary, Segment
+from services.flex_search import build_price_calendar, date_window
+
+# One-way offer with a single direct segment of the given length in hours
+def make_one_way(price, hours, departure=datetime(2025, 1, 10, 8, 0), currency="EUR"):
+    segment = Segment("AF", "1", "JFK", "CDG", departure, departure + timedelta(hours=hours))
+    return FlightOffer("1", price, currency, (Itinerary((segment,), hours * 60),))
+
+class TestFlexSearchFunctions(unittest.TestCase):
+
+    def test_date_window(self):
+        center = datetime(2025, 1, 10)
+        self.assertEqual(date_window(center, 1), ["2025-01-09", "2025-01-10", "2025-01-11"])
+        self.assertEqual(date_window(center, 0), ["2025-01-10"])
+        self.assertEqual(date_window(center, 2, earliest=date(2025, 1, 10)),
+                         ["2025-01-10", "2025-01-11", "2025-01-12"])
+
+    def test_build_price_calendar(self):
+        outbound = {
+            "2025-01-09": [make_one_way(300.0, 9), make_one_way(350.0, 7)],
+            "2025-01-10": [make_one_way(200.0, 12)],
+            "2025-01-11": [],
+        }
+        inbound = {
+            "2025-01-10": [make_one_way(100.0, 8)],
+            "2025-01-20": [make_one_way(150.0, 8), make_one_way(None, 6)],
+        }
+
+        calendar = build_price_calendar(outbound, inbound)
+
+        pairs = [(cell["departure_date"], cell["return_date"]) for cell in calendar["cells"]]
+        self.assertEqual(pairs, [("2025-01-09", "2025-01-10"), ("2025-01-09", "2025-01-20"),
+                                 ("2025-01-10", "2025-01-10"), ("2025-01-10", "2025-01-20")])
+        self.assertEqual(calendar["cheapest"]["price"], 300.0)
+        self.assertEqual(calendar["cheapest"]["departure_date"], "2025-01-10")
+        self.assertEqual(calendar["shortest"]["duration_minutes"], (7 + 8) * 60)
+        self.assertEqual(calendar["shortest"]["departure_date"], "2025-01-09")
+
+    def test_build_price_calendar_keeps_price_and_duration_together(self):
+        outbound = {"2025-01-10": [make_one_way(200.0, 12), make_one_way(400.0, 7)]}
+        inbound = {"2025-01-20": [make_one_way(100.0, 8)]}
+
+        cell = build_price_calendar(outbound, inbound)["cells"][0]
+
+        # The cheapest fares take 20 hours; 15 hours costs the price of the faster flight
+        self.assertEqual(cell["cheapest"], {"price": 300.0, "currency": "EUR", "duration_minutes": 20 * 60})
+        self.assertEqual(cell["shortest"], {"price": 500.0, "currency": "EUR", "duration_minutes": 15 * 60})
+
+    def test_build_price_calendar_skips_mixed_currencies(self):
+        outbound = {"2025-01-10": [make_one_way(200.0, 12)]}
+        inbound = {"2025-01-20": [make_one_way(100.0, 8, currency="USD")]}
+
+        calendar = build_price_calendar(outbound, inbound)
+
+        self.assertEqual(calendar, {"cells": [], "cheapest": None, "shortest": None})
+
+    def test_build_price_calendar_without_offers(self):
+        calendar = build_price_calendar({"2025-01-10": []}, {"2025-01-20": []})
+        self.assertEqual(calendar, {"cells": [], "cheapest": None, "shortest": None})
+
+if __name__ == '__main__':
+    unittest.main()
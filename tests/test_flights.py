@@ -1,18 +1,50 @@
 import os
+import time
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 from fastapi import HTTPException
+from services.metrics import current_trace
+from services.rate_limit import BATCH, request_priority
 from services.flights import (
+    airport_cache,
+    flight_cache,
+    iata_code_cache,
     get_iata_code,
     get_city_country_from_iata,
     get_flights,
+    get_flight_offers,
     find_flight_with_smallest_segments,
-    format_flight_offer
+    format_flight_offer,
+    resolve_airports,
+    search_flight_offers
 )
 
+SAMPLE_OFFER = {
+    "id": "1",
+    "price": {"currency": "EUR", "total": "355.34", "grandTotal": "355.34"},
+    "itineraries": [
+        {"duration": "PT6H5M", "segments": [{
+            "carrierCode": "AA", "number": "100", "duration": "PT6H5M",
+            "departure": {"iataCode": "JFK", "at": "2024-12-25T10:00:00"},
+            "arrival": {"iataCode": "LAX", "at": "2024-12-25T13:05:00"}
+        }]},
+        {"duration": "PT5H30M", "segments": [{
+            "carrierCode": "AA", "number": "101", "duration": "PT5H30M",
+            "departure": {"iataCode": "LAX", "at": "2024-12-30T14:00:00"},
+            "arrival": {"iataCode": "JFK", "at": "2024-12-30T22:30:00"}
+        }]}
+    ]
+}
+
 class TestFlightFunctions(unittest.TestCase):
 
+    def setUp(self):
+        airport_cache.clear()
+        flight_cache.clear()
+        iata_code_cache.clear()
+
     @patch('services.flights.get_amadeus_client')
     def test_get_iata_code_success(self, mock_get_amadeus_client):
         # Mock Amadeus API response
@@ -40,6 +72,20 @@ class TestFlightFunctions(unittest.TestCase):
         with self.assertRaises(HTTPException):
             get_iata_code("Unknown City")
 
+    @patch('services.flights.get_amadeus_client')
+    def test_get_iata_code_uses_cache(self, mock_get_amadeus_client):
+        # Repeated lookups for the same city hit Amadeus once
+        mock_client = MagicMock()
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.result = {"data": [{"iataCode": "PAR"}]}
+        mock_client.reference_data.locations.get.return_value = mock_response
+        mock_get_amadeus_client.return_value = mock_client
+
+        self.assertEqual(get_iata_code("Paris"), "PAR")
+        self.assertEqual(get_iata_code(" paris"), "PAR")
+        self.assertEqual(mock_client.reference_data.locations.get.call_count, 1)
+
     @patch('services.flights.get_amadeus_client')
     def test_get_city_country_from_iata_success(self, mock_get_amadeus_client):
         # Mock response data
@@ -55,6 +101,35 @@ class TestFlightFunctions(unittest.TestCase):
         self.assertEqual(city, "New York")
         self.assertEqual(country, "US")
 
+    @patch('services.flights.get_amadeus_client')
+    def test_get_city_country_from_iata_uses_cache(self, mock_get_amadeus_client):
+        # The first lookup hits Amadeus, later lookups are served from the cache
+        mock_client = MagicMock()
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.result = {"data": [{"address": {"cityName": "PARIS", "countryCode": "FR"}}]}
+        mock_client.reference_data.locations.get.return_value = mock_response
+        mock_get_amadeus_client.return_value = mock_client
+
+        self.assertEqual(get_city_country_from_iata("CDG"), ("PARIS", "FR"))
+        self.assertEqual(get_city_country_from_iata("CDG"), ("PARIS", "FR"))
+        self.assertEqual(mock_client.reference_data.locations.get.call_count, 1)
+
+        # The on-disk store survives a cold in-process cache
+        airport_cache.memory.clear()
+        self.assertEqual(get_city_country_from_iata("CDG"), ("PARIS", "FR"))
+        self.assertEqual(mock_client.reference_data.locations.get.call_count, 1)
+
+    @patch('services.flights.get_amadeus_client')
+    def test_get_city_country_from_iata_does_not_cache_errors(self, mock_get_amadeus_client):
+        # Upstream failures are not remembered as missing airports
+        mock_client = MagicMock()
+        mock_client.reference_data.locations.get.side_effect = ConnectionError()
+        mock_get_amadeus_client.return_value = mock_client
+
+        self.assertEqual(get_city_country_from_iata("CDG"), (None, None))
+        self.assertIsNone(airport_cache.get("CDG"))
+
     @patch('services.flights.get_amadeus_client')
     def test_get_flights(self, mock_get_amadeus_client):
         # Mock flights response
@@ -68,6 +143,74 @@ class TestFlightFunctions(unittest.TestCase):
         flights = get_flights("JFK", "LAX", "2024-12-25", "2024-12-30")
         self.assertEqual(flights, [{"itineraries": "sample_itineraries"}])
 
+    @patch('services.flights.get_flights')
+    def test_search_flight_offers_consumes_the_raw_response(self, mock_get_flights):
+        raw_offers = [dict(SAMPLE_OFFER), dict(SAMPLE_OFFER, id="2")]
+        mock_get_flights.return_value = raw_offers
+
+        offers = search_flight_offers("JFK", "LAX", "2024-12-25", "2024-12-30")
+
+        self.assertEqual([offer.id for offer in offers], ["1", "2"])
+        # Raw dicts are dropped once parsed so they can be freed early
+        self.assertEqual(raw_offers, [])
+
+    @patch('services.flights.get_amadeus_client')
+    def test_get_flight_offers_parses_and_caches(self, mock_get_amadeus_client):
+        # Repeated searches for the same route and dates hit Amadeus once
+        mock_client = MagicMock()
+        mock_client.shopping.flight_offers_search.get.side_effect = lambda **kwargs: MagicMock(
+            result={"data": [dict(SAMPLE_OFFER)]}
+        )
+        mock_get_amadeus_client.return_value = mock_client
+        hits = flight_cache.stats()["hits"]
+
+        get_flight_offers("JFK", "LAX", "2024-12-25", "2024-12-30")
+        offers = get_flight_offers("jfk", "lax", "2024-12-25", "2024-12-30")
+        self.assertEqual(mock_client.shopping.flight_offers_search.get.call_count, 1)
+
+        offer = offers[0]
+        self.assertEqual(offer.price, 355.34)
+        self.assertEqual(offer.itineraries[0].duration, 6 * 60 + 5)
+        segment = offer.itineraries[0].segments[0]
+        self.assertEqual((segment.carrier_code, segment.number), ("AA", "100"))
+        self.assertEqual(segment.departure_at, datetime(2024, 12, 25, 10, 0))
+
+        # A different number of adults is a different search
+        get_flight_offers("JFK", "LAX", "2024-12-25", "2024-12-30", adults=2)
+        self.assertEqual(mock_client.shopping.flight_offers_search.get.call_count, 2)
+        self.assertEqual(flight_cache.stats()["hits"] - hits, 1)
+
+    @patch('services.flights.get_amadeus_client')
+    def test_get_flight_offers_single_flight(self, mock_get_amadeus_client):
+        # Concurrent identical searches share one upstream call
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_search(**kwargs):
+            started.set()
+            release.wait(1)
+            return MagicMock(result={"data": [dict(SAMPLE_OFFER)]})
+
+        mock_client = MagicMock()
+        mock_client.shopping.flight_offers_search.get.side_effect = slow_search
+        mock_get_amadeus_client.return_value = mock_client
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_flight_offers("JFK", "LAX", "2024-12-25", "2024-12-30")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(mock_client.shopping.flight_offers_search.get.call_count, 1)
+
     def test_find_flight_with_smallest_segments(self):
         # Sample flight offers
         flight_offers = [
@@ -111,5 +254,67 @@ class TestFlightFunctions(unittest.TestCase):
         self.assertIn("Flight AA100 departing on December 25", formatted_offer["Departure"][0])
         self.assertIn("Flight AA101 departing on December 30", formatted_offer["Return"][0])
 
+    @patch('services.flights.get_city_country_from_iata')
+    def test_format_flight_offer_resolves_each_airport_once(self, mock_city_country):
+        mock_city_country.side_effect = lambda code: {"JFK": ("NEW YORK", "US"), "LHR": ("LONDON", "GB"),
+                                                      "CDG": ("PARIS", "FR")}[code]
+
+        def segment(number, origin, destination, day):
+            return {"carrierCode": "BA", "number": number,
+                    "departure": {"iataCode": origin, "at": f"2024-12-{day}T10:00:00"},
+                    "arrival": {"iataCode": destination, "at": f"2024-12-{day}T18:00:00"}}
+
+        formatted_offer = format_flight_offer({
+            "Departure": [segment("1", "JFK", "LHR", 25), segment("2", "LHR", "CDG", 26)],
+            "Return": [segment("3", "CDG", "LHR", 30), segment("4", "LHR", "JFK", 30)],
+        })
+
+        # Eight airport slots, three distinct airports
+        self.assertEqual(sorted(call.args[0] for call in mock_city_country.call_args_list), ["CDG", "JFK", "LHR"])
+        self.assertIn("from LONDON, GB to PARIS, FR (LHR -> CDG)", formatted_offer["Departure"][1])
+        self.assertIn("from LONDON, GB to NEW YORK, US (LHR -> JFK)", formatted_offer["Return"][1])
+
+    @patch('services.flights.get_city_country_from_iata')
+    def test_resolve_airports_looks_up_misses_concurrently(self, mock_city_country):
+        airport_cache.memory.clear()
+        airport_cache.memory.set("JFK", ["NEW YORK", "US"])
+
+        def slow_lookup(code):
+            if code != "JFK":
+                time.sleep(0.1)
+            return ("CITY", code)
+        mock_city_country.side_effect = slow_lookup
+
+        started = time.perf_counter()
+        airports = resolve_airports(["JFK", "LHR", "CDG", "FCO", "LHR"])
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(list(airports), ["JFK", "LHR", "CDG", "FCO"])
+        self.assertEqual(airports["FCO"], ("CITY", "FCO"))
+        self.assertEqual(mock_city_country.call_count, 4)
+        self.assertLess(elapsed, 0.25)
+
+    @patch('services.flights.get_city_country_from_iata')
+    def test_resolve_airports_keeps_request_context(self, mock_city_country):
+        seen = []
+
+        def lookup(code):
+            seen.append((request_priority.get(), current_trace.get()))
+            return ("CITY", code)
+        mock_city_country.side_effect = lookup
+
+        spans = []
+        priority_token = request_priority.set(BATCH)
+        trace_token = current_trace.set(spans)
+        try:
+            resolve_airports(["LHR", "CDG", "FCO"])
+        finally:
+            current_trace.reset(trace_token)
+            request_priority.reset(priority_token)
+
+        # Lookups on the pool threads see the batch priority and record into the same trace
+        self.assertEqual(len(seen), 3)
+        self.assertTrue(all(priority == BATCH and trace is spans for priority, trace in seen))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from services.metrics import (
+    Counter,
+    Histogram,
+    current_trace,
+    register_cache,
+    registry,
+    render,
+    server_timing,
+    timed
+)
+from services.cache import TTLCache
+
+class TestMetricsFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.registered = list(registry)
+
+    def tearDown(self):
+        registry[:] = self.registered
+
+    def test_counter_and_histogram_render(self):
+        counter = Counter("test_calls_total", "Test calls.", ["outcome"])
+        histogram = Histogram("test_duration_seconds", "Test durations.", ["stage"], buckets=(0.1, 1, float("inf")))
+        counter.inc(outcome="ok")
+        counter.inc(2, outcome="ok")
+        histogram.observe(0.5, stage="flights")
+        histogram.observe(2, stage="flights")
+
+        text = render()
+
+        self.assertIn("# TYPE test_calls_total counter", text)
+        self.assertIn('test_calls_total{outcome="ok"} 3', text)
+        self.assertIn('test_duration_seconds_bucket{stage="flights",le="0.1"} 0', text)
+        self.assertIn('test_duration_seconds_bucket{stage="flights",le="1"} 1', text)
+        self.assertIn('test_duration_seconds_bucket{stage="flights",le="+Inf"} 2', text)
+        self.assertIn('test_duration_seconds_count{stage="flights"} 2', text)
+        self.assertEqual(histogram.count(stage="flights"), 2)
+
+    def test_register_cache_merges_families(self):
+        first, second = TTLCache(), TTLCache()
+        first.set("key", "value")
+        first.get("key")
+        second.get("missing")
+        register_cache("test_first", first)
+        register_cache("test_second", second)
+
+        text = render()
+
+        self.assertEqual(text.count("# TYPE trip_planner_cache_hits_total counter"), 1)
+        self.assertIn('trip_planner_cache_hits_total{cache="test_first"} 1', text)
+        self.assertIn('trip_planner_cache_misses_total{cache="test_second"} 1', text)
+
+    def test_timed_records_spans_only_when_traced(self):
+        histogram = Histogram("test_span_seconds", "Test spans.", ["stage"])
+        with timed(histogram, "untraced", stage="a"):
+            pass
+
+        spans = []
+        token = current_trace.set(spans)
+        try:
+            with timed(histogram, "flights", stage="b"):
+                pass
+        finally:
+            current_trace.reset(token)
+
+        self.assertEqual([span[0] for span in spans], ["flights"])
+        self.assertEqual(histogram.count(stage="a"), 1)
+        self.assertRegex(server_timing(spans), r"^flights;dur=\d+\.\d$")
+
+if __name__ == '__main__':
+    unittest.main()
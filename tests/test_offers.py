@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime
+from services.cache import dumps, loads
+from services.offers import (
+    FlightOffer, Segment, as_segment, pack_offers, parse_duration, parse_offers, unpack_offers
+)
+
+# Build a raw Amadeus offer with one segment per direction
+def make_raw_offer(offer_id, total="100.00"):
+    return {
+        "id": offer_id,
+        "price": {"currency": "EUR", "total": total, "grandTotal": total},
+        "travelerPricings": [{"fareDetailsBySegment": [{"cabin": "ECONOMY"}]}],
+        "itineraries": [
+            {"duration": "PT8H", "segments": [{
+                "carrierCode": "AF", "number": "7",
+                "departure": {"iataCode": "JFK", "at": "2025-01-10T18:00:00"},
+                "arrival": {"iataCode": "CDG", "at": "2025-01-11T08:00:00"}
+            }]},
+            {"duration": "PT9H", "segments": [{
+                "carrierCode": "AF", "number": "8",
+                "departure": {"iataCode": "CDG", "at": "2025-01-20T10:00:00"},
+                "arrival": {"iataCode": "JFK", "at": "2025-01-20T13:00:00"}
+            }]}
+        ]
+    }
+
+class TestOfferFunctions(unittest.TestCase):
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("PT7H25M"), 445)
+        self.assertEqual(parse_duration("PT45M"), 45)
+        self.assertEqual(parse_duration("PT2H"), 120)
+        self.assertIsNone(parse_duration(None))
+
+    def test_parse_offers_keeps_only_used_fields(self):
+        raw_offers = [make_raw_offer("1", "120.50"), make_raw_offer("2")]
+        offers = parse_offers(raw_offers)
+
+        # The caller's list is left alone
+        self.assertEqual([raw_offer["id"] for raw_offer in raw_offers], ["1", "2"])
+        self.assertEqual([offer.id for offer in offers], ["1", "2"])
+        self.assertIsInstance(offers[0], FlightOffer)
+        self.assertFalse(hasattr(offers[0], "__dict__"))
+        self.assertEqual(offers[0].price, 120.5)
+        self.assertEqual(offers[0].currency, "EUR")
+        self.assertEqual([itinerary.duration for itinerary in offers[0].itineraries], [480, 540])
+
+        segment = offers[0].itineraries[0].segments[0]
+        self.assertEqual(segment.departure_at, datetime(2025, 1, 10, 18, 0))
+        # Codes are interned, so every offer shares one string per airport
+        self.assertIs(segment.departure_iata, offers[1].itineraries[0].segments[0].departure_iata)
+
+    def test_as_segment_accepts_raw_and_compact(self):
+        segment = Segment("AF", "7", "JFK", "CDG", datetime(2025, 1, 10, 18, 0), None)
+        self.assertIs(as_segment(segment), segment)
+        raw = make_raw_offer("1")["itineraries"][0]["segments"][0]
+        self.assertEqual(as_segment(raw).arrival_iata, "CDG")
+    def test_pack_offers_round_trip(self):
+        offers = parse_offers([make_raw_offer("1", "120.50")])
+        unpacked = unpack_offers(loads(dumps(pack_offers(offers))))
+
+        self.assertEqual(repr(unpacked), repr(offers))
+        self.assertEqual([itinerary.duration for itinerary in unpacked[0].itineraries], [480, 540])
+        self.assertEqual(unpacked[0].itineraries[0].segments[0].arrival_at, datetime(2025, 1, 11, 8, 0))
+
+if __name__ == '__main__':
+    unittest.main()
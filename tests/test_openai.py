@@ -1,14 +1,35 @@
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import json
-from services.openai_helper import get_chatgpt_response
+from pydantic import BaseModel
+from services.metrics import llm_parse_failures, llm_tokens
+from services.openai_helper import (
+    get_chatgpt_response,
+    get_chatgpt_response_async,
+    get_structured_response,
+    reset_openai_client
+)
+
+class Answer(BaseModel):
+    key: str
+
+def make_parsed_completion(parsed, refusal=None, prompt_tokens=200, cached_tokens=128, completion_tokens=20):
+    message = MagicMock(parsed=parsed, refusal=refusal, content=parsed.model_dump_json() if parsed else None)
+    usage = MagicMock(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    usage.prompt_tokens_details.cached_tokens = cached_tokens
+    return MagicMock(choices=[MagicMock(message=message)], usage=usage)
 
 class TestChatGPTFunctions(unittest.TestCase):
 
-    @patch('services.openai_helper.OpenAI')
+    def setUp(self):
+        # The client is shared across calls; make each test build its own mock client
+        reset_openai_client()
+
+    @patch('openai.OpenAI')
     def test_get_chatgpt_response_successful_json(self, mock_openai):
         # Mock the OpenAI client response
-        mock_response = MagicMock()
+        mock_response = MagicMock(usage=None)
         mock_response.choices = [
             MagicMock(message=MagicMock(content='```json\n{"key": "value"}\n```'))
         ]
@@ -22,10 +43,10 @@ class TestChatGPTFunctions(unittest.TestCase):
         expected_result = {"key": "value"}
         self.assertEqual(result, expected_result)
 
-    @patch('services.openai_helper.OpenAI')
+    @patch('openai.OpenAI')
     def test_get_chatgpt_response_raw_json(self, mock_openai):
         # Mock the OpenAI client response with a plain JSON response
-        mock_response = MagicMock()
+        mock_response = MagicMock(usage=None)
         mock_response.choices = [
             MagicMock(message=MagicMock(content='{"key": "value"}'))
         ]
@@ -39,10 +60,10 @@ class TestChatGPTFunctions(unittest.TestCase):
         expected_result = {"key": "value"}
         self.assertEqual(result, expected_result)
 
-    @patch('services.openai_helper.OpenAI')
+    @patch('openai.OpenAI')
     def test_get_chatgpt_response_invalid_json(self, mock_openai):
         # Mock the OpenAI client response with malformed JSON
-        mock_response = MagicMock()
+        mock_response = MagicMock(usage=None)
         mock_response.choices = [
             MagicMock(message=MagicMock(content='```json\n{"key": "value"'))
         ]
@@ -53,10 +74,10 @@ class TestChatGPTFunctions(unittest.TestCase):
         with self.assertRaises(json.JSONDecodeError):
             get_chatgpt_response(prompt)
 
-    @patch('services.openai_helper.OpenAI')
+    @patch('openai.OpenAI')
     def test_get_chatgpt_response_non_json_content(self, mock_openai):
         # Mock the OpenAI client response with non-JSON content
-        mock_response = MagicMock()
+        mock_response = MagicMock(usage=None)
         mock_response.choices = [
             MagicMock(message=MagicMock(content="I'm not a JSON object."))
         ]
@@ -67,5 +88,66 @@ class TestChatGPTFunctions(unittest.TestCase):
         with self.assertRaises(json.JSONDecodeError):
             get_chatgpt_response(prompt)
 
+    @patch('openai.OpenAI')
+    def test_get_chatgpt_response_reuses_client(self, mock_openai):
+        mock_openai.return_value.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='{"key": "value"}'))], usage=None
+        )
+
+        get_chatgpt_response("Provide a JSON response")
+        get_chatgpt_response("Provide a JSON response")
+
+        mock_openai.assert_called_once()
+        self.assertEqual(mock_openai.call_args.kwargs["max_retries"], 0)
+
+    @patch('openai.AsyncOpenAI')
+    def test_get_chatgpt_response_async(self, mock_openai):
+        mock_openai.return_value.chat.completions.create = AsyncMock(return_value=MagicMock(
+            choices=[MagicMock(message=MagicMock(content='```json\n{"key": "value"}\n```'))], usage=None
+        ))
+
+        async def ask_twice():
+            return [await get_chatgpt_response_async("Provide a JSON response") for _ in range(2)]
+
+        self.assertEqual(asyncio.run(ask_twice()), [{"key": "value"}, {"key": "value"}])
+        # One client per event loop, sharing the pooled HTTP client
+        mock_openai.assert_called_once()
+        self.assertIsNotNone(mock_openai.call_args.kwargs["http_client"])
+
+    @patch('openai.OpenAI')
+    def test_get_structured_response_validates_and_reports_usage(self, mock_openai):
+        parse = mock_openai.return_value.beta.chat.completions.parse
+        parse.return_value = make_parsed_completion(Answer(key="value"))
+        prompts_before = llm_tokens.count(call="Answer", kind="prompt")
+
+        messages = [{"role": "user", "content": "Provide a JSON response"}]
+        self.assertEqual(get_structured_response(messages, Answer, 50), {"key": "value"})
+
+        self.assertIs(parse.call_args.kwargs["response_format"], Answer)
+        self.assertEqual(parse.call_args.kwargs["max_tokens"], 50)
+        self.assertEqual(llm_tokens.count(call="Answer", kind="prompt"), prompts_before + 1)
+
+    @patch('openai.OpenAI')
+    def test_get_structured_response_refusal(self, mock_openai):
+        mock_openai.return_value.beta.chat.completions.parse.return_value = make_parsed_completion(
+            None, refusal="I can't help with that."
+        )
+
+        with self.assertRaises(ValueError):
+            get_structured_response([{"role": "user", "content": "?"}], Answer, 50)
+
+    @patch('openai.OpenAI')
+    def test_get_structured_response_counts_parse_failures(self, mock_openai):
+        try:
+            Answer.model_validate({})
+        except Exception as exc:
+            validation_error = exc
+        mock_openai.return_value.beta.chat.completions.parse.side_effect = validation_error
+        failures_before = llm_parse_failures.value(call="Answer")
+
+        with self.assertRaises(type(validation_error)):
+            get_structured_response([{"role": "user", "content": "?"}], Answer, 50)
+        self.assertEqual(llm_parse_failures.value(call="Answer"), failures_before + 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime, timedelta
+from services.offers import FlightOffer, Itinerary, Segment
+from services.ranking import _pareto_indexes, best_offer, offer_criteria, rank_offers
+
+# Build an itinerary of back-to-back segments with the given layovers (hours) between them
+def make_itinerary(start, flight_hours, layover_hours=()):
+    segments = []
+    departure = start
+    for index, hours in enumerate(flight_hours):
+        arrival = departure + timedelta(hours=hours)
+        segments.append(Segment("AF", str(index), "AAA", "BBB", departure, arrival))
+        if index < len(layover_hours):
+            departure = arrival + timedelta(hours=layover_hours[index])
+    total = (segments[-1].arrival_at - segments[0].departure_at).total_seconds() / 60
+    return Itinerary(tuple(segments), int(total))
+
+def make_offer(offer_id, price, outbound, inbound):
+    return FlightOffer(offer_id, price, "EUR", (outbound, inbound))
+
+START = datetime(2025, 1, 10, 8, 0)
+RETURN = datetime(2025, 1, 20, 8, 0)
+
+class TestRankingFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.direct = make_offer("direct", 500.0, make_itinerary(START, [8]), make_itinerary(RETURN, [8]))
+        self.cheap = make_offer("cheap", 300.0, make_itinerary(START, [4, 4], [5]), make_itinerary(RETURN, [4, 4], [5]))
+        self.bad = make_offer("bad", 600.0, make_itinerary(START, [4, 4], [6]), make_itinerary(RETURN, [4, 4], [6]))
+
+    def test_offer_criteria(self):
+        self.assertEqual(offer_criteria(self.cheap), (300.0, 2 * 13 * 60, 2, 2 * 5 * 60))
+        self.assertEqual(offer_criteria(self.direct), (500.0, 2 * 8 * 60, 0, 0))
+
+    def test_rank_offers_scores_whole_offers(self):
+        offers = [self.cheap, self.bad, self.direct]
+        self.assertEqual(rank_offers(offers, k=3), [self.direct, self.cheap, self.bad])
+        self.assertEqual(rank_offers(offers, k=1, weights={"price": 1.0}), [self.cheap])
+        self.assertIs(best_offer(offers), self.direct)
+
+    def test_rank_offers_pareto_front(self):
+        # "bad" is dominated by "cheap" on every criterion
+        front = rank_offers([self.cheap, self.bad, self.direct], k=10, pareto=True)
+        self.assertEqual({offer.id for offer in front}, {"cheap", "direct"})
+
+    def test_pareto_indexes(self):
+        criteria = [
+            (300.0, 600, 1, 90),
+            (200.0, 700, 1, 60),
+            (200.0, 700, 1, 60),    # Equal offers do not dominate each other
+            (250.0, 500, 0, 0),
+            (150.0, 500, 0, 0),     # Dominates every earlier offer
+            (float("inf"), 400, 0, 0),
+        ]
+        self.assertEqual(_pareto_indexes(criteria), [4, 5])
+        self.assertEqual(_pareto_indexes(criteria[:4]), [1, 2, 3])
+
+    def test_rank_offers_handles_many_offers_and_missing_prices(self):
+        offers = [
+            make_offer(str(i), 1000.0 - i, make_itinerary(START, [8]), make_itinerary(RETURN, [8]))
+            for i in range(2000)
+        ]
+        offers.append(make_offer("unpriced", None, make_itinerary(START, [8]), make_itinerary(RETURN, [8])))
+
+        top = rank_offers(offers, k=3)
+        self.assertEqual([offer.id for offer in top], ["1999", "1998", "1997"])
+        self.assertEqual(rank_offers([], k=3), [])
+        self.assertIsNone(best_offer([]))
+
+if __name__ == '__main__':
+    unittest.main()
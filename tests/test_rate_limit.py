@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+import unittest
+from fastapi import HTTPException
+from services.metrics import upstream_calls
+from services.rate_limit import BATCH, INTERACTIVE, Governor, governed, governors, request_priority
+
+class TestGovernor(unittest.TestCase):
+
+    def test_token_bucket_limits_rate_after_burst(self):
+        governor = Governor("test", rate=20, burst=2, max_in_flight=10)
+
+        started = time.perf_counter()
+        for _ in range(4):
+            with governor.slot():
+                pass
+        elapsed = time.perf_counter() - started
+
+        # Two calls use the burst, the next two wait about 1/20 s each
+        self.assertGreater(elapsed, 0.08)
+        self.assertEqual(governor.stats()["admitted"], 4)
+
+    def test_bounds_calls_in_flight(self):
+        governor = Governor("test", rate=1000, burst=100, max_in_flight=2)
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def call():
+            with governor.slot():
+                with lock:
+                    in_flight.append(1)
+                    max_in_flight.append(len(in_flight))
+                time.sleep(0.05)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(max_in_flight), 2)
+
+    def test_admits_interactive_before_batch(self):
+        governor = Governor("test", rate=1000, burst=100, max_in_flight=1)
+        order = []
+        governor.acquire()
+
+        def call(name, priority):
+            with governor.slot(priority):
+                order.append(name)
+
+        batch = threading.Thread(target=call, args=("batch", BATCH))
+        batch.start()
+        while governor.stats()["queued"] < 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=call, args=("interactive", INTERACTIVE))
+        interactive.start()
+        while governor.stats()["queued"] < 2:
+            time.sleep(0.001)
+
+        governor.release()
+        batch.join()
+        interactive.join()
+
+        self.assertEqual(order, ["interactive", "batch"])
+
+    def test_sheds_immediately_when_deadline_cannot_be_met(self):
+        governor = Governor("test", rate=1, burst=1, max_in_flight=10, queue_timeout=0.1)
+        governor.acquire()
+
+        started = time.perf_counter()
+        with self.assertRaises(HTTPException) as context:
+            governor.acquire()
+
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn("Retry-After", context.exception.headers)
+        self.assertEqual(governor.stats()["shed"], 1)
+
+    def test_sheds_after_queue_deadline(self):
+        governor = Governor("test", rate=1000, burst=100, max_in_flight=1, queue_timeout=0.05)
+        governor.acquire()
+
+        with self.assertRaises(HTTPException) as context:
+            governor.acquire()
+
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(governor.stats()["queued"], 0)
+
+    def test_cancelled_async_waiter_does_not_keep_a_slot(self):
+        governor = Governor("test", rate=1000, burst=100, max_in_flight=1)
+        governor.acquire()
+
+        async def give_up():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(governor.acquire_async(), 0.1)
+
+        asyncio.run(give_up())
+        governor.release()
+
+        self.assertEqual(governor.stats()["in_flight"], 0)
+        self.assertEqual(governor.stats()["queued"], 0)
+        self.assertTrue(governor.try_acquire())
+
+    def test_idle_only_with_a_free_token_and_slot(self):
+        governor = Governor("test", rate=0.001, burst=1, max_in_flight=1)
+        self.assertTrue(governor.idle())
+        governor.acquire()
+        self.assertFalse(governor.idle())
+        governor.release()
+        # The slot is free again, but the only token is spent
+        self.assertFalse(governor.idle())
+
+    def test_async_waiters_wake_on_release_in_priority_order(self):
+        governor = Governor("test", rate=1000, burst=100, max_in_flight=1)
+        governor.acquire()
+        admitted = []
+
+        async def call(name, priority):
+            await governor.acquire_async(priority)
+            admitted.append(name)
+            governor.release()
+
+        async def queue_and_release():
+            tasks = [asyncio.ensure_future(call("batch", BATCH)), asyncio.ensure_future(call("interactive", INTERACTIVE))]
+            await asyncio.sleep(0.01)
+            # Released from another thread, as a sync call finishing in the threadpool would
+            threading.Timer(0.01, governor.release).start()
+            started = time.monotonic()
+            await asyncio.gather(*tasks)
+            return time.monotonic() - started
+
+        elapsed = asyncio.run(queue_and_release())
+
+        self.assertEqual(admitted, ["interactive", "batch"])
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(governor.stats()["in_flight"], 0)
+
+    def test_governed_uses_request_priority(self):
+        priorities = []
+        governor = governors["openai"]
+        original = governor.acquire
+        governor.acquire = lambda priority=None: priorities.append(request_priority.get()) or original(priority)
+        try:
+            func = governed("openai")(lambda value: value * 2)
+            token = request_priority.set(BATCH)
+            try:
+                self.assertEqual(func(21), 42)
+            finally:
+                request_priority.reset(token)
+        finally:
+            del governor.acquire
+
+        self.assertEqual(priorities, [BATCH])
+        self.assertEqual(upstream_calls.value(provider="openai", call="<lambda>", outcome="ok"), 1)
+
+    def test_governed_coroutine_waits_without_blocking_the_loop(self):
+        governor = governors["openweather"]
+        saved = governor.rate, governor.burst, governor.tokens
+        governor.rate, governor.burst, governor.tokens = 20, 1, 1.0
+
+        @governed("openweather")
+        async def fetch(value):
+            return value
+
+        async def fetch_twice():
+            ticks = []
+
+            async def tick():
+                while len(ticks) < 3:
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            results = await asyncio.gather(fetch(1), fetch(2), tick())
+            return results[:2], ticks
+
+        try:
+            results, ticks = asyncio.run(fetch_twice())
+        finally:
+            governor.rate, governor.burst, governor.tokens = saved
+
+        # The second call waits ~50ms for a token while the loop keeps running other tasks
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(len(ticks), 3)
+        self.assertEqual(upstream_calls.value(provider="openweather", call="fetch", outcome="ok"), 2)
+
+if __name__ == '__main__':
+    unittest.main()
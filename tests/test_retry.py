@@ -0,0 +1,87 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+from fastapi import HTTPException
+from services.retry import RetryPolicy, is_retryable
+from services.weather import WeatherAPIError
+
+class TestRetryFunctions(unittest.TestCase):
+
+    def test_is_retryable_classification(self):
+        # Transient failures are retried, client errors are not
+        self.assertTrue(is_retryable(json.JSONDecodeError("bad", "", 0)))
+        self.assertTrue(is_retryable(ConnectionError()))
+        self.assertTrue(is_retryable(WeatherAPIError("Failed", 503)))
+        self.assertTrue(is_retryable(WeatherAPIError("Failed", 429)))
+        self.assertFalse(is_retryable(WeatherAPIError("Failed", 404)))
+        self.assertFalse(is_retryable(HTTPException(status_code=404)))
+        self.assertFalse(is_retryable(ValueError("bad input")))
+
+    @patch('services.retry.asyncio.sleep', new_callable=AsyncMock)
+    def test_run_retries_until_success(self, mock_sleep):
+        func = MagicMock(side_effect=[ConnectionError(), ConnectionError(), "ok"])
+        policy = RetryPolicy(attempts=3, base_delay=1.0)
+
+        result = asyncio.run(policy.run(func, "arg"))
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(mock_sleep.await_count, 2)
+        func.assert_called_with("arg")
+
+    @patch('services.retry.asyncio.sleep', new_callable=AsyncMock)
+    def test_run_does_not_retry_non_retryable(self, mock_sleep):
+        func = MagicMock(side_effect=ValueError("bad input"))
+        policy = RetryPolicy(attempts=3)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(policy.run(func))
+        self.assertEqual(func.call_count, 1)
+        mock_sleep.assert_not_awaited()
+
+    @patch('services.retry.asyncio.sleep', new_callable=AsyncMock)
+    def test_run_raises_last_error_when_attempts_exhausted(self, mock_sleep):
+        func = MagicMock(side_effect=ConnectionError("down"))
+        policy = RetryPolicy(attempts=2)
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(policy.run(func))
+        self.assertEqual(func.call_count, 2)
+
+    @patch('services.retry.asyncio.sleep', new_callable=AsyncMock)
+    def test_run_respects_deadline_budget(self, mock_sleep):
+        func = MagicMock(side_effect=ConnectionError("down"))
+        policy = RetryPolicy(attempts=5, base_delay=10.0, max_delay=10.0, deadline=1.0)
+
+        # Backoff drawn at the cap would overrun the one-second budget
+        with patch('services.retry.random.uniform', return_value=10.0):
+            with self.assertRaises(ConnectionError):
+                asyncio.run(policy.run(func))
+        self.assertEqual(func.call_count, 1)
+        mock_sleep.assert_not_awaited()
+
+    def test_run_awaits_coroutine_functions(self):
+        func = AsyncMock(return_value="ok")
+        policy = RetryPolicy()
+
+        self.assertEqual(asyncio.run(policy.run(func, 1)), "ok")
+        func.assert_awaited_once_with(1)
+
+    @patch('services.retry.asyncio.sleep', new_callable=AsyncMock)
+    def test_run_honors_retry_after(self, mock_sleep):
+        rate_limited = ConnectionError()
+        rate_limited.response = MagicMock(headers={"Retry-After": "2"})
+        func = MagicMock(side_effect=[rate_limited, "ok"])
+        policy = RetryPolicy(attempts=2, base_delay=0.01)
+
+        self.assertEqual(asyncio.run(policy.run(func)), "ok")
+        mock_sleep.assert_awaited_once_with(2.0)
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=3.0)
+        for retry in range(1, 10):
+            self.assertLessEqual(policy.backoff(retry), 3.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from services.extraction import extraction_cache
+from services.flights import iata_code_cache
+from services.metrics import speculations
+from services.rate_limit import INTERACTIVE, governors, request_priority
+from services.offers import parse_offers
+from services.speculation import settle_speculation, start_speculation
+from services.weather import forecast_cache
+from complex import app
+
+# Extraction result for a New York to Paris trip next month
+def make_extraction(destination="Paris", destination_code="PAR"):
+    start_date = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    end_date = (datetime.now() + timedelta(days=35)).strftime("%Y-%m-%d")
+    return {
+        "destination": {"name": destination, "city": True, "code": destination_code,
+                        "nearest": {"name": destination, "code": destination_code}},
+        "origin": {"name": "New York", "city": True, "code": "NYC",
+                   "nearest": {"name": "New York", "code": "NYC"}},
+        "start_date": start_date,
+        "end_date": end_date,
+        "description": f"Here is your trip plan to {destination}."
+    }
+
+SAMPLE_OFFERS = parse_offers([{
+    "itineraries": [
+        {"segments": [{"carrierCode": "AF", "number": "1",
+                       "departure": {"iataCode": "JFK", "at": "2024-12-25T10:00:00"},
+                       "arrival": {"iataCode": "CDG", "at": "2024-12-25T22:00:00"}}]}
+    ]
+}])
+
+class TestSpeculation(unittest.TestCase):
+
+    def setUp(self):
+        enabled = patch('services.speculation.SPECULATIVE_PREFETCH', True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+        self.client = TestClient(app)
+        extraction_cache.clear()
+        forecast_cache.clear()
+        iata_code_cache.clear()
+
+    @patch('services.speculation.SPECULATIVE_PREFETCH', False)
+    def test_speculation_is_opt_in(self):
+        self.assertIsNone(start_speculation("a long weekend in Paris"))
+
+    def test_unknown_cities_are_skipped(self):
+        skipped = speculations.value(outcome="skipped")
+        self.assertIsNone(start_speculation("somewhere warm in the spring"))
+        self.assertEqual(speculations.value(outcome="skipped"), skipped + 1)
+
+    @patch('services.speculation.get_forecast_async')
+    def test_wrong_guess_is_cancelled(self, mock_forecast):
+        async def slow_forecast(destination):
+            await asyncio.sleep(1)
+        mock_forecast.side_effect = slow_forecast
+
+        async def speculate():
+            speculation = start_speculation("from New York to Paris, or maybe somewhere sunnier")
+            await asyncio.sleep(0)
+            settle_speculation(speculation, {"destination": "Lisbon", "origin": "New York"})
+            await asyncio.sleep(0)
+            return speculation
+
+        misses = speculations.value(outcome="miss")
+        speculation = asyncio.run(speculate())
+
+        self.assertEqual(speculation.destination.name, "Paris")
+        self.assertTrue(speculation.task.cancelled())
+        self.assertEqual(speculations.value(outcome="miss"), misses + 1)
+        # Codes of an unconfirmed guess are not cached
+        self.assertIsNone(speculation.codes)
+        self.assertIsNone(iata_code_cache.get("new york"))
+
+    @patch('services.speculation.get_forecast_async')
+    def test_confirmed_guess_fills_and_caches_codes(self, mock_forecast):
+        async def speculate():
+            speculation = start_speculation("from Boston to Paris next month")
+            trip = {"destination": "Paris", "origin": "New York", "destination_code": None, "origin_code": "NYC"}
+            settle_speculation(speculation, trip)
+            await speculation.codes
+            return trip
+
+        trip = asyncio.run(speculate())
+
+        self.assertEqual(trip["destination_code"], "PAR")
+        self.assertEqual(trip["origin_code"], "NYC")
+        self.assertEqual(iata_code_cache.get("paris"), "PAR")
+        # The origin guess disagreed with the extraction, so its code is not cached
+        self.assertIsNone(iata_code_cache.get("boston"))
+
+    @patch('services.flights.get_city_country_from_iata', return_value=(None, None))
+    @patch('complex.get_flight_offers', return_value=SAMPLE_OFFERS)
+    @patch('services.weather.fetch_forecast_async')
+    @patch('services.extraction.get_structured_response_async')
+    def test_forecast_downloads_while_the_llm_runs(self, mock_extraction, mock_fetch, *_):
+        async def slow_extraction(*args):
+            await asyncio.sleep(0.2)
+            return make_extraction()
+
+        priorities = []
+
+        async def slow_fetch(destination):
+            priorities.append(request_priority.get())
+            await asyncio.sleep(0.2)
+            return []
+
+        mock_extraction.side_effect = slow_extraction
+        mock_fetch.side_effect = slow_fetch
+        hits = speculations.value(outcome="hit")
+
+        started = time.perf_counter()
+        response = self.client.post("/plan_trip", json={"user_input": "Paris from NYC sometime next month"})
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200)
+        # The weather stage joined the speculative download instead of starting another
+        mock_fetch.assert_called_once_with("Paris")
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(speculations.value(outcome="hit"), hits + 1)
+        # The joined download ran at the interactive request's priority
+        self.assertEqual(priorities, [INTERACTIVE])
+
+    @patch('services.speculation.get_forecast_async')
+    def test_no_prefetch_when_openweather_is_busy(self, mock_forecast):
+        async def speculate():
+            speculation = start_speculation("a long weekend in Paris")
+            await speculation.task
+            return speculation
+
+        with patch.object(governors["openweather"], 'idle', return_value=False):
+            asyncio.run(speculate())
+
+        mock_forecast.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
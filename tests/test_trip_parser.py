@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime
+from services.gazetteer import find_cities, lookup_city
+from services.trip_parser import FastPathStats, format_day, guess_route, parse_trip
+
+NOW = datetime(2025, 1, 1)
+
+class TestTripParserFunctions(unittest.TestCase):
+
+    def test_parse_trip_templated_input(self):
+        result = parse_trip("I want to travel from New York to Paris from January 10th to January 20th.", NOW)
+        self.assertEqual(result, {
+            "destination": {"name": "Paris", "city": True, "code": "PAR",
+                            "nearest": {"name": "Paris", "code": "PAR"}},
+            "origin": {"name": "New York", "city": True, "code": "NYC",
+                       "nearest": {"name": "New York", "code": "NYC"}},
+            "start_date": "2025-01-10",
+            "end_date": "2025-01-20",
+            "description": "Here is your trip plan to Paris from January 10th to January 20th."
+        })
+
+    def test_parse_trip_date_variants(self):
+        cases = {
+            "NYC to Paris Jan 10-20": ("2025-01-10", "2025-01-20"),
+            "fly to Rome from London 3rd of March to 12 March 2026": ("2026-03-03", "2026-03-12"),
+            "Boston to Tokyo 2025-04-01 to 2025-04-09": ("2025-04-01", "2025-04-09"),
+            "from Berlin to Madrid December 28 to January 4": ("2025-12-28", "2026-01-04"),
+        }
+        for user_input, (start_date, end_date) in cases.items():
+            result = parse_trip(user_input, NOW)
+            self.assertIsNotNone(result, user_input)
+            self.assertEqual((result["start_date"], result["end_date"]), (start_date, end_date), user_input)
+
+    def test_parse_trip_assigns_roles_from_markers(self):
+        result = parse_trip("fly to Paris from New York January 10 to 20", NOW)
+        self.assertEqual(result["origin"]["code"], "NYC")
+        self.assertEqual(result["destination"]["code"], "PAR")
+
+    def test_guess_route_from_free_form_input(self):
+        self.assertEqual(guess_route("honeymoon to Rome from Boston, no dates yet"),
+                         (lookup_city("boston"), lookup_city("rome")))
+        self.assertEqual(guess_route("a long weekend in Lisbon"), (None, lookup_city("lisbon")))
+        self.assertEqual(guess_route("leaving Berlin soon"), (lookup_city("berlin"), None))
+        self.assertEqual(guess_route("somewhere warm"), (None, None))
+
+    def test_parse_trip_low_confidence_falls_back(self):
+        # Missing dates, unknown or extra cities and free-form requests go to the LLM
+        self.assertIsNone(parse_trip("NYC to Paris", NOW))
+        self.assertIsNone(parse_trip("from Boston to Springfield Jan 10-20", NOW))
+        self.assertIsNone(parse_trip("NYC to Paris via Rome Jan 10-20", NOW))
+        self.assertIsNone(parse_trip(
+            "NYC to Paris Jan 10-20 but only if it is cheap and my dog can come with me", NOW))
+        self.assertIsNone(parse_trip("NYC to Paris February 30 to March 2", NOW))
+        # An end date before the start in the same month is not read as next year's
+        self.assertIsNone(parse_trip("From Boston to Miami, March 3 to March 1", NOW))
+
+    def test_parse_trip_qualified_city_falls_back(self):
+        # A word next to a city may name another place with the same name
+        self.assertIsNone(parse_trip("from Paris, Texas to Rome from Nov 10 to Nov 20", NOW))
+        self.assertIsNone(parse_trip("from London Ontario to Paris from Nov 10 to Nov 20", NOW))
+        self.assertIsNone(parse_trip("from Rome Georgia to Miami from Nov 10 to Nov 20", NOW))
+        self.assertIsNone(parse_trip("from Boston to southern Rome from Nov 10 to Nov 20", NOW))
+        self.assertIsNotNone(parse_trip("from Rome to Miami from Nov 10 to Nov 20", NOW))
+
+    def test_format_day(self):
+        self.assertEqual(format_day(datetime(2025, 1, 1)), "January 1st")
+        self.assertEqual(format_day(datetime(2025, 1, 12)), "January 12th")
+        self.assertEqual(format_day(datetime(2025, 1, 22)), "January 22nd")
+
+    def test_fast_path_stats(self):
+        stats = FastPathStats()
+        stats.record(True)
+        stats.record(True)
+        stats.record(False)
+        self.assertEqual(stats.stats(), {"handled": 2, "fallback": 1, "handled_ratio": 2 / 3})
+
+    def test_gazetteer_lookup(self):
+        self.assertEqual(lookup_city("New  York City").code, "NYC")
+        self.assertEqual([city.code for city, _, _ in find_cities("Tel Aviv to Rome")], ["TLV", "ROM"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,32 @@
 import os
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from datetime import datetime
-from services.weather import get_weather
+from datetime import date
+from services.weather import (
+    DailyWeather,
+    aggregate_daily,
+    build_forecast,
+    forecast_cache,
+    get_daily_weather,
+    get_weather,
+    get_weather_async,
+    pack_forecast,
+    unpack_forecast
+)
+from services.cache import dumps, loads
+from benchmarks import fixtures
 
 class TestWeatherFunctions(unittest.TestCase):
 
+    def setUp(self):
+        forecast_cache.clear()
+        # The key is read on each fetch; requests.get is mocked, so any value will do
+        environment = patch.dict(os.environ, {"OPENWEATHER_API_KEY": "test"})
+        environment.start()
+        self.addCleanup(environment.stop)
+
     @patch('services.weather.requests.get')
     def test_get_weather_success(self, mock_get):
         # Mock successful OpenWeather API response
@@ -97,5 +118,134 @@ class TestWeatherFunctions(unittest.TestCase):
         ]
         self.assertEqual(result, expected_result)
 
+    @patch('services.weather.requests.get')
+    def test_get_weather_uses_cached_forecast(self, mock_get):
+        # Different date ranges for the same city reuse one downloaded forecast
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "list": [
+                {"dt_txt": "2024-12-25 12:00:00", "weather": [{"description": "clear sky"}], "main": {"temp": 5.0}},
+                {"dt_txt": "2024-12-26 12:00:00", "weather": [{"description": "rain"}], "main": {"temp": 4.0}},
+            ]
+        }
+        mock_get.return_value = mock_response
+
+        first = get_weather("Paris", datetime(2024, 12, 25), datetime(2024, 12, 25, 23, 59, 59))
+        second = get_weather(" paris ", datetime(2024, 12, 26), datetime(2024, 12, 26, 23, 59, 59))
+
+        self.assertEqual(first, ["December 25th: clear sky, 5.00 °C"])
+        self.assertEqual(second, ["December 26th: rain, 4.00 °C"])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('services.weather.requests.get')
+    def test_get_weather_api_error_not_cached(self, mock_get):
+        # A failed download is retried on the next call rather than cached
+        mock_response = MagicMock()
+        mock_response.status_code = 500
+        mock_get.return_value = mock_response
+
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                get_weather("Paris", datetime(2024, 12, 25), datetime(2024, 12, 26))
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('services.weather.requests.get')
+    def test_get_daily_weather_structured_stats(self, mock_get):
+        # Epoch timestamps, min/max temperatures and rain/snow volumes are aggregated per day
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "list": [
+                {"dt": 1735128000, "weather": [{"description": "light rain"}],
+                 "main": {"temp": 5.0, "temp_min": 4.0, "temp_max": 6.0}, "rain": {"3h": 0.5}},
+                {"dt": 1735138800, "weather": [{"description": "snow"}],
+                 "main": {"temp": 1.0, "temp_min": 0.5, "temp_max": 2.0}, "snow": {"3h": 1.5}},
+                {"dt": 1735149600, "weather": [{"description": "snow"}],
+                 "main": {"temp": 0.0, "temp_min": -1.0, "temp_max": 1.0}},
+            ]
+        }
+        mock_get.return_value = mock_response
+
+        result = get_daily_weather("Paris", datetime(2024, 12, 25), datetime(2024, 12, 25, 23, 59, 59))
+
+        self.assertEqual(result, [DailyWeather(date(2024, 12, 25), "snow", 2.0, -1.0, 6.0, 2.0)])
+
+    def test_aggregate_daily_many_forecasts(self):
+        paris = build_forecast([
+            {"dt_txt": "2024-12-25 12:00:00", "weather": [{"description": "clear sky"}], "main": {"temp": 5.0}},
+            {"dt_txt": "2024-12-26 12:00:00", "weather": [{"description": "rain"}], "main": {"temp": 4.0}},
+        ])
+        rome = build_forecast([
+            {"dt_txt": "2024-12-25 09:00:00", "weather": [{"description": "rain"}], "main": {"temp": 10.0}},
+            {"dt_txt": "2024-12-25 12:00:00", "weather": [{"description": "clear sky"}], "main": {"temp": 14.0}},
+        ])
+        empty = build_forecast([])
+
+        result = aggregate_daily([paris, rome, empty], datetime(2024, 12, 25), datetime(2024, 12, 26, 23, 59, 59))
+
+        self.assertEqual([(day.date.day, day.condition, day.temp_mean) for day in result[0]],
+                         [(25, "clear sky", 5.0), (26, "rain", 4.0)])
+        # Ties between conditions go to the one seen first that day
+        self.assertEqual([(day.date.day, day.condition, day.temp_mean) for day in result[1]],
+                         [(25, "rain", 12.0)])
+        self.assertEqual(result[2], [])
+
+    def test_aggregate_daily_scales_to_hundreds_of_forecasts(self):
+        start_date = "2024-12-25"
+        forecasts = [
+            build_forecast(fixtures.forecast(f"City {index}", start_date)["list"]) for index in range(300)
+        ]
+        start, end = datetime(2024, 12, 25), datetime(2024, 12, 29, 23, 59, 59)
+
+        # One pass over every forecast matches aggregating each on its own
+        self.assertEqual(
+            aggregate_daily(forecasts, start, end),
+            [aggregate_daily([forecast], start, end)[0] for forecast in forecasts]
+        )
+
+    def test_pack_forecast_round_trip(self):
+        forecast = build_forecast([
+            {"dt": 1735128000, "weather": [{"description": "clear sky"}], "main": {"temp": 5.0}, "rain": {"3h": 0.5}},
+            {"dt": 1735138800, "weather": [{"description": "rain"}], "main": {"temp": 4.0}},
+        ])
+        unpacked = unpack_forecast(loads(dumps(pack_forecast(forecast))))
+
+        start, end = datetime(2024, 12, 25), datetime(2024, 12, 25, 23, 59, 59)
+        self.assertEqual(aggregate_daily([unpacked], start, end), aggregate_daily([forecast], start, end))
+        self.assertEqual(unpacked.timestamps.dtype, forecast.timestamps.dtype)
+        self.assertEqual(unpacked.conditions, ["clear sky", "rain"])
+
+    @patch('services.weather.get_async_client')
+    def test_get_weather_async_coalesces_concurrent_fetches(self, mock_client):
+        mock_response = MagicMock(status_code=200, content=b"{}")
+        mock_response.json.return_value = {
+            "list": [
+                {"dt_txt": "2024-12-25 12:00:00", "weather": [{"description": "clear sky"}], "main": {"temp": 5.0}},
+            ]
+        }
+        mock_client.return_value.get = AsyncMock(return_value=mock_response)
+
+        async def concurrent_lookups():
+            return await asyncio.gather(*(
+                get_weather_async(city, datetime(2024, 12, 25), datetime(2024, 12, 25, 23, 59, 59))
+                for city in ("Paris", " paris ", "PARIS")
+            ))
+
+        results = asyncio.run(concurrent_lookups())
+
+        self.assertEqual(results, [["December 25th: clear sky, 5.00 °C"]] * 3)
+        mock_client.return_value.get.assert_called_once()
+        self.assertEqual(mock_client.return_value.get.call_args.kwargs["params"]["q"], "Paris")
+
+    @patch('services.weather.get_async_client')
+    def test_get_weather_async_api_error(self, mock_client):
+        mock_client.return_value.get = AsyncMock(return_value=MagicMock(status_code=401, content=b""))
+
+        with self.assertRaises(Exception) as context:
+            asyncio.run(get_weather_async("Paris", datetime(2024, 12, 25), datetime(2024, 12, 26)))
+        self.assertEqual(context.exception.status_code, 401)
+        self.assertEqual(len(forecast_cache), 0)
+
 if __name__ == '__main__':
     unittest.main()